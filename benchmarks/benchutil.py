@@ -0,0 +1,167 @@
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Shared helpers for the benchmarks in this directory. Importing this module
+makes the librecaptcha package in this repository importable and points it at
+the test server, so it must be imported before librecaptcha.
+"""
+
+from contextlib import contextmanager
+from typing import Optional
+import json
+import os
+import os.path
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.normpath(os.path.join(SCRIPT_DIR, os.pardir))
+SERVER_PATH = os.path.join(REPO_DIR, "test-server", "server.py")
+SERVER_PORT = 55476
+RESULTS_DIR = os.path.join(SCRIPT_DIR, "results")
+
+sys.path.insert(0, REPO_DIR)
+os.environ["LIBRECAPTCHA_USE_TEST_SERVER"] = "1"
+
+API_KEY = "test-api-key"
+SITE_URL = "http://localhost"
+USER_AGENT = "librecaptcha-benchmark"
+TIMEOUT = 30  # seconds
+
+# The test server accepts any solution, so these are its "known answers".
+# Dynamic replacement tiles are never selected; multicaptcha challenges use
+# the next list each round.
+DYNAMIC_SELECTIONS = [0, 4, 8]
+MULTICAPTCHA_SELECTIONS = [[0, 5, 10, 15], [1, 2], []]
+
+
+def server_running() -> bool:
+    try:
+        socket.create_connection(("localhost", SERVER_PORT), 1).close()
+    except OSError:
+        return False
+    return True
+
+
+@contextmanager
+def test_server(*args: str):
+    """Starts the test server with the given command-line arguments, unless
+    a server is already running.
+    """
+    if server_running():
+        yield
+        return
+
+    proc = subprocess.Popen(
+        [sys.executable, SERVER_PATH, "--quiet", *args],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + TIMEOUT
+        while not server_running():
+            if time.monotonic() > deadline:
+                raise RuntimeError("Test server did not start")
+            time.sleep(0.05)
+        yield
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def summarize(values):
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "mean": statistics.mean(values),
+        "p50": values[len(values) // 2],
+        "p95": values[min(len(values) - 1, round(len(values) * 0.95))],
+        "max": values[-1],
+    }
+
+
+def peak_rss() -> int:
+    """Returns the peak resident set size of this process in bytes."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kibibytes; macOS reports bytes.
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def current_rss() -> Optional[int]:
+    """Returns the current resident set size of this process in bytes, or
+    ``None`` on systems without ``/proc``.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * resource.getpagesize()
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True,
+        ).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save_results(name: str, results):
+    """Prints `results` and appends them to ``results/<name>.jsonl``, tagged
+    with the current commit, so runs can be compared across commits.
+    """
+    record = {
+        "benchmark": name,
+        "commit": git_commit(),
+        "time": time.time(),
+        "results": results,
+    }
+    json.dump(record, sys.stdout, indent=4)
+    print()
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    with open(os.path.join(RESULTS_DIR, name + ".jsonl"), "a") as f:
+        print(json.dumps(record), file=f)
+
+
+def parse_args(usage: str, flags=()):
+    """Handles the ``[<runs>]`` and ``-h | --help`` arguments shared by the
+    benchmark scripts, plus the given flags (e.g., ``"--http2"``). Returns
+    the number of runs and the set of flags that were passed.
+    """
+    args = sys.argv[1:]
+    if len(args) == 1 and args[0] in ["-h", "--help"]:
+        print(usage, end="")
+        sys.exit(0)
+    passed = {a for a in args if a in flags}
+    args = [a for a in args if a not in flags]
+    if len(args) > 1 or not all(a.isdigit() for a in args):
+        print(usage, end="", file=sys.stderr)
+        sys.exit(1)
+    return (int(args[0]) if args else 1, passed)
+
+
+def parse_runs(usage: str) -> int:
+    return parse_args(usage)[0]
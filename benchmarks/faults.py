@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+import benchutil
+from librecaptcha import cachedirs, recaptcha, retry
+from librecaptcha.metrics import PrometheusSink
+import solve
+
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from urllib.parse import urlparse
+import sys
+import tempfile
+import time
+
+USAGE = """\
+Usage:
+  faults.py [--http2] [<runs>]
+  faults.py -h | --help
+
+Obtains tokens from a test server that fails or truncates some of its
+responses to GET requests, which librecaptcha should retry, and reports how
+many solves succeeded and how many retries were needed. Each solve starts
+with an empty cache, so api.js and recaptcha__en.js are downloaded (and can
+fail) every time. Results are printed and appended to results/faults.jsonl.
+Exits with status 1 if any solve failed. With --http2, requests are sent over
+HTTP/2.
+
+This starts its own test server, so no other server may be running.
+"""
+
+# Faults are only injected into GET endpoints; a failed POST request can't be
+# retried and ends the solve.
+SERVER_ARGS = [
+    "--error-rate", "payload=0.25",
+    "--error-rate", "anchor=0.25",
+    "--error-rate", "api.js=0.25",
+    "--error-rate", "recaptcha__en.js=0.25",
+    "--truncate-rate", "payload=0.15",
+    "--truncate-rate", "recaptcha__en.js=0.25",
+    "--seed", "0",
+]
+
+# Retry quickly, but often enough that the chance of exhausting the attempts
+# is negligible at the fault rates above.
+RETRY = retry.RetryPolicy(attempts=8, base_delay=0.01, max_delay=0.1)
+
+
+def endpoint(url: str) -> str:
+    return urlparse(url).path.rsplit("/", 1)[-1]
+
+
+class CountingTransport:
+    """Counts the requests sent for each endpoint, including the downloads
+    of api.js and recaptcha__en.js, which aren't reported to `on_request`.
+    """
+    def __init__(self, transport, counts: Counter):
+        self.transport = transport
+        self.counts = counts
+
+    def request(self, method: str, url: str, **kwargs):
+        self.counts[endpoint(url)] += 1
+        return self.transport.request(method, url, **kwargs)
+
+    def stream(self, method: str, url: str, **kwargs):
+        self.counts[endpoint(url)] += 1
+        return self.transport.stream(method, url, **kwargs)
+
+    def close(self):
+        self.transport.close()
+
+
+@contextmanager
+def patch(obj, name: str, value):
+    old = getattr(obj, name)
+    setattr(obj, name, value)
+    try:
+        yield
+    finally:
+        setattr(obj, name, old)
+
+
+@contextmanager
+def empty_cache():
+    """Points librecaptcha's caches at a new, empty directory, and forgets
+    the strings loaded by earlier solves.
+    """
+    with ExitStack() as stack:
+        path = stack.enter_context(tempfile.TemporaryDirectory())
+        stack.enter_context(patch(
+            cachedirs, "get_layers", lambda: [cachedirs.Layer(path, False)],
+        ))
+        recaptcha.JS_STRINGS_CACHE.clear()
+        yield
+
+
+def solve_once(http2: bool, sink: PrometheusSink, attempts: Counter,
+               requests: Counter):
+    def on_request(event):
+        sink(event)
+        attempts[event.attempt] += 1
+
+    rc = recaptcha.ReCaptcha(
+        api_key=benchutil.API_KEY,
+        site_url=benchutil.SITE_URL,
+        user_agent=benchutil.USER_AGENT,
+        transport=CountingTransport(recaptcha.make_transport(http2), requests),
+        on_request=on_request,
+        retry=RETRY,
+    )
+    try:
+        result = rc.first_solver()
+        while not isinstance(result, str):
+            solver = {
+                recaptcha.DynamicSolver: solve.solve_dynamic,
+                recaptcha.MultiCaptchaSolver: solve.solve_multicaptcha,
+            }[type(result)]
+            result = rc.send_solution(solver(result, solve.Timings(), 0))
+    finally:
+        rc.transport.close()
+
+
+def main():
+    runs, flags = benchutil.parse_args(USAGE, ["--http2"])
+    http2 = "--http2" in flags
+    if benchutil.server_running():
+        print("Error: A test server is already running.", file=sys.stderr)
+        sys.exit(1)
+    recaptcha.DYNAMIC_SELECT_DELAY = 0
+
+    sink = PrometheusSink()
+    attempts = Counter()
+    requests = Counter()
+    failures = []
+    start = time.perf_counter()
+    with benchutil.test_server(*SERVER_ARGS):
+        for _ in range(runs):
+            try:
+                with empty_cache():
+                    solve_once(http2, sink, attempts, requests)
+            except Exception as e:
+                failures.append("{}: {}".format(type(e).__name__, e))
+
+    benchutil.save_results("faults", {
+        "runs": runs,
+        "http2": http2,
+        "succeeded": runs - len(failures),
+        "failures": failures,
+        "requests_by_attempt": dict(sorted(attempts.items())),
+        "retries_by_endpoint": dict(sink.retries),
+        # Includes retries. Without faults, each is requested once per run.
+        "script_requests": {
+            name: requests[name] for name in ["api.js", "recaptcha__en.js"]
+        },
+        "total_seconds": time.perf_counter() - start,
+    })
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+import benchutil
+from benchutil import DYNAMIC_SELECTIONS, MULTICAPTCHA_SELECTIONS
+from librecaptcha import gui, recaptcha
+from librecaptcha.recaptcha import ReCaptcha
+from gi.repository import Gtk
+
+import time
+import tracemalloc
+
+USAGE = """\
+Usage:
+  gui.py [<runs>]
+  gui.py -h | --help
+
+Solves challenges from the test server with the GTK GUI, using a scripted
+sequence of messages instead of user input, and reports timing and allocation
+statistics. Results are printed and appended to results/gui.jsonl. No GPU is
+needed, but GTK needs a display; run this under Xvfb or the Broadway backend:
+
+  xvfb-run ./benchmarks/gui.py
+  GDK_BACKEND=broadway ./benchmarks/gui.py
+
+The test server is started automatically if it isn't already running.
+"""
+
+TIMEOUT = benchutil.TIMEOUT
+
+
+def reset_peak():
+    # `tracemalloc.reset_peak()` requires Python 3.9. Restarting tracing also
+    # resets the peak, but forgets the allocations made before.
+    if hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+        return
+    tracemalloc.stop()
+    tracemalloc.start()
+
+
+class Recorder:
+    """Wraps `ImageGridChallengeDialog.update()` and `image_to_gdk_pixbuf()`
+    to record how long they take and how much memory they allocate.
+    """
+    def __init__(self, ui: gui.Gui):
+        self.update_times = []
+        self.update_allocs = []
+        self.pixbuf_times = []
+        self.frames = 0
+        self._wrap_update(ui.view)
+        self._wrap_pixbuf()
+
+        def on_after_paint(clock):
+            self.frames += 1
+        clock = ui.view.dialog.get_frame_clock()
+        clock.connect("after-paint", on_after_paint)
+
+    def _wrap_update(self, view):
+        update = view.update
+
+        def wrapper(pres):
+            reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            update(pres)
+            self.update_times.append(time.perf_counter() - start)
+            peak = tracemalloc.get_traced_memory()[1]
+            self.update_allocs.append(peak - before)
+        view.update = wrapper
+
+    def _wrap_pixbuf(self):
+        to_pixbuf = self._to_pixbuf = gui.image_to_gdk_pixbuf
+
+        def wrapper(image):
+            start = time.perf_counter()
+            result = to_pixbuf(image)
+            self.pixbuf_times.append(time.perf_counter() - start)
+            return result
+        gui.image_to_gdk_pixbuf = wrapper
+
+    def results(self):
+        gui.image_to_gdk_pixbuf = self._to_pixbuf
+        return {
+            "update_seconds": benchutil.summarize(self.update_times),
+            "update_alloc_bytes": benchutil.summarize(self.update_allocs),
+            "pixbuf_seconds": benchutil.summarize(self.pixbuf_times),
+            "frames": self.frames,
+        }
+
+
+def pump(predicate):
+    deadline = time.monotonic() + TIMEOUT
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise RuntimeError("Timed out waiting for the GUI")
+        if not Gtk.main_iteration_do(False):
+            time.sleep(0.001)
+    while Gtk.events_pending():
+        Gtk.main_iteration()
+
+
+def is_solver_state(state) -> bool:
+    return type(state) in gui.SOLVER_STATE_TYPES
+
+
+def wait_for(ui: gui.Gui, predicate):
+    """Pumps events until `predicate()` is true, re-raising errors from the
+    GUI's background requests.
+    """
+    def done():
+        if ui.error is not None:
+            raise ui.error
+        return predicate()
+    pump(done)
+
+
+def solve_dynamic(ui: gui.Gui):
+    for index in DYNAMIC_SELECTIONS:
+        ui.dispatch(gui.SelectTile(index=index))
+    pump(lambda: ui.state.num_waiting <= 0)
+
+
+def solve_multicaptcha(ui: gui.Gui, round: int):
+    selections = MULTICAPTCHA_SELECTIONS
+    for index in selections[min(round, len(selections) - 1)]:
+        ui.dispatch(gui.SelectTile(index=index))
+        pump(lambda: not ui.update_pending)
+
+
+def run_once():
+    ui = gui.Gui(ReCaptcha(
+        api_key=benchutil.API_KEY,
+        site_url=benchutil.SITE_URL,
+        user_agent=benchutil.USER_AGENT,
+    ))
+    gui.load_css()
+    recorder = Recorder(ui)
+
+    start = time.perf_counter()
+    ui.dispatch(gui.Start())
+    wait_for(ui, lambda: is_solver_state(ui.state))
+    multicaptcha_round = 0
+    while ui.token is None:
+        state = ui.state
+        if isinstance(state, gui.DynamicState):
+            solve_dynamic(ui)
+        else:
+            solve_multicaptcha(ui, multicaptcha_round)
+            multicaptcha_round += 1
+        ui.dispatch(gui.FinishChallenge())
+        wait_for(ui, lambda: ui.state is not state and (
+            ui.token is not None or is_solver_state(ui.state)
+        ))
+
+    results = recorder.results()
+    results["total_seconds"] = time.perf_counter() - start
+    ui.view.destroy()
+    while Gtk.events_pending():
+        Gtk.main_iteration()
+    return results
+
+
+def main():
+    runs = benchutil.parse_runs(USAGE)
+    # Replacement tiles normally appear after a delay that mimics the
+    # official client; it would only add idle time here.
+    recaptcha.DYNAMIC_SELECT_DELAY = 0
+    tracemalloc.start()
+    with benchutil.test_server():
+        results = [run_once() for _ in range(runs)]
+    benchutil.save_results("gui", {"runs": results})
+
+
+if __name__ == "__main__":
+    main()
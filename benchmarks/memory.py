@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+import benchutil
+from benchutil import DYNAMIC_SELECTIONS
+from librecaptcha import cli, recaptcha
+from librecaptcha.recaptcha import ReCaptcha
+
+from contextlib import ExitStack, contextmanager, redirect_stdout
+from typing import Optional
+import builtins
+import json
+import os
+import sys
+import tracemalloc
+
+USAGE = """\
+Usage:
+  memory.py [--gui] [--no-save] [--budget <MiB>] [<replacements>]
+  memory.py -h | --help
+
+Obtains a token from the test server through the CLI (or, with --gui, the
+GTK GUI, which needs a display), replacing tiles in the dynamic challenge
+<replacements> times (default: {replacements}) before finishing the solve.
+The CLI's prompts are answered automatically, and its images are encoded for
+the ``display`` command but not shown.
+
+Memory is sampled after a warm-up of {warmup} replacements and again once the
+token is obtained, while the GUI's pooled grids still exist. Two amounts are
+sampled: the current RSS, read from /proc where available, and the memory
+traced by tracemalloc, which doesn't include image data allocated by Pillow
+or GdkPixbuf. If either grew by more than <MiB> (default: {budget}), the
+budget is exceeded and this exits with status 1. The budget only applies to
+this benchmark; librecaptcha itself has no memory limit, but releases each
+image once it's superseded. Results are printed and, unless --no-save is
+passed, appended to results/memory.jsonl. tests/test_memory.py runs this
+with --no-save as a regression test.
+
+The test server is started automatically if it isn't already running.
+"""
+
+REPLACEMENTS = 200
+WARMUP = 20
+BUDGET = 4  # MiB
+MIB = 1024 * 1024
+
+USAGE = USAGE.format(replacements=REPLACEMENTS, warmup=WARMUP, budget=BUDGET)
+
+
+def usage_error():
+    print(USAGE, end="", file=sys.stderr)
+    sys.exit(1)
+
+
+def parse_args():
+    args = sys.argv[1:]
+    if args in (["-h"], ["--help"]):
+        print(USAGE, end="")
+        sys.exit(0)
+    use_gui = "--gui" in args
+    save = "--no-save" not in args
+    args = [a for a in args if a not in ("--gui", "--no-save")]
+    budget = BUDGET
+    if args[:1] == ["--budget"]:
+        try:
+            budget = float(args[1])
+        except (IndexError, ValueError):
+            usage_error()
+        args = args[2:]
+    if len(args) > 1 or not all(a.isdigit() for a in args):
+        usage_error()
+    replacements = int(args[0]) if args else REPLACEMENTS
+    if replacements <= WARMUP:
+        usage_error()
+    return (replacements, budget, use_gui, save)
+
+
+def sample():
+    return {
+        "rss_bytes": benchutil.current_rss(),
+        "traced_bytes": tracemalloc.get_traced_memory()[0],
+    }
+
+
+def make_recaptcha() -> ReCaptcha:
+    return ReCaptcha(
+        api_key=benchutil.API_KEY,
+        site_url=benchutil.SITE_URL,
+        user_agent=benchutil.USER_AGENT,
+    )
+
+
+@contextmanager
+def patch(obj, name: str, value):
+    old = getattr(obj, name)
+    setattr(obj, name, value)
+    try:
+        yield
+    finally:
+        setattr(obj, name, old)
+
+
+class NullProc:
+    """Stands in for a ``display`` process."""
+    def terminate(self):
+        pass
+
+
+def null_display(image):
+    cli.encode_image(image)
+    return NullProc()
+
+
+class CliInput:
+    """Answers the CLI's prompts: selects tiles in the first grid, accepts
+    replacement tiles until `replacements` have been requested, and skips
+    any later challenges.
+    """
+    def __init__(self, replacements: int, samples: dict):
+        self.replacements = replacements
+        self.samples = samples
+        self.requested = 0
+        self.shown = 0
+        self.first = True
+
+    def __call__(self, prompt=""):
+        if prompt.startswith("Should this image be selected?"):
+            self.shown += 1
+            if self.shown == WARMUP:
+                self.samples["warmup"] = sample()
+            if self.requested < self.replacements:
+                self.requested += 1
+                return "y"
+            return "n"
+        if not self.first:
+            return ""
+        self.first = False
+        self.requested += len(DYNAMIC_SELECTIONS)
+        return " ".join(str(i + 1) for i in DYNAMIC_SELECTIONS)
+
+
+def run_cli(replacements: int):
+    samples = {}
+    with ExitStack() as stack:
+        devnull = stack.enter_context(open(os.devnull, "w"))
+        stack.enter_context(redirect_stdout(devnull))
+        for obj, name, value in [
+            (builtins, "input", CliInput(replacements, samples)),
+            (cli, "try_display_cmd", null_display),
+            (cli, "print_temporary", lambda *args, **kwargs: None),
+            (cli, "clear_temporary", lambda *args, **kwargs: None),
+        ]:
+            stack.enter_context(patch(obj, name, value))
+        cli.Cli(make_recaptcha()).run()
+    samples["final"] = sample()
+    return samples
+
+
+def run_gui(replacements: int):
+    import gui as gui_benchmark  # benchmarks/gui.py, which imports GTK
+    from gi.repository import Gtk
+    from librecaptcha import gui
+    is_solver_state = gui_benchmark.is_solver_state
+    wait_for = gui_benchmark.wait_for
+
+    samples = {}
+    ui = gui.Gui(make_recaptcha())
+    gui.load_css()
+    ui.dispatch(gui.Start())
+    wait_for(ui, lambda: is_solver_state(ui.state))
+    if type(ui.state) is not gui.DynamicState:
+        raise RuntimeError("Expected a dynamic challenge")
+
+    count = ui.state.challenge.dimensions.count
+    for i in range(replacements):
+        ui.dispatch(gui.SelectTile(index=i % count))
+        wait_for(ui, lambda: (
+            ui.state.num_waiting <= 0 and not ui.update_pending
+        ))
+        if i + 1 == WARMUP:
+            samples["warmup"] = sample()
+
+    multicaptcha_round = 0
+    while ui.token is None:
+        state = ui.state
+        if isinstance(state, gui.MultiCaptchaState):
+            gui_benchmark.solve_multicaptcha(ui, multicaptcha_round)
+            multicaptcha_round += 1
+        ui.dispatch(gui.FinishChallenge())
+        wait_for(ui, lambda: ui.state is not state and (
+            ui.token is not None or is_solver_state(ui.state)
+        ))
+    wait_for(ui, lambda: not ui.update_pending)
+    samples["final"] = sample()
+
+    ui.view.destroy()
+    while Gtk.events_pending():
+        Gtk.main_iteration()
+    return samples
+
+
+def growth_mib(samples: dict, key: str) -> Optional[float]:
+    before = samples["warmup"][key]
+    after = samples["final"][key]
+    if before is None or after is None:
+        return None
+    return (after - before) / MIB
+
+
+def main():
+    replacements, budget, use_gui, save = parse_args()
+    recaptcha.DYNAMIC_SELECT_DELAY = 0
+    tracemalloc.start()
+    with benchutil.test_server():
+        samples = (run_gui if use_gui else run_cli)(replacements)
+
+    growth = {
+        "rss": growth_mib(samples, "rss_bytes"),
+        "traced": growth_mib(samples, "traced_bytes"),
+    }
+    labels = {"rss": "RSS", "traced": "Traced memory"}
+    results = {
+        "ui": "gui" if use_gui else "cli",
+        "replacements": replacements,
+        "samples": samples,
+        "growth_mib": growth,
+        "budget_mib": budget,
+    }
+    if save:
+        benchutil.save_results("memory", results)
+    else:
+        json.dump(results, sys.stdout, indent=4)
+        print()
+    exceeded = False
+    for name, value in growth.items():
+        if value is not None and value > budget:
+            print("{} grew by {:.1f} MiB; the budget is {} MiB.".format(
+                labels[name], value, budget,
+            ), file=sys.stderr)
+            exceeded = True
+    if exceeded:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
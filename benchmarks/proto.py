@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+import benchutil
+from librecaptcha import proto
+
+import timeit
+
+USAGE = """\
+Usage:
+  proto.py [<runs>]
+  proto.py -h | --help
+
+Measures how long it takes to encode and decode "reload" messages with
+librecaptcha.proto, compared with a naive encoder that appends one byte at a
+time (the implementation librecaptcha used before). Results are printed and
+appended to results/proto.jsonl.
+"""
+
+CALLS_PER_RUN = 20000
+
+# Similar in size to real values.
+MESSAGE = {
+    "rc_version": "qljbK_DTcvY1PzbR7IG69z1r",
+    "token": "03AGdBq2" + "x" * 600,
+    "reason": "fi",
+    "api_key": "6Le-wvkSAAAAAPBMRTvw0Q4Muexq9bi0DJwx_mJ-",
+}
+
+
+def naive_varint_encode(n: int, out: bytearray):
+    while True:
+        b = n & 127
+        n >>= 7
+        if n > 0:
+            out.append(b | 128)
+        else:
+            out.append(b)
+            break
+
+
+def naive_encode(rc_version, token, reason, api_key) -> bytes:
+    result = bytearray()
+    for num, value in [
+        (1, rc_version.encode()),
+        (2, token.encode()),
+        (6, reason.encode()),
+        (14, api_key.encode()),
+    ]:
+        naive_varint_encode((num << 3) | 2, result)
+        naive_varint_encode(len(value), result)
+        result += value
+    return bytes(result)
+
+
+def measure(func, runs: int):
+    times = timeit.repeat(func, number=CALLS_PER_RUN, repeat=runs)
+    return benchutil.summarize([t / CALLS_PER_RUN for t in times])
+
+
+def main():
+    runs = benchutil.parse_runs(USAGE)
+    encoded = proto.RELOAD.encode(**MESSAGE)
+    if encoded != naive_encode(**MESSAGE):
+        raise RuntimeError("Encoders disagree")
+    if proto.RELOAD.decode(encoded) != MESSAGE:
+        raise RuntimeError("Decoded message differs")
+
+    benchutil.save_results("proto", {
+        "message_bytes": len(encoded),
+        "naive_encode_seconds": measure(
+            lambda: naive_encode(**MESSAGE), runs,
+        ),
+        "encode_seconds": measure(
+            lambda: proto.RELOAD.encode(**MESSAGE), runs,
+        ),
+        "decode_seconds": measure(
+            lambda: proto.RELOAD.decode(encoded), runs,
+        ),
+        "varint_naive_seconds": measure(
+            lambda: naive_varint_encode(300, bytearray()), runs,
+        ),
+        "varint_seconds": measure(lambda: proto.encode_varint(300), runs),
+    })
+
+
+if __name__ == "__main__":
+    main()
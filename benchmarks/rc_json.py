@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+import benchutil
+from librecaptcha import recaptcha
+
+import base64
+import json
+import random
+import timeit
+
+USAGE = """\
+Usage:
+  rc_json.py [<runs>]
+  rc_json.py -h | --help
+
+Measures how long it takes to parse synthetic "rresp", "uvresp", and "dresp"
+responses shaped like the ones reCAPTCHA sends, with large pmeta and trailing
+fields, using the old parser (strip the prefix, then json.loads()) and
+load_rc_json() with and without an early stop. Results are printed and
+appended to results/rc_json.jsonl.
+"""
+
+CALLS_PER_RUN = 200
+META_COUNT = 40
+
+
+def make_meta(rng: random.Random, i: int):
+    return [
+        "/m/{:05x}".format(rng.getrandbits(20)), None, 1234,
+        rng.choice([3, 4]), rng.choice([3, 4]), None,
+        "object {}".format(i), [rng.randrange(16) for _ in range(4)],
+    ]
+
+
+def make_blob(rng: random.Random, size: int) -> str:
+    return base64.b64encode(rng.getrandbits(size * 8).to_bytes(
+        size, "little",
+    )).decode()
+
+
+def make_rresp(rng: random.Random):
+    pmeta = ["pmeta", None, None, None, None, [
+        [make_meta(rng, i) for i in range(META_COUNT)],
+        [[rng.randrange(16) for _ in range(16)] for _ in range(META_COUNT)],
+    ]]
+    return [
+        "rresp", make_blob(rng, 600), None, 120, pmeta, "multicaptcha", None,
+        [make_blob(rng, 32), make_blob(rng, 32)], None, make_blob(rng, 400),
+        None, None, make_blob(rng, 20000), [make_blob(rng, 4000)] * 4,
+    ]
+
+
+def make_responses(rng: random.Random):
+    rresp = make_rresp(rng)
+    uvresp = [
+        "uvresp", make_blob(rng, 600), 1, 120, None, None, None, rresp,
+        None, make_blob(rng, 8000),
+    ]
+    dresp = [
+        "dresp", make_blob(rng, 600),
+        ["/m/{:05x}".format(rng.getrandbits(20))], None, [],
+        make_blob(rng, 400), make_blob(rng, 8000),
+    ]
+    return {
+        name: (")]}'\n" + json.dumps(value)).encode()
+        for name, value in [
+            ("rresp", rresp), ("uvresp", uvresp), ("dresp", dresp),
+        ]
+    }
+
+
+def load_baseline(data: bytes):
+    return json.loads(data.decode().split("\n", 1)[1])
+
+
+PARSERS = {
+    "baseline": lambda data, max_index: load_baseline(data),
+    "full": lambda data, max_index: recaptcha.load_rc_json(data),
+    "early_stop": lambda data, max_index: recaptcha.load_rc_json(
+        data, max_index=max_index,
+    ),
+}
+
+MAX_INDICES = {
+    "rresp": recaptcha.RRESP_MAX_INDEX,
+    "uvresp": None,
+    "dresp": recaptcha.DRESP_MAX_INDEX,
+}
+
+
+def check(responses):
+    for name, data in responses.items():
+        expected = load_baseline(data)
+        for parser in PARSERS.values():
+            result = parser(data, MAX_INDICES[name])
+            if result != expected[:len(result)]:
+                raise RuntimeError("Parsers disagree on " + name)
+
+
+def main():
+    runs = benchutil.parse_runs(USAGE)
+    responses = make_responses(random.Random(0))
+    check(responses)
+
+    results = {}
+    for name, data in responses.items():
+        results[name] = {"bytes": len(data)}
+        for parser_name, parser in PARSERS.items():
+            if parser_name == "early_stop" and MAX_INDICES[name] is None:
+                continue
+            times = timeit.repeat(
+                lambda: parser(data, MAX_INDICES[name]),
+                number=CALLS_PER_RUN, repeat=runs,
+            )
+            results[name][parser_name + "_seconds"] = benchutil.summarize(
+                [t / CALLS_PER_RUN for t in times],
+            )
+    benchutil.save_results("rc_json", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+import benchutil
+from benchutil import DYNAMIC_SELECTIONS, MULTICAPTCHA_SELECTIONS
+from librecaptcha import recaptcha
+
+import subprocess
+import sys
+import time
+
+USAGE = """\
+Usage:
+  solve.py [--http2] [<runs>]
+  solve.py -h | --help
+
+Obtains tokens from the test server with a scripted solver instead of user
+input and reports the time to the first challenge, per-tile replacement
+latency, total solve time, peak RSS, and import time. Results are printed and
+appended to results/solve.jsonl. With --http2, requests are sent over HTTP/2
+(this requires httpx and h2).
+
+The test server is started automatically if it isn't already running.
+"""
+
+IMPORT_RUNS = 5
+IMPORT_CODE = """\
+import sys, time
+sys.path.insert(0, sys.argv[1])
+start = time.perf_counter()
+import librecaptcha
+print(time.perf_counter() - start)
+"""
+
+
+class Timings:
+    def __init__(self):
+        self.first_challenge = None
+        self.replacements = []
+        self.total = None
+
+
+def solve_dynamic(solver, timings: Timings, start: float):
+    solver.get_challenge()
+    if timings.first_challenge is None:
+        timings.first_challenge = time.perf_counter() - start
+    for index in DYNAMIC_SELECTIONS:
+        tile_start = time.perf_counter()
+        solver.select_tile(index)
+        timings.replacements.append(time.perf_counter() - tile_start)
+    return solver.finish()
+
+
+def solve_multicaptcha(solver, timings: Timings, start: float):
+    result = solver.first_challenge()
+    if timings.first_challenge is None:
+        timings.first_challenge = time.perf_counter() - start
+    selections = iter(MULTICAPTCHA_SELECTIONS)
+    while not isinstance(result, recaptcha.Solution):
+        result = solver.select_indices(next(selections, []))
+    return result
+
+
+def solve_once(http2: bool) -> Timings:
+    timings = Timings()
+    start = time.perf_counter()
+    rc = recaptcha.ReCaptcha(
+        api_key=benchutil.API_KEY,
+        site_url=benchutil.SITE_URL,
+        user_agent=benchutil.USER_AGENT,
+        transport=recaptcha.make_transport(http2),
+    )
+    result = rc.first_solver()
+    while not isinstance(result, str):
+        solve = {
+            recaptcha.DynamicSolver: solve_dynamic,
+            recaptcha.MultiCaptchaSolver: solve_multicaptcha,
+        }[type(result)]
+        result = rc.send_solution(solve(result, timings, start))
+    timings.total = time.perf_counter() - start
+    rc.transport.close()
+    return timings
+
+
+def import_time() -> float:
+    times = []
+    for _ in range(IMPORT_RUNS):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_CODE, benchutil.REPO_DIR],
+            stdout=subprocess.PIPE, check=True,
+        ).stdout
+        times.append(float(output))
+    return min(times)
+
+
+def main():
+    runs, flags = benchutil.parse_args(USAGE, ["--http2"])
+    http2 = "--http2" in flags
+    # Replacement tiles normally become available after a delay that mimics
+    # the official client; the scripted solver doesn't wait for it anyway.
+    recaptcha.DYNAMIC_SELECT_DELAY = 0
+    with benchutil.test_server():
+        all_timings = [solve_once(http2) for _ in range(runs)]
+
+    benchutil.save_results("solve", {
+        "runs": runs,
+        "http2": http2,
+        "first_challenge_seconds": benchutil.summarize(
+            [t.first_challenge for t in all_timings],
+        ),
+        "replacement_seconds": benchutil.summarize(
+            [r for t in all_timings for r in t.replacements],
+        ),
+        "total_seconds": benchutil.summarize(
+            [t.total for t in all_timings],
+        ),
+        "peak_rss_bytes": benchutil.peak_rss(),
+        "import_seconds": import_time(),
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+import benchutil
+from librecaptcha import stringtable
+from librecaptcha.recaptcha import find_goal_text
+
+import os.path
+import tempfile
+import timeit
+
+USAGE = """\
+Usage:
+  strings.py [<runs>]
+  strings.py -h | --help
+
+Measures how long it takes to load a table of strings similar in size to
+the one extracted from recaptcha__en.js and look up a challenge objective in
+it, with the binary (mmap) format and the JSON format. Results are printed
+and appended to results/strings.jsonl.
+"""
+
+CALLS_PER_RUN = 20
+STRING_COUNT = 12000
+VERSION = "0.1.0/test-version"
+GOAL_ID = "/m/goal"
+
+
+def make_strings():
+    strings = ["string {} {}".format(i, "x" * (i % 40)) for i in range(
+        STRING_COUNT,
+    )]
+    # The objective is near the end, as a worst case for a linear search.
+    index = STRING_COUNT - 100
+    strings[index:index + 2] = [GOAL_ID, "Select all images with goals"]
+    return strings
+
+
+def load_and_find(path: str):
+    strings = stringtable.load(path, VERSION)
+    if find_goal_text(strings, GOAL_ID) is None:
+        raise RuntimeError("Objective not found")
+    if isinstance(strings, stringtable.StringTable):
+        strings.close()
+
+
+def measure(func, runs: int):
+    times = timeit.repeat(func, number=CALLS_PER_RUN, repeat=runs)
+    return benchutil.summarize([t / CALLS_PER_RUN for t in times])
+
+
+def main():
+    runs = benchutil.parse_runs(USAGE)
+    strings = make_strings()
+    with tempfile.TemporaryDirectory() as directory:
+        results = {"strings": len(strings)}
+        for format in [stringtable.FORMAT_BINARY, stringtable.FORMAT_JSON]:
+            path = os.path.join(directory, format)
+            stringtable.save(path, VERSION, strings, format)
+            if list(stringtable.load(path, VERSION)) != strings:
+                raise RuntimeError("Strings differ after loading")
+            results["{}_bytes".format(format)] = os.path.getsize(path)
+            results["{}_seconds".format(format)] = measure(
+                lambda: load_and_find(path), runs,
+            )
+    benchutil.save_results("strings", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -15,12 +15,14 @@
 # You should have received a copy of the GNU General Public License
 # along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
 
-from . import errors
+from . import daemon, errors
 from .errors import UserError, UserExit
 from .librecaptcha import get_token, __version__
+from .logs import enable_debug_logging
 from .user_agents import random_user_agent
 import os
 import re
+import signal
 import sys
 
 
@@ -36,6 +38,7 @@ CMD = get_cmd()
 USAGE = """\
 Usage:
   {0} [options] [--] <api-key> <site-url> [<user-agent>]
+  {0} --daemon [--debug] [--http2]
   {0} -h | --help | --version
 
 Arguments:
@@ -51,10 +54,25 @@ Arguments:
                 provided, a random user-agent string will be chosen and shown.
 
 Options:
-   -g --gui  Use the GTK 3 GUI (as opposed to the CLI).
-    --debug  Show debugging information while running.
-  -h --help  Show this help message.
-  --version  Show the program version.
+                -g --gui  Use the GTK 3 GUI (as opposed to the CLI).
+                 --debug  Show debugging information while running.
+                 --http2  Use HTTP/2 for all requests. Requires httpx.
+              --prefetch  Download the image for each multicaptcha challenge
+                          while the previous one is being solved.
+          --trace <file>  Save a trace of how long each phase of the solve
+                          took to <file>, in OpenTelemetry JSON format.
+        --metrics <file>  Save the timings, sizes, and status of each HTTP
+                          request to <file>: as lines of JSON, or in the
+                          Prometheus text format if <file> ends in .prom.
+  --rc-version <version>  Use the given reCAPTCHA release instead of looking
+                          up the current one.
+    --deadline <seconds>  Give up if a token can't be obtained within
+                          <seconds> seconds.
+                --daemon  Keep connections and caches ready for other runs
+                          of librecaptcha, which use them automatically.
+             --no-daemon  Don't use a running daemon.
+               -h --help  Show this help message.
+               --version  Show the program version.
 """.format(CMD)
 
 
@@ -76,10 +94,21 @@ class ParsedArgs:
         self.user_agent = None
         self.gui = False
         self.debug = False
+        self.trace = None
+        self.metrics = None
+        self.http2 = False
+        self.prefetch = False
+        self.rc_version = None
+        self.deadline = None
+        self.daemon = False
+        self.no_daemon = False
         self.help = False
         self.version = False
 
 
+OPTIONS_WITH_ARGS = {"trace", "metrics", "rc-version", "deadline"}
+
+
 class ArgParser:
     def __init__(self, args):
         self.args = args
@@ -108,7 +137,19 @@ class ArgParser:
         self.end_early = True
 
     def parse_long_option(self, arg):
-        body = arg[len("--"):]
+        body, sep, value = arg[len("--"):].partition("=")
+        if body in OPTIONS_WITH_ARGS:
+            if not sep:
+                self.advance()
+                value = self.arg
+            if value is None:
+                self.error("Missing argument for option: --{}".format(body))
+                return
+            self.parse_option_with_arg(body, value)
+            return
+        if sep:
+            self.error("Option does not take an argument: --{}".format(body))
+            return
         if body == "debug":
             self.parsed.debug = True
             return
@@ -123,8 +164,38 @@ class ArgParser:
         if body == "gui":
             self.parsed.gui = True
             return
+        if body == "http2":
+            self.parsed.http2 = True
+            return
+        if body == "prefetch":
+            self.parsed.prefetch = True
+            return
+        if body == "daemon":
+            self.parsed.daemon = True
+            return
+        if body == "no-daemon":
+            self.parsed.no_daemon = True
+            return
         self.error("Unrecognized option: {}".format(arg))
 
+    def parse_option_with_arg(self, name, value):
+        if name == "trace":
+            self.parsed.trace = value
+            return
+        if name == "metrics":
+            self.parsed.metrics = value
+            return
+        if name == "rc-version":
+            self.parsed.rc_version = value
+            return
+        if name == "deadline":
+            try:
+                self.parsed.deadline = float(value)
+            except ValueError:
+                self.error("Invalid number of seconds: {}".format(value))
+            return
+        raise ValueError("Unhandled option: --{}".format(name))
+
     def parse_short_option_char(self, char):
         if char == "h":
             self.parsed.help = True
@@ -175,6 +246,10 @@ class ArgParser:
     def handle_end(self):
         if self.end_early:
             return
+        if self.parsed.daemon:
+            if self.positional_index > 0:
+                self.error("--daemon does not take positional arguments")
+            return
         if self.positional_index < 1:
             self.error("Missing positional argument: <api-key>")
             return
@@ -192,6 +267,7 @@ class ArgParser:
 
 USER_ERRORS = (
     errors.GtkImportError,
+    errors.Http2ImportError,
     errors.SiteUrlParseError,
     errors.UnsupportedChallengeError,
 )
@@ -218,6 +294,13 @@ def run(args: ParsedArgs):
             user_agent=user_agent,
             gui=args.gui,
             debug=args.debug,
+            trace=args.trace,
+            metrics=args.metrics,
+            http2=args.http2,
+            prefetch=args.prefetch,
+            rc_version=args.rc_version,
+            deadline=args.deadline,
+            use_daemon=not args.no_daemon,
         )
     except USER_ERRORS as e:
         raise UserError(str(e)) from e
@@ -236,11 +319,23 @@ An unexpected error occurred. The exception traceback is shown below:
 """
 
 
+def run_daemon(args: ParsedArgs):
+    if args.debug:
+        enable_debug_logging()
+    # Stop cleanly (removing the socket) when terminated, too.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        daemon.serve(http2=args.http2)
+    except USER_ERRORS as e:
+        raise UserError(str(e)) from e
+
+
 def run_or_exit(args: ParsedArgs):
+    func = run_daemon if args.daemon else run
     if args.debug:
-        return run(args)
+        return func(args)
     try:
-        return run(args)
+        return func(args)
     except UserExit:
         sys.exit(2)
     except UserError as e:
@@ -0,0 +1,111 @@
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+"""The directories in which cached files are looked up, in order:
+
+1. ``$LIBRECAPTCHA_CACHE_DIR`` (relative to the current directory if it's a
+   relative path)
+2. ``$XDG_CACHE_HOME/librecaptcha`` (not used if ``$XDG_CACHE_HOME`` is a
+   relative path, which the XDG Base Directory Specification says is
+   invalid)
+3. ``~/.cache/librecaptcha``
+4. ``/var/cache/librecaptcha`` (never written to)
+5. The ``cache`` directory in the librecaptcha package (never written to)
+
+The first layer that has a usable copy of a file wins. Files are written to
+the first of the other layers that's writable. The layers are determined
+from the environment each time they're used, so changes to it take effect.
+"""
+
+from .logs import EXTRACT_LOG
+from .typing import Iterable, List
+
+from collections import namedtuple
+from typing import Optional
+import os
+import os.path
+
+SYSTEM_CACHE_DIR = "/var/cache/librecaptcha"
+PACKAGE_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "cache",
+)
+
+
+Layer = namedtuple("Layer", [
+    "path",  # str
+    "read_only",  # bool
+])
+
+
+def get_layers() -> List[Layer]:
+    cache_dir = os.getenv("LIBRECAPTCHA_CACHE_DIR")
+    xdg_cache_home = os.getenv("XDG_CACHE_HOME")
+    if xdg_cache_home and not os.path.isabs(xdg_cache_home):
+        EXTRACT_LOG.debug(
+            "Ignoring relative $XDG_CACHE_HOME: %s", xdg_cache_home,
+        )
+        xdg_cache_home = None
+    paths = []
+    for path in [
+        cache_dir and os.path.abspath(cache_dir),
+        xdg_cache_home and os.path.join(xdg_cache_home, "librecaptcha"),
+        # `expanduser()` returns "~" unchanged if there's no home directory.
+        os.path.join(os.path.expanduser("~"), ".cache", "librecaptcha"),
+    ]:
+        if path and os.path.isabs(path) and path not in paths:
+            paths.append(path)
+    return [Layer(path, False) for path in paths] + [
+        Layer(SYSTEM_CACHE_DIR, True),
+        Layer(PACKAGE_CACHE_DIR, True),
+    ]
+
+
+def is_writable(path: str) -> bool:
+    """Whether `path` is a writable directory or could be created as one."""
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            return False
+        path = parent
+    return os.path.isdir(path) and os.access(path, os.W_OK | os.X_OK)
+
+
+def get_write_dir(layers: Optional[List[Layer]] = None) -> Optional[str]:
+    """Returns the first writable layer of `layers` (by default, those
+    returned by `get_layers()`), or ``None`` if none is writable.
+    """
+    if layers is None:
+        layers = get_layers()
+    for layer in layers:
+        if not layer.read_only and is_writable(layer.path):
+            return layer.path
+    return None
+
+
+def find(name: str) -> Iterable[str]:
+    """Returns the path of the file `name` in each layer, in order."""
+    return [os.path.join(layer.path, name) for layer in get_layers()]
+
+
+def write_path(name: str) -> Optional[str]:
+    """Returns the path to which the file `name` should be written, or
+    ``None`` if there's no writable layer.
+    """
+    write_dir = get_write_dir()
+    if write_dir is None:
+        return None
+    return os.path.join(write_dir, name)
@@ -17,12 +17,14 @@
 
 from .recaptcha import ChallengeGoal, GridDimensions, ImageGridChallenge
 from .recaptcha import DynamicSolver, MultiCaptchaSolver, Solver
-from .recaptcha import ReCaptcha, Solution
+from .recaptcha import LazyImage, ReCaptcha, Solution
+from .tracing import PHASE_INPUT, PHASE_NETWORK, PHASE_RENDER, PHASE_SOLVE
 from .typing import List
 from PIL import Image, ImageDraw, ImageFont
 
 from threading import Thread
 from queue import Queue
+from typing import Union
 import io
 import os
 import random
@@ -128,14 +130,23 @@ def run_display_cmd():
     )
 
 
-def try_display_cmd(image: Image.Image):
+def encode_image(image: Union[LazyImage, Image.Image]) -> bytes:
+    """Returns the data of a `LazyImage` as it was received, or encodes a
+    decoded image as PNG.
+    """
+    if isinstance(image, LazyImage):
+        return image.data
+    img_buffer = io.BytesIO()
+    image.save(img_buffer, "png")
+    return img_buffer.getvalue()
+
+
+def try_display_cmd(image: Union[LazyImage, Image.Image]):
     global HAS_DISPLAY_CMD
     if not HAS_DISPLAY_CMD:
         return None
 
-    img_buffer = io.BytesIO()
-    image.save(img_buffer, "png")
-    img_bytes = img_buffer.getvalue()
+    img_bytes = encode_image(image)
 
     try:
         proc = run_display_cmd()
@@ -154,12 +165,26 @@ class SolverCli:
         self.solver = solver
         self.__image_procs = []
 
-    def show_image(self, image):
-        proc = try_display_cmd(image)
-        if proc is None:
-            image.show()
-        else:
-            self.__image_procs.append(proc)
+    @property
+    def tracer(self):
+        return self.cli.rc.tracer
+
+    def show_image(self, image: Union[LazyImage, Image.Image]):
+        with self.tracer.span("show_image", PHASE_RENDER):
+            proc = try_display_cmd(image)
+            if proc is None and isinstance(image, LazyImage):
+                image.decoded().show()
+            elif proc is None:
+                image.show()
+            else:
+                self.__image_procs.append(proc)
+
+    def read_indices(self, max_index: int) -> List[int]:
+        with self.tracer.span("read_indices", PHASE_INPUT):
+            return read_indices(
+                "Enter numbers separated by spaces: ",
+                max_index,
+            )
 
     def hide_images(self):
         for proc in self.__image_procs:
@@ -181,7 +206,7 @@ class DynamicCli(SolverCli):
         challenge = self.solver.get_challenge()
         self.cli.handle_challenge(challenge)
 
-        image = challenge.image
+        image = challenge.image.decoded()
         num_rows = challenge.dimensions.rows
         num_columns = challenge.dimensions.columns
         num_tiles = challenge.dimensions.count
@@ -192,12 +217,10 @@ class DynamicCli(SolverCli):
         print("({} rows, {} columns)".format(num_rows, num_columns))
         print("Which tiles should be selected?")
         print("(Top-left is 1; bottom-right is {}.)".format(num_tiles))
-        indices = read_indices(
-            "Enter numbers separated by spaces: ",
-            num_tiles,
-        )
+        indices = self.read_indices(num_tiles)
         print()
         self.hide_images()
+        challenge.image.close()
         self.select_initial(indices)
         self.new_tile_loop()
         return self.solver.finish()
@@ -205,18 +228,21 @@ class DynamicCli(SolverCli):
     def new_tile_loop(self):
         while self.num_pending > 0:
             print_temporary("Waiting for next image...")
-            index, image = self.image_queue.get()
+            with self.tracer.span("wait_for_image", PHASE_NETWORK):
+                index, image = self.image_queue.get()
             clear_temporary()
             self.num_pending -= 1
             self.show_image(image)
 
             print("Take a look at the image that just appeared.")
-            accept = input(
-                "Should this image be selected? [y/N] ",
-            )[:1].lower() == "y"
+            with self.tracer.span("read_answer", PHASE_INPUT):
+                accept = input(
+                    "Should this image be selected? [y/N] ",
+                )[:1].lower() == "y"
             print()
 
             self.hide_images()
+            image.close()
             if accept:
                 self.select_tile(index)
 
@@ -265,7 +291,7 @@ class MultiCaptchaCli(SolverCli):
         num_columns = challenge.dimensions.columns
         num_tiles = challenge.dimensions.count
 
-        image = challenge.image
+        image = challenge.image.decoded()
         draw_lines(image, challenge.dimensions)
         draw_indices(image, challenge.dimensions)
         self.show_image(image)
@@ -274,12 +300,10 @@ class MultiCaptchaCli(SolverCli):
         print("({} rows, {} columns)".format(num_rows, num_columns))
         print("Which tiles should be selected?")
         print("(Top-left is 1; bottom-right is {}.)".format(num_tiles))
-        indices = read_indices(
-            "Enter numbers separated by spaces: ",
-            num_tiles,
-        )
+        indices = self.read_indices(num_tiles)
         print()
         self.hide_images()
+        challenge.image.close()
         return indices
 
 
@@ -289,17 +313,22 @@ class Cli:
         self._first = True
 
     def run(self) -> str:
-        result = self.rc.first_solver()
-        while not isinstance(result, str):
-            solution = self.run_solver(result)
-            result = self.rc.send_solution(solution)
-        return result
+        with self.rc.tracer.span("solve", PHASE_SOLVE):
+            result = self.rc.first_solver()
+            while not isinstance(result, str):
+                solution = self.run_solver(result)
+                result = self.rc.send_solution(solution)
+            return result
 
     def run_solver(self, solver: Solver) -> Solution:
-        return {
+        solver_cli_type = {
             DynamicSolver: DynamicCli,
             MultiCaptchaSolver: MultiCaptchaCli,
-        }[type(solver)](self, solver).run()
+        }[type(solver)]
+        with self.rc.tracer.span(
+            "round", PHASE_SOLVE, solver=type(solver).__name__,
+        ):
+            return solver_cli_type(self, solver).run()
 
     def show_goal(self, goal: ChallengeGoal):
         plain = goal.plain
@@ -0,0 +1,522 @@
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+"""A long-lived local process that keeps what librecaptcha otherwise sets up
+on every run: open HTTP connections, the current reCAPTCHA version, and the
+strings extracted from recaptcha__en.js. Start it with ``librecaptcha
+--daemon``; `get_token()` and the CLI use it automatically while it's
+running.
+
+Challenges are still shown and solved by the client, which sends its HTTP
+requests through the daemon (see `DaemonTransport`) and asks it for the
+reCAPTCHA version and for challenge objectives. Images and fonts are used
+only by the client, so they can't be kept by the daemon.
+
+Messages, in both directions, are a line of JSON followed by a body of
+``body_length`` bytes, over a Unix socket that only the user can access.
+Each request gets one response, except for streamed HTTP requests: their
+response is followed by a message for each chunk of the body as it arrives,
+and then by a message with an empty body (or an error).
+"""
+
+from . import cachedirs
+from .errors import UserError
+from .logs import HTTP_LOG
+from .recaptcha import RC_VERSION_TTL, USE_TEST_SERVER
+from .recaptcha import find_goal_text
+from .recaptcha import get_cached_rc_version, get_js_strings, make_transport
+from .timeouts import Deadline, Timeout
+from .transport import Response, StreamingResponse
+from .typing import Callable, Dict, Iterable, Tuple
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from contextlib import contextmanager
+from typing import BinaryIO, Optional, Union
+import json
+import os
+import os.path
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+ALREADY_RUNNING_MESSAGE = """\
+Error: A librecaptcha daemon is already listening on {}
+"""[:-1]
+
+NO_SOCKET_DIR_MESSAGE = """\
+Error: Nowhere to put the daemon's socket. Set $XDG_RUNTIME_DIR or
+$LIBRECAPTCHA_CACHE_DIR to a writable directory.
+"""[:-1]
+
+# Seconds to wait for the daemon to accept a connection.
+CONNECT_TIMEOUT = 5
+# Seconds to wait for the reCAPTCHA version or a challenge objective, which
+# may require the daemon to download and extract recaptcha__en.js.
+LOOKUP_TIMEOUT = 180
+# Added to the timeout of an HTTP request sent through the daemon, to allow
+# for the daemon's own delay in replying.
+TIMEOUT_MARGIN = 1
+
+Message = Tuple[Dict, bytes]
+
+
+def get_socket_path() -> Optional[str]:
+    name = "librecaptcha-test.sock" if USE_TEST_SERVER else "librecaptcha.sock"
+    runtime_dir = os.getenv("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, name)
+    return cachedirs.write_path(name)
+
+
+def send_message(file: BinaryIO, header: Dict, body: bytes = b""):
+    header = dict(header, body_length=len(body))
+    file.write(json.dumps(header, separators=",:").encode() + b"\n" + body)
+    file.flush()
+
+
+def read_message(file: BinaryIO) -> Message:
+    line = file.readline()
+    if not line:
+        raise EOFError("Connection closed")
+    header = json.loads(line.decode())
+    length = header.get("body_length", 0)
+    body = file.read(length)
+    if len(body) < length:
+        raise EOFError("Connection closed")
+    return (header, body)
+
+
+# Maps exception types to the names used for them in messages, and back.
+ERRORS = [
+    ("timeout", requests.Timeout),
+    ("connection", requests.ConnectionError),
+    ("chunked_encoding", requests.exceptions.ChunkedEncodingError),
+]
+
+
+class DaemonError(RuntimeError):
+    """An unexpected error in the daemon."""
+
+
+def lookup_timeout(deadline: Optional[Deadline] = None) -> float:
+    """Returns how long to wait for a lookup, limited by `deadline`."""
+    if deadline is None:
+        return LOOKUP_TIMEOUT
+    deadline.check()
+    return min(LOOKUP_TIMEOUT, deadline.remaining())
+
+
+def socket_timeout(timeout) -> Optional[float]:
+    """Returns how long to wait for each reply from the daemon to an HTTP
+    request with the given timeout; see `RequestsTransport.request()`.
+    """
+    if timeout is None:
+        return None
+    if isinstance(timeout, (tuple, list)):
+        timeout = sum(timeout)
+    return timeout + TIMEOUT_MARGIN
+
+
+class Daemon:
+    """The state kept by the daemon."""
+    def __init__(self, http2=False):
+        self.http2 = http2
+        self.transport = make_transport(http2)
+        self.lock = threading.Lock()
+        self.rc_version = None
+        self.rc_version_time = None
+
+    def get_rc_version(self, user_agent: str) -> str:
+        with self.lock:
+            if self.rc_version is None or (
+                time.monotonic() - self.rc_version_time >= RC_VERSION_TTL
+            ):
+                self.rc_version = get_cached_rc_version(
+                    user_agent, self.transport,
+                )
+                self.rc_version_time = time.monotonic()
+            return self.rc_version
+
+    def handle(self, header: Dict, body: bytes) -> Iterable[Message]:
+        """Yields the messages sent in response to a request."""
+        op = header["op"]
+        if op == "info":
+            yield ({"http2": self.http2}, b"")
+        elif op == "rc_version":
+            yield ({"rc_version": self.get_rc_version(
+                header["user_agent"],
+            )}, b"")
+        elif op == "goal":
+            strings = get_js_strings(
+                header["user_agent"], header["rc_version"], self.transport,
+            )
+            yield ({"goal": find_goal_text(strings, header["id"])}, b"")
+        elif op == "request":
+            yield from self.request(header, body)
+        else:
+            raise DaemonError("Unknown operation: {}".format(op))
+
+    def request(self, header: Dict, body: bytes) -> Iterable[Message]:
+        timeout = header["timeout"]
+        if isinstance(timeout, list):
+            timeout = Timeout(*timeout)
+        kwargs = {"headers": header["headers"], "timeout": timeout}
+        if header["raw"]:
+            # The body is forwarded as it arrives, so that if the download
+            # fails, the client keeps what it received and can resume.
+            with self.transport.stream(
+                header["method"], header["url"], **kwargs,
+            ) as r:
+                yield (response_header(r, bytes_out=0), b"")
+                for chunk in r.chunks:
+                    if chunk:
+                        yield ({}, chunk)
+            yield ({}, b"")
+            return
+
+        data = header["form"]
+        if data is None and body:
+            data = body
+        r = self.transport.request(
+            header["method"], header["url"], params=header["params"],
+            data=data, **kwargs,
+        )
+        yield (response_header(r, bytes_out=r.bytes_out), r.content)
+
+
+def response_header(r: Union[Response, StreamingResponse],
+                    bytes_out: int) -> Dict:
+    return {
+        "url": r.url,
+        "status_code": r.status_code,
+        "headers": list(r.headers.items()),
+        "ttfb": r.ttfb,
+        "bytes_out": bytes_out,
+        "http_version": r.http_version,
+    }
+
+
+def error_message(e: Exception) -> Message:
+    name = next((
+        name for name, type_ in ERRORS if isinstance(e, type_)
+    ), "error")
+    return ({"error": name, "message": str(e)}, b"")
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        daemon = self.server.daemon
+        while True:
+            try:
+                header, body = read_message(self.rfile)
+            except (EOFError, OSError, ValueError):
+                return
+            responses = daemon.handle(header, body)
+            try:
+                self.respond(header, responses)
+            except OSError:
+                return
+            finally:
+                responses.close()
+
+    def respond(self, header: Dict, responses: Iterable[Message]):
+        """Sends each message in `responses`. If producing one fails, an
+        error message is sent instead, which ends the response. `OSError` is
+        raised only if sending fails.
+        """
+        while True:
+            try:
+                response = next(responses, None)
+            except Exception as e:
+                HTTP_LOG.debug("[daemon] %s failed", header.get("op"),
+                               exc_info=True)
+                send_message(self.wfile, *error_message(e))
+                return
+            if response is None:
+                return
+            send_message(self.wfile, *response)
+
+
+class Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def serve(http2=False, path: Optional[str] = None):
+    """Runs the daemon until it's interrupted."""
+    path = path or get_socket_path()
+    if path is None:
+        raise UserError(NO_SOCKET_DIR_MESSAGE)
+    client = connect(path)
+    if client is not None:
+        client.close()
+        raise UserError(ALREADY_RUNNING_MESSAGE.format(path))
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    daemon = Daemon(http2)
+    old_umask = os.umask(0o177)
+    try:
+        server = Server(path, RequestHandler)
+    finally:
+        os.umask(old_umask)
+    server.daemon = daemon
+    print("Listening on {}".format(path), file=sys.stderr)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(path)
+        daemon.transport.close()
+
+
+class Connection:
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.file = sock.makefile("rwb")
+        # False while a streamed response is being received.
+        self.reusable = True
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+def open_connection(path: str) -> Connection:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(CONNECT_TIMEOUT)
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        raise
+    return Connection(sock)
+
+
+class DaemonClient:
+    """A connection to a running daemon. Connections are pooled, so it can
+    be used from multiple threads at once. Each call takes a timeout, which
+    limits how long to wait for each reply; if it passes, `requests.Timeout`
+    is raised.
+    """
+    def __init__(self, path: str, connection: Connection):
+        self.path = path
+        self.lock = threading.Lock()
+        self.idle = [connection]
+        self._http2 = None
+
+    @contextmanager
+    def _connection(self, timeout: Optional[float]):
+        with self.lock:
+            conn = self.idle.pop() if self.idle else None
+        if conn is None:
+            with self._map_errors():
+                conn = open_connection(self.path)
+        try:
+            conn.sock.settimeout(timeout)
+            yield conn
+        except BaseException:
+            # The connection may be partway through a message.
+            conn.close()
+            raise
+        if not conn.reusable:
+            conn.close()
+            return
+        with self.lock:
+            self.idle.append(conn)
+
+    @contextmanager
+    def _map_errors(self):
+        try:
+            yield
+        except socket.timeout as e:
+            raise requests.Timeout("Timed out waiting for daemon") from e
+        except (EOFError, OSError, ValueError) as e:
+            raise requests.ConnectionError(
+                "Lost connection to daemon: {}".format(e),
+            ) from e
+
+    def _send(self, conn: Connection, header: Dict, body: bytes = b""):
+        with self._map_errors():
+            send_message(conn.file, header, body)
+
+    def _read(self, conn: Connection) -> Message:
+        with self._map_errors():
+            header, body = read_message(conn.file)
+        error = header.get("error")
+        if error is not None:
+            error_type = dict(ERRORS).get(error, DaemonError)
+            raise error_type(header["message"])
+        return (header, body)
+
+    def call(self, header: Dict, body: bytes = b"",
+             timeout: Optional[float] = None) -> Message:
+        with self._connection(timeout) as conn:
+            self._send(conn, header, body)
+            return self._read(conn)
+
+    @contextmanager
+    def call_streaming(self, header: Dict, timeout: Optional[float] = None):
+        """Like `call()`, but for a streamed response. Returns a context
+        manager for the response header and an iterator over the chunks of
+        the body, which are received as they're read.
+        """
+        with self._connection(timeout) as conn:
+            self._send(conn, header)
+            response, _ = self._read(conn)
+            conn.reusable = False
+
+            def chunks():
+                while True:
+                    body = self._read(conn)[1]
+                    if not body:
+                        conn.reusable = True
+                        return
+                    yield body
+            yield (response, chunks())
+
+    @property
+    def http2(self) -> bool:
+        """Whether the daemon sends HTTP requests over HTTP/2."""
+        if self._http2 is None:
+            self._http2 = self.call(
+                {"op": "info"}, timeout=CONNECT_TIMEOUT,
+            )[0]["http2"]
+        return self._http2
+
+    def get_rc_version(self, user_agent: str,
+                       timeout: Optional[float] = LOOKUP_TIMEOUT) -> str:
+        return self.call({
+            "op": "rc_version",
+            "user_agent": user_agent,
+        }, timeout=timeout)[0]["rc_version"]
+
+    def find_goal_text(self, user_agent: str, rc_version: str, id: str,
+                       timeout: Optional[float] = LOOKUP_TIMEOUT,
+                       ) -> Optional[str]:
+        return self.call({
+            "op": "goal",
+            "user_agent": user_agent,
+            "rc_version": rc_version,
+            "id": id,
+        }, timeout=timeout)[0]["goal"]
+
+    def goal_finder(self, user_agent: str, rc_version: str,
+                    deadline: Optional[Deadline] = None,
+                    ) -> Callable[[str], Optional[str]]:
+        """Returns a `goal_finder` for `ReCaptcha` that uses the daemon."""
+        def find(id: str) -> Optional[str]:
+            return self.find_goal_text(
+                user_agent, rc_version, id, lookup_timeout(deadline),
+            )
+        return find
+
+    def close(self):
+        with self.lock:
+            for conn in self.idle:
+                conn.close()
+            self.idle = []
+
+
+def connect(path: Optional[str] = None,
+            http2=False) -> Optional[DaemonClient]:
+    """Returns a client for the daemon, or ``None`` if it isn't running. If
+    `http2` is true, ``None`` is also returned if the daemon doesn't use
+    HTTP/2.
+    """
+    path = path or get_socket_path()
+    if path is None:
+        return None
+    try:
+        connection = open_connection(path)
+    except OSError:
+        return None
+    client = DaemonClient(path, connection)
+    if not http2:
+        return client
+    try:
+        if client.http2:
+            return client
+    except requests.RequestException as e:
+        HTTP_LOG.debug("[daemon] Could not get protocol: %s", e)
+    client.close()
+    return None
+
+
+class DaemonTransport:
+    """Sends requests through the daemon's connections. See
+    `librecaptcha.transport`.
+    """
+    def __init__(self, client: DaemonClient):
+        self.client = client
+
+    def _header(self, method: str, url: str, headers, timeout, raw: bool,
+                params=None, data=None) -> Dict:
+        return {
+            "op": "request",
+            "method": method,
+            "url": url,
+            "params": params,
+            "headers": headers,
+            "timeout": timeout,
+            "raw": raw,
+            "form": data if isinstance(data, dict) else None,
+        }
+
+    def request(self, method: str, url: str, *, params=None, data=None,
+                headers=None, timeout=None) -> Response:
+        """See `RequestsTransport.request()`."""
+        header = self._header(
+            method, url, headers, timeout, False, params, data,
+        )
+        body = data if isinstance(data, bytes) else b""
+        r, content = self.client.call(header, body, socket_timeout(timeout))
+        return Response(
+            url=r["url"],
+            status_code=r["status_code"],
+            headers=CaseInsensitiveDict(r["headers"]),
+            content=content,
+            ttfb=r["ttfb"],
+            bytes_out=r["bytes_out"],
+            http_version=r["http_version"],
+        )
+
+    @contextmanager
+    def stream(self, method: str, url: str, *, headers=None, timeout=None):
+        """See `RequestsTransport.stream()`. The daemon forwards the body in
+        chunks as it arrives.
+        """
+        header = self._header(method, url, headers, timeout, True)
+        with self.client.call_streaming(
+            header, socket_timeout(timeout),
+        ) as (r, chunks):
+            yield StreamingResponse(
+                url=r["url"],
+                status_code=r["status_code"],
+                headers=CaseInsensitiveDict(r["headers"]),
+                chunks=chunks,
+                ttfb=r["ttfb"],
+                http_version=r["http_version"],
+            )
+
+    def close(self):
+        self.client.close()
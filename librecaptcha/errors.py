@@ -21,6 +21,16 @@ Try (re)installing librecaptcha[gtk] with pip.
 For more details, add the --debug option.
 """[:-1]
 
+HTTP2_MISSING_MESSAGE = """\
+Error: Could not load HTTP/2 support. Is httpx installed?
+Try (re)installing librecaptcha[http2] with pip.
+For more details, add the --debug option.
+"""[:-1]
+
+DEADLINE_EXCEEDED_MESSAGE = """\
+Error: Could not get a token within the deadline of {:g} seconds.
+"""[:-1]
+
 CHALLENGE_BLOCKED_MESSAGE = """\
 Error: Unsupported challenge type: {}
 Requests are most likely being blocked; see the previously displayed messages.
@@ -66,6 +76,11 @@ class GtkImportError(ImportError):
         return GUI_MISSING_MESSAGE
 
 
+class Http2ImportError(ImportError):
+    def __str__(self) -> str:
+        return HTTP2_MISSING_MESSAGE
+
+
 class SiteUrlParseError(ValueError):
     pass
 
@@ -98,3 +113,9 @@ class UnknownChallengeError(UnsupportedChallengeError):
     def show_by_default(self) -> bool:
         # A detailed message is already shown in `librecaptcha.get_token()`.
         return False
+
+
+class DeadlineExceededError(UserError):
+    def __init__(self, seconds: float):
+        super().__init__(DEADLINE_EXCEEDED_MESSAGE.format(seconds))
+        self.seconds = seconds
@@ -15,43 +15,175 @@
 # You should have received a copy of the GNU General Public License
 # along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
 
+from . import cachedirs, stringtable
+from .httpcache import HttpCache
+from .logs import EXTRACT_LOG
+from .retry import DEFAULT_RETRY, RetryPolicy
+from .timeouts import DEFAULT_TIMEOUTS, SCRIPTS, Deadline, Timeout
+from .timeouts import check, deadline_errors, limit
+from .transport import RequestsTransport
 from .typing import List
-import requests
 
-import json
+from typing import Optional
+import hashlib
+import importlib.util
 import os
-import os.path
 import re
 import sys
+import threading
 
 SHOW_WARNINGS = False
 
+# Where slimit's PLY tables are saved, in the cache directory, and the names
+# of their modules. The names include a package so PLY doesn't put them in
+# slimit's package, but they're saved directly in the directory.
+PLY_TABLES_NAME = "ply-tables"
+PLY_LEXTAB = "librecaptcha.slimit_lextab"
+PLY_YACCTAB = "librecaptcha.slimit_yacctab"
+_ply_lock = threading.Lock()
 
-def load_javascript(url: str, user_agent: str) -> str:
+
+def load_javascript(url: str, user_agent: str, transport=None,
+                    cache: Optional[HttpCache] = None,
+                    timeout: Timeout = DEFAULT_TIMEOUTS[SCRIPTS],
+                    retry: RetryPolicy = DEFAULT_RETRY,
+                    deadline: Optional[Deadline] = None) -> str:
+    """Downloads the JavaScript at `url`. If `cache` is provided, the script
+    is streamed to the cache, which resumes interrupted downloads and is
+    reused if it's still current; the file is then read once, as a string.
+    If `deadline` is provided, the download is limited by it; see
+    `librecaptcha.timeouts`.
+    """
     print("Downloading <{}>...".format(url), file=sys.stderr)
-    r = requests.get(url, headers={
-        "User-Agent": user_agent,
-    })
-    return r.text
+    if transport is None:
+        transport = RequestsTransport()
+    headers = {"User-Agent": user_agent}
+    if cache is None:
+        with deadline_errors(deadline):
+            r = retry.call(lambda attempt: transport.request(
+                "GET", url, headers=headers,
+                timeout=limit(timeout, deadline),
+            ), deadline)
+        check(deadline)
+        r.raise_for_status()
+        EXTRACT_LOG.debug(
+            "Downloaded %d bytes (status %d)", len(r.content), r.status_code,
+        )
+        return r.text
 
+    body = cache.download(
+        transport, "recaptcha__en.js", url, headers=headers,
+        timeout=timeout, retry=retry, deadline=deadline,
+    )
+    with open(body.path, encoding=body.encoding, errors="replace") as f:
+        javascript = f.read()
+    EXTRACT_LOG.debug("Read %d characters from cache", len(javascript))
+    return javascript
 
-def extract_strings_slimit(javascript: str) -> List[str]:
+
+def load_ply_table(name: str, directory: str):
+    """Makes the table module `name` saved in `directory`, if any,
+    importable, which is how PLY loads tables.
+    """
+    if name in sys.modules:
+        return
+    spec = importlib.util.spec_from_file_location(name, os.path.join(
+        directory, "{}.py".format(name.rpartition(".")[2]),
+    ))
+    module = importlib.util.module_from_spec(spec)
+    try:
+        spec.loader.exec_module(module)
+    except (OSError, SyntaxError) as e:
+        EXTRACT_LOG.debug("Could not load %s: %s", name, e)
+        return
+    sys.modules[name] = module
+
+
+def get_ply_tables_dir() -> Optional[str]:
+    """Returns the directory for the tables of the installed versions of
+    slimit and PLY. slimit tells PLY to use existing tables without checking
+    them against the grammar, so they're keyed by the grammar's source.
+    """
+    import ply
+    import slimit.lexer
+    import slimit.parser
+
+    directory = cachedirs.write_path(PLY_TABLES_NAME)
+    if directory is None:
+        return None
+    key = hashlib.sha1(ply.__version__.encode())
+    try:
+        for module in [slimit.lexer, slimit.parser]:
+            with open(module.__file__, "rb") as f:
+                key.update(f.read())
+    except (OSError, TypeError) as e:
+        EXTRACT_LOG.debug("Could not read slimit's source: %s", e)
+        return None
+    directory = os.path.join(directory, key.hexdigest()[:16])
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError as e:
+        EXTRACT_LOG.debug("Could not create %s: %s", directory, e)
+        return None
+    return directory
+
+
+def make_slimit_parser():
+    """Creates a slimit parser. Building its PLY lexer and parser tables is
+    slow, so they're saved in the cache directory and reused.
+    """
+    import ply.lex
+    import ply.yacc
+    import slimit.parser
+    from slimit.lexer import Lexer
     from slimit.parser import Parser
+
+    options = {}
+    if not SHOW_WARNINGS:
+        options["errorlog"] = ply.yacc.NullLogger()
+    lextab, yacctab = slimit.parser.lextab, slimit.parser.yacctab
+    directory = get_ply_tables_dir()
+    if directory is not None:
+        for name in [PLY_LEXTAB, PLY_YACCTAB]:
+            load_ply_table(name, directory)
+        options["outputdir"] = directory
+        lextab, yacctab = PLY_LEXTAB, PLY_YACCTAB
+
+    # slimit doesn't pass these options through to PLY, so its lexer and
+    # parser are built here instead, the same way slimit builds them.
+    class TableLexer(Lexer):
+        def build(self, **kwargs):
+            self.lexer = ply.lex.lex(
+                object=self, optimize=True, lextab=lextab, **options,
+            )
+
+    class TableParser(Parser):
+        def __init__(self):
+            self.lex_optimize = True
+            self.lextab = lextab
+            self.yacc_optimize = True
+            self.yacctab = yacctab
+            self.yacc_debug = False
+
+            self.lexer = TableLexer()
+            self.tokens = self.lexer.tokens
+            self.parser = ply.yacc.yacc(
+                module=self, optimize=True, debug=False, tabmodule=yacctab,
+                start="program", **options,
+            )
+            # See `slimit.parser.Parser.__init__`.
+            self._error_tokens = {}
+
+    # Tables are loaded and written through `sys.modules` and the cache
+    # directory, so only one parser is built at a time.
+    with _ply_lock:
+        return TableParser()
+
+
+def extract_strings_slimit(javascript: str) -> List[str]:
     from slimit import ast
 
-    if SHOW_WARNINGS:
-        parser = Parser()
-    else:
-        # File descriptor hackiness to silence warnings
-        null_fd = os.open(os.devnull, os.O_RDWR)
-        old_fd = os.dup(2)
-        try:
-            os.dup2(null_fd, 2)
-            parser = Parser()
-        finally:
-            os.dup2(old_fd, 2)
-            os.close(null_fd)
-            os.close(old_fd)
+    parser = make_slimit_parser()
 
     # Hack to work around https://github.com/rspivak/slimit/issues/52
     KEYWORDS = r"(?:catch|delete|return|throw)"
@@ -92,22 +224,35 @@ def extract_strings(javascript: str) -> List[str]:
             strings.append(node.value)
 
     esprima.parseScript(javascript, delegate=handle_node)
+    EXTRACT_LOG.debug("Extracted %d strings", len(strings))
     return strings
 
 
 def extract_and_save(
     url: str,
-    path: str,
+    path: Optional[str],
     version: str,
     rc_version: str,
     user_agent: str,
+    transport=None,
+    cache: Optional[HttpCache] = None,
+    timeout: Timeout = DEFAULT_TIMEOUTS[SCRIPTS],
+    retry: RetryPolicy = DEFAULT_RETRY,
+    format: str = stringtable.FORMAT_BINARY,
+    deadline: Optional[Deadline] = None,
 ) -> List[str]:
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w") as f:
-        print("{}/{}".format(version, rc_version), file=f)
-        js = load_javascript(url, user_agent)
-        strings = extract_strings(js)
-        strings_json = json.dumps(strings)
-        print('Saving strings to "{}"...'.format(path), file=sys.stderr)
-        f.write(strings_json)
+    """Extracts the strings from the script at `url` and saves them to
+    `path` in `format` (see `librecaptcha.stringtable`), unless `path` is
+    ``None``.
+    """
+    js = load_javascript(
+        url, user_agent, transport, cache, timeout, retry, deadline,
+    )
+    strings = extract_strings(js)
+    if path is None:
         return strings
+    print('Saving strings to "{}"...'.format(path), file=sys.stderr)
+    stringtable.save(
+        path, "{}/{}".format(version, rc_version), strings, format,
+    )
+    return strings
@@ -19,11 +19,13 @@
 from .errors import UserExit, GtkImportError
 from .recaptcha import ChallengeGoal, GridDimensions, ImageGridChallenge
 from .recaptcha import DynamicSolver, MultiCaptchaSolver, Solver
-from .recaptcha import ReCaptcha, Solution
+from .recaptcha import LazyImage, ReCaptcha, Solution, run_in_background
+from .tracing import PHASE_INPUT, PHASE_NETWORK, PHASE_RENDER, PHASE_SOLVE
 from .typing import Callable, Iterable, List
 from PIL import Image
 
 from collections import namedtuple
+from concurrent.futures import Future
 from typing import Any, Optional, Union
 import html
 import re
@@ -53,7 +55,21 @@ def tiles_from_image(
             yield image.crop((left, top, right, bottom))
 
 
-def image_to_gdk_pixbuf(image: Image.Image):
+# Tiles are cropped from a decoded challenge image, but replacement tiles are
+# kept as received.
+TileImage = Union[Image.Image, LazyImage]
+
+
+def image_to_gdk_pixbuf(image: TileImage):
+    if isinstance(image, LazyImage):
+        # GdkPixbuf decodes the data itself; it's never decoded by PIL.
+        loader = GdkPixbuf.PixbufLoader.new()
+        try:
+            loader.write(image.data)
+        finally:
+            loader.close()
+        return loader.get_pixbuf()
+
     width, height = image.size
     image_bytes = GLib.Bytes(image.tobytes())
     has_alpha = (image.mode == "RGBA")
@@ -126,6 +142,13 @@ class DynamicTile:
         self.inner = None
         self.inner_size = (0, 0)  # (width, height)
 
+        # The button and spinner are created once and swapped in and out of
+        # `self.box`; replacement images only change the image's pixbuf.
+        self.image = Gtk.Image.new()
+        self.button = self.make_button()
+        self.spinner = Gtk.Spinner.new()
+        self.spinner.set_size_request(32, 32)
+
     @property
     def widget(self):
         return self.box
@@ -133,31 +156,34 @@ class DynamicTile:
     def update(self, pres: "DynamicTilePres"):
         if pres.same(self.pres):
             return
-        if self.inner is not None:
-            self.box.remove(self.inner)
-        self.make_inner(pres.image)
-        self.box.show_all()
+        if pres.image is None:
+            self.show_spinner()
+        else:
+            self.image.set_from_pixbuf(image_to_gdk_pixbuf(pres.image))
+            self.set_inner(self.button)
         self.pres = pres
 
-    def make_inner(self, image: Image.Image):
-        if image is None:
-            self.make_spinner()
-            return
+    def release(self):
+        """Drops the pixbuf while the tile is kept in a pool, off screen."""
+        self.image.clear()
+        self.pres = None
 
+    def make_button(self):
         button = Gtk.Button.new()
         button.get_style_context().add_class("challenge-button")
-        button.add(Gtk.Image.new_from_pixbuf(image_to_gdk_pixbuf(image)))
+        button.add(self.image)
         button.connect("clicked", lambda _: self.pres.on_click(self.dispatch))
 
         def on_size_allocate(obj, size):
             self.inner_size = (size.width, size.height)
         button.connect("size-allocate", on_size_allocate)
-        self.set_inner(button)
+        return button
 
-    def make_spinner(self):
+    def show_spinner(self):
+        # The old image won't be shown again.
+        self.image.clear()
         width, height = (max(n, 32) for n in self.inner_size)
-        spinner = Gtk.Spinner.new()
-        spinner.set_size_request(32, 32)
+        spinner = self.spinner
         left = (width - 32) // 2
         top = (height - 32) // 2
         spinner.set_margin_top(top)
@@ -166,11 +192,17 @@ class DynamicTile:
         spinner.set_margin_end(width - left - 32)
         self.set_inner(spinner)
         spinner.start()
-        return spinner
 
     def set_inner(self, widget):
+        if widget is self.inner:
+            return
+        if self.inner is not None:
+            self.box.remove(self.inner)
+            if self.inner is self.spinner:
+                self.spinner.stop()
         self.inner = widget
         self.box.add(self.inner)
+        self.inner.show_all()
 
 
 class MultiCaptchaTile:
@@ -190,18 +222,30 @@ class MultiCaptchaTile:
         self.toggle_id = None
 
         self.pixbuf = None
-        self.small_pixbuf = None
+        self._small_pixbuf = None
         self.button.show_all()
 
     @property
     def widget(self):
         return self.button
 
+    @property
+    def small_pixbuf(self):
+        # Most tiles are never selected, so the scaled-down pixbuf shown for
+        # selected tiles is only created once it's needed.
+        if self._small_pixbuf is None:
+            width = self.pixbuf.get_width()
+            height = self.pixbuf.get_height()
+            self._small_pixbuf = self.pixbuf.scale_simple(
+                width * 0.9, height * 0.9, GdkPixbuf.InterpType.BILINEAR,
+            )
+        return self._small_pixbuf
+
     def update(self, pres: "MultiCaptchaTilePres"):
         if pres.same(self.pres):
             return None
 
-        if self.pres is None:
+        if self.toggle_id is None:
             def on_toggle(obj):
                 self._set_active(not obj.get_active())
                 self.pres.on_click(self.dispatch)
@@ -209,12 +253,10 @@ class MultiCaptchaTile:
 
         if (self.pres and self.pres.image) is not pres.image:
             self.pixbuf = image_to_gdk_pixbuf(pres.image)
-            width = self.pixbuf.get_width()
-            height = self.pixbuf.get_height()
-            self.image.set_size_request(width, height)
-            self.small_pixbuf = self.pixbuf.scale_simple(
-                width * 0.9, height * 0.9, GdkPixbuf.InterpType.BILINEAR,
+            self.image.set_size_request(
+                self.pixbuf.get_width(), self.pixbuf.get_height(),
             )
+            self._small_pixbuf = None
 
         if pres.selected:
             self.check.show()
@@ -226,6 +268,13 @@ class MultiCaptchaTile:
         self._set_active(pres.selected)
         self.pres = pres
 
+    def release(self):
+        """See `DynamicTile.release()`."""
+        self.image.clear()
+        self.pixbuf = None
+        self._small_pixbuf = None
+        self.pres = None
+
     def make_check(self):
         check = Gtk.Image.new_from_icon_name(
             "object-select-symbolic", Gtk.IconSize.DND,
@@ -246,6 +295,9 @@ class ChallengeTile:
         self.dispatch = dispatch
         self.box = Gtk.Box.new(Gtk.Orientation.VERTICAL, 0)
         self.tile = None
+        # Inner tiles are kept when the challenge type changes so they can be
+        # reused instead of recreated.
+        self.tile_pool = {}
 
     @property
     def widget(self):
@@ -260,11 +312,19 @@ class ChallengeTile:
         if type(self.tile) is not tile_type:
             if self.tile is not None:
                 self.box.remove(self.tile.widget)
-            self.tile = tile_type(self.dispatch)
+                self.tile.release()
+            self.tile = self.tile_pool.get(tile_type)
+            if self.tile is None:
+                self.tile = tile_type(self.dispatch)
+                self.tile_pool[tile_type] = self.tile
             self.box.add(self.tile.widget)
             self.box.show_all()
         self.tile.update(pres)
 
+    def release(self):
+        if self.tile is not None:
+            self.tile.release()
+
 
 class ImageGridChallengeDialog:
     def __init__(self, dispatch: Dispatch):
@@ -297,6 +357,8 @@ class ImageGridChallengeDialog:
 
         self.grid = None
         self.tiles = []
+        # Maps `GridDimensions` to previously created `(grid, tiles)` pairs.
+        self.grid_pool = {}
         self.dialog.show_all()
 
     def run(self) -> bool:
@@ -305,6 +367,10 @@ class ImageGridChallengeDialog:
         """
         return self.dialog.run() == Gtk.ResponseType.OK
 
+    def stop(self):
+        """Makes `run()` return."""
+        self.dialog.response(Gtk.ResponseType.NONE)
+
     def destroy(self):
         self.dialog.destroy()
 
@@ -316,9 +382,16 @@ class ImageGridChallengeDialog:
         if dimensions != (self.pres and self.pres.dimensions):
             if self.grid is not None:
                 self.content.remove(self.grid)
-            self.grid = self.make_grid(dimensions)
-            self.grid.show_all()
-            self.content.pack_start(self.grid, True, True, 0)
+                # Pooled grids are kept, but not their images.
+                for tile in self.tiles:
+                    tile.release()
+            self.grid, self.tiles = None, []
+            if dimensions is not None:
+                self.grid, self.tiles = self.get_grid(dimensions)
+                self.grid.show_all()
+                self.content.pack_start(self.grid, True, True, 0)
+        if self.grid is not None:
+            self.grid.set_sensitive(not pres.is_loading)
 
         if not pres.same_goal(self.pres):
             self.header.set_markup(pres.goal)
@@ -331,15 +404,22 @@ class ImageGridChallengeDialog:
             tile.update(tile_pres)
         self.pres = pres
 
+    def get_grid(self, dimensions: GridDimensions):
+        pooled = self.grid_pool.get(dimensions)
+        if pooled is None:
+            pooled = self.make_grid(dimensions)
+            self.grid_pool[dimensions] = pooled
+        return pooled
+
     def make_grid(self, dimensions: GridDimensions):
         grid = Gtk.Grid.new()
-        self.tiles = []
+        tiles = []
         for row in range(0, dimensions.rows):
             for column in range(0, dimensions.columns):
                 tile = ChallengeTile(self.dispatch)
                 grid.attach(tile.widget, column, row, 1, 1)
-                self.tiles.append(tile)
-        return grid
+                tiles.append(tile)
+        return (grid, tiles)
 
 
 def format_goal(goal: ChallengeGoal) -> str:
@@ -370,7 +450,7 @@ SelectTile = namedtuple("SelectTile", [
 ])
 ReplaceTile = namedtuple("ReplaceTile", [
     "index",  # int
-    "image",  # Image.Image
+    "image",  # Optional[LazyImage]
 ])
 SetState = namedtuple("SetState", [
     "state",  # State
@@ -399,6 +479,11 @@ class Gui:
         self.store = Store(self.final_dispatch, rc)
         self.view = ImageGridChallengeDialog(self.dispatch)
         self.update_pending = False
+        self.tracer = rc.tracer
+        self.root_span = None
+        self.dialog_running = False
+        self.input_span = None
+        self.loading_span = None
 
     @property
     def dispatch(self) -> Dispatch:
@@ -409,7 +494,12 @@ class Gui:
         return self.store.state
 
     def final_dispatch(self, msg):
-        self.store.state = reduce_state(self.state, msg)
+        old_state = self.state
+        self.store.state = reduce_state(old_state, msg)
+        close_superseded_images(old_state, self.state)
+        self.update_spans()
+        if self.token is not None or self.error is not None:
+            self.view.stop()
         if not self.update_pending:
             self.update_pending = True
             GLib.idle_add(self._update)
@@ -418,23 +508,69 @@ class Gui:
         self.update_pending = False
         pres = self.pres
         if pres is not None:
-            self.view.update(pres)
+            with self.tracer.span("render", PHASE_RENDER):
+                self.view.update(pres)
         return False
 
-    def run(self) -> str:
-        load_css()
-        self.dispatch(Start())
+    def update_spans(self):
+        """The dialog's time is traced as input only while it can be
+        interacted with. While a request is pending, it's traced as a wait
+        for the network instead.
+        """
+        loading = type(self.state) is LoadingState
+        if loading and self.loading_span is None:
+            self.loading_span = self.tracer.span(
+                "loading", PHASE_NETWORK, parent=self.root_span,
+            )
+        elif not loading and self.loading_span is not None:
+            self.loading_span.end()
+            self.loading_span = None
+
+        interactive = self.dialog_running and (
+            type(self.state) in SOLVER_STATE_TYPES
+        )
+        if interactive and self.input_span is None:
+            self.input_span = self.tracer.span(
+                "dialog", PHASE_INPUT, parent=self.root_span,
+            )
+        elif not interactive and self.input_span is not None:
+            self.input_span.end()
+            self.input_span = None
+
+    def run_dialog(self) -> bool:
+        self.dialog_running = True
+        self.update_spans()
         try:
-            while self.token is None:
-                if not gtk_run(self.view.run):
-                    raise UserExit
-                self.dispatch(FinishChallenge())
+            return gtk_run(self.view.run)
         finally:
-            self.view.destroy()
-            while Gtk.events_pending():
-                Gtk.main_iteration()
+            self.dialog_running = False
+            self.update_spans()
+
+    def run(self) -> str:
+        load_css()
+        with self.tracer.span("solve", PHASE_SOLVE) as self.root_span:
+            try:
+                self.dispatch(Start())
+                self._run()
+            finally:
+                if self.loading_span is not None:
+                    self.loading_span.end()
+                self.view.destroy()
+                while Gtk.events_pending():
+                    Gtk.main_iteration()
         return self.token
 
+    def _run(self):
+        while True:
+            response = self.run_dialog()
+            if self.error is not None:
+                raise self.error
+            if self.token is not None:
+                return
+            if not response:
+                raise UserExit
+            self.dispatch(FinishChallenge())
+
     @property
     def pres(self) -> Optional["ImageGridChallengePres"]:
         return pres(self.state)
@@ -445,6 +581,12 @@ class Gui:
             return self.state
         return None
 
+    @property
+    def error(self) -> Optional[Exception]:
+        if type(self.state) is ErrorState:
+            return self.state.error
+        return None
+
 
 class Store:
     state: Optional["State"]
@@ -461,6 +603,7 @@ def pres(state: "State") -> Optional["ImageGridChallengePres"]:
     return {
         DynamicState: DynamicPres,
         MultiCaptchaState: MultiCaptchaPres,
+        LoadingState: LoadingPres,
     }.get(type(state), lambda _: None)(state)
 
 
@@ -475,23 +618,56 @@ def state_from_solver(solver: Solver) -> "SolverState":
 def reduce_state(state: "State", msg) -> "State":
     if type(msg) is SetState:
         return msg.state
-    if type(state) in SOLVER_STATE_TYPES:
+    if type(state) in SOLVER_STATE_TYPES or type(state) is LoadingState:
         return state.reduce(msg)
     return state
 
 
+def state_images(state: "State") -> List[Optional[TileImage]]:
+    if type(state) is LoadingState:
+        return state_images(state.previous)
+    if type(state) in SOLVER_STATE_TYPES:
+        return state.tile_images
+    return []
+
+
+def close_superseded_images(old: "State", new: "State"):
+    """Closes the tile images in `old` that aren't in `new`. The view only
+    keeps pixbufs, which are copies, so images aren't needed once they've been
+    removed from the state.
+    """
+    kept = {id(image) for image in state_images(new)}
+    for image in state_images(old):
+        if image is not None and id(image) not in kept:
+            image.close()
+
+
+def tiles_from_challenge(challenge: ImageGridChallenge) -> List[Image.Image]:
+    """Splits the challenge image into tiles, and then closes it."""
+    try:
+        return list(tiles_from_image(
+            challenge.image.decoded(), challenge.dimensions,
+        ))
+    finally:
+        challenge.image.close()
+
+
 class SolverMiddleware:
     def __init__(self, store: Store, next: Dispatch, rc: ReCaptcha):
         self.store = store
         self.next = next
         self.rc = rc
         self.solver = None
+        self.root_span = None
+        self.round_span = None
         self._select_tile_lock = threading.Lock()
 
     def dispatch(self, msg):
+        if type(self.store.state) is LoadingState:
+            # Input is ignored until the pending request finishes.
+            return
         if type(msg) is Start:
-            self.solver = self.rc.first_solver()
-            self.next(SetState(state_from_solver(self.solver)))
+            self.start()
         elif isinstance(self.solver, DynamicSolver):
             self.dispatch_dynamic(msg)
         elif isinstance(self.solver, MultiCaptchaSolver):
@@ -499,6 +675,56 @@ class SolverMiddleware:
         else:
             self.next(msg)
 
+    def in_background(
+        self,
+        func: Callable[[], Any],
+        callback: Callable[[Any], None],
+        loading=True,
+    ):
+        """Calls `func` in a background thread so that network requests
+        don't block the GTK main loop. If `loading` is true, the state is a
+        `LoadingState` until `func` returns. Then `callback` is called with
+        the result on the main thread. If `func` raises an exception, the
+        state becomes an `ErrorState` instead.
+        """
+        state = self.store.state
+        if loading and type(state) is not LoadingState:
+            self.next(SetState(LoadingState(previous=state)))
+        tracer = self.rc.tracer
+        parent = self.round_span or self.root_span
+
+        def target():
+            with tracer.use_parent(parent):
+                return func()
+
+        def finish(future: Future):
+            try:
+                result = future.result()
+            except Exception as e:
+                self.set_solver(None)
+                self.next(SetState(ErrorState(error=e)))
+            else:
+                callback(result)
+            return False
+        run_in_background(target).add_done_callback(
+            lambda future: GLib.idle_add(finish, future),
+        )
+
+    def start(self):
+        # Rounds are started from idle callbacks, which may run within other
+        # spans (such as the dialog's), so their parent is set explicitly.
+        self.root_span = self.rc.tracer.current
+
+        def first_solver():
+            solver = self.rc.first_solver()
+            return (solver, state_from_solver(solver))
+        self.in_background(first_solver, self.set_solver_state)
+
+    def set_solver_state(self, result):
+        solver, state = result
+        self.set_solver(solver)
+        self.next(SetState(state))
+
     def dispatch_dynamic(self, msg):
         if type(msg) is FinishChallenge:
             if self.store.state.num_waiting <= 0:
@@ -509,10 +735,13 @@ class SolverMiddleware:
             self.next(msg)
 
     def dynamic_select_tile(self, msg: SelectTile):
+        solver = self.solver
+
         def select_tile():
             with self._select_tile_lock:
-                tile = self.solver.select_tile(msg.index)
+                return solver.select_tile(msg.index)
 
+        def replace_after_delay(tile):
             def replace():
                 self.next(ReplaceTile(index=msg.index, image=tile.image))
                 return False
@@ -521,7 +750,8 @@ class SolverMiddleware:
         self.next(ReplaceTile(index=msg.index, image=None))
         if self.store.state.num_waiting <= 0:
             raise RuntimeError("num_waiting should be greater than 0")
-        threading.Thread(target=select_tile, daemon=True).start()
+        # Other tiles can still be selected while this one loads.
+        self.in_background(select_tile, replace_after_delay, loading=False)
 
     def dispatch_multicaptcha(self, msg):
         if type(msg) is FinishChallenge:
@@ -530,7 +760,14 @@ class SolverMiddleware:
             self.next(msg)
 
     def multicaptcha_finish(self):
-        result = self.solver.select_indices(self.store.state.indices)
+        solver = self.solver
+        indices = self.store.state.indices
+        self.in_background(
+            lambda: solver.select_indices(indices),
+            self.multicaptcha_result,
+        )
+
+    def multicaptcha_result(self, result):
         if isinstance(result, Solution):
             self.send_solution(result)
         elif isinstance(result, ImageGridChallenge):
@@ -538,13 +775,26 @@ class SolverMiddleware:
         else:
             raise TypeError("Unexpected type: {}".format(type(result)))
 
+    def set_solver(self, solver: Optional[Solver]):
+        if self.round_span is not None:
+            self.round_span.end()
+            self.round_span = None
+        self.solver = solver
+        if solver is not None:
+            self.round_span = self.rc.tracer.span(
+                "round", PHASE_SOLVE, parent=self.root_span,
+                solver=type(solver).__name__,
+            )
+
     def send_solution(self, solution: Solution):
-        self.solver = None
-        result = self.rc.send_solution(solution)
-        if not isinstance(result, str):
-            self.solver = result
-            result = state_from_solver(result)
-        self.next(SetState(result))
+        self.set_solver(None)
+
+        def send():
+            result = self.rc.send_solution(solution)
+            if isinstance(result, str):
+                return (None, result)
+            return (result, state_from_solver(result))
+        self.in_background(send, self.set_solver_state)
 
 
 class WarningMiddleware:
@@ -568,13 +818,13 @@ class WarningMiddleware:
 
 class DynamicState(namedtuple("DynamicState", [
     "challenge",  # Challenge
-    "tile_images",  # List[Optional[Image.Image]]
+    "tile_images",  # List[Optional[TileImage]]
     "num_waiting",  # int
 ])):
     @classmethod
     def from_new_solver(cls, solver: Solver):
         challenge = solver.get_challenge()
-        tiles = list(tiles_from_image(challenge.image, challenge.dimensions))
+        tiles = tiles_from_challenge(challenge)
         return cls(
             challenge=challenge,
             tile_images=tiles,
@@ -584,7 +834,7 @@ class DynamicState(namedtuple("DynamicState", [
     def replace_tile(
         self,
         index: int,
-        image: Optional[Image.Image],
+        image: Optional[LazyImage],
     ) -> "DynamicState":
         old_image = self.tile_images[index]
         num_waiting = self.num_waiting
@@ -612,7 +862,7 @@ class MultiCaptchaState(namedtuple("MultiCaptchaState", [
 
     @classmethod
     def from_challenge(cls, challenge: ImageGridChallenge):
-        tiles = list(tiles_from_image(challenge.image, challenge.dimensions))
+        tiles = tiles_from_challenge(challenge)
         return cls(
             challenge=challenge,
             tile_images=tiles,
@@ -648,7 +898,25 @@ class MultiCaptchaState(namedtuple("MultiCaptchaState", [
 
 SOLVER_STATE_TYPES = (MultiCaptchaState, DynamicState)
 SolverState = Union[SOLVER_STATE_TYPES]
-State = Union[SolverState, str, None]
+
+
+class LoadingState(namedtuple("LoadingState", [
+    "previous",  # Optional[SolverState]
+])):
+    """Waiting for a response from the server. The previous challenge stays
+    on screen, but can't be interacted with.
+    """
+    def reduce(self, msg) -> "State":
+        if type(msg) is SetNextChallenge:
+            return self.previous.reduce(msg)
+        return self
+
+
+ErrorState = namedtuple("ErrorState", [
+    "error",  # Exception
+])
+
+State = Union[SolverState, LoadingState, ErrorState, str, None]
 
 
 class ImageGridChallengePres:
@@ -683,6 +951,10 @@ class ImageGridChallengePres:
     def is_verify_enabled(self) -> bool:
         return True
 
+    @property
+    def is_loading(self) -> bool:
+        return False
+
 
 class DynamicPres(ImageGridChallengePres):
     def __init__(self, state: DynamicState):
@@ -750,11 +1022,51 @@ class MultiCaptchaPres(ImageGridChallengePres):
             yield MultiCaptchaTilePres(index=i, image=image, selected=selected)
 
 
+class LoadingPres(ImageGridChallengePres):
+    def __init__(self, state: LoadingState):
+        super().__init__(state)
+        self.previous = pres(state.previous)
+
+    @property
+    def dimensions(self) -> Optional[GridDimensions]:
+        return self.previous and self.previous.dimensions
+
+    @property
+    def goal(self) -> str:
+        if self.previous is None:
+            return "Loading challenge..."
+        return self.previous.goal
+
+    def same_goal(self, other) -> bool:
+        return (
+            type(self) is type(other) and
+            self.state.previous is other.state.previous
+        )
+
+    @property
+    def verify_label(self) -> str:
+        return "Loading..."
+
+    @property
+    def is_verify_enabled(self) -> bool:
+        return False
+
+    @property
+    def is_loading(self) -> bool:
+        return True
+
+    @property
+    def tiles(self) -> Iterable["TilePres"]:
+        if self.previous is None:
+            return []
+        return self.previous.tiles
+
+
 class TilePres:
     index: int
-    image: Image.Image
+    image: TileImage
 
-    def __init__(self, index: int, image: Image.Image):
+    def __init__(self, index: int, image: TileImage):
         self.index = index
         self.image = image
 
@@ -0,0 +1,325 @@
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+"""A small on-disk HTTP cache for the scripts that librecaptcha downloads
+(api.js and recaptcha__en.js). Responses are stored with their validators
+(``ETag`` and ``Last-Modified``) and revalidated with conditional requests,
+so an unchanged script costs a 304 response instead of a full download.
+
+`HttpCache.download()` streams large responses to disk, and resumes
+interrupted downloads with ``Range`` requests.
+"""
+
+from .logs import HTTP_LOG
+from .retry import DEFAULT_RETRY, RetryPolicy
+from .timeouts import Deadline, check, deadline_errors, limit
+from .transport import CHUNK_SIZE, Response, StreamingResponse
+from .typing import Dict
+
+from collections import namedtuple
+from email.message import Message
+from typing import BinaryIO, Optional
+import json
+import os
+import os.path
+import re
+import requests
+import shutil
+import zlib
+
+
+def import_brotli():
+    # `requests` and `httpx` can decode Brotli only if one of these packages
+    # is installed.
+    for module in ["brotli", "brotlicffi"]:
+        try:
+            return __import__(module)
+        except ImportError:
+            continue
+    return None
+
+
+brotli = import_brotli()
+ACCEPT_ENCODING = "gzip" if brotli is None else "br, gzip"
+# Headers saved with cached responses.
+SAVED_HEADERS = ["ETag", "Last-Modified", "Content-Type"]
+
+
+def decode_file(src: BinaryIO, dst: BinaryIO, encoding: Optional[str]):
+    """Copies `src` to `dst`, undoing the ``Content-Encoding`` `encoding`."""
+    if encoding in (None, "identity"):
+        shutil.copyfileobj(src, dst)
+        return
+    if encoding == "gzip":
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        decompress, flush = decompressor.decompress, decompressor.flush
+    elif encoding == "br" and brotli is not None:
+        decompressor = brotli.Decompressor()
+        decompress, flush = decompressor.process, bytes
+    else:
+        raise ValueError("Unsupported Content-Encoding: {}".format(encoding))
+    for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+        dst.write(decompress(chunk))
+    dst.write(flush())
+
+
+def get_charset(content_type: str) -> str:
+    message = Message()
+    message["Content-Type"] = content_type
+    return message.get_content_charset() or "utf-8"
+
+
+def range_start(r: StreamingResponse) -> Optional[int]:
+    match = re.match(r"bytes (\d+)-", r.headers.get("Content-Range", ""))
+    return None if match is None else int(match.group(1))
+
+
+class ResumeError(requests.ConnectionError):
+    """The server didn't resume a partial download as requested. The partial
+    download is discarded, so retrying starts over.
+    """
+
+
+BodyFile = namedtuple("BodyFile", [
+    "path",  # str, the file that contains the decoded response body
+    "encoding",  # str, the character encoding of the body
+])
+
+
+class HttpCache:
+    """Caches one response per name in `directory`. A response is only
+    reused for the URL it was downloaded from, so caching a new release of a
+    script replaces the previous one.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, name: str, ext: str) -> str:
+        return os.path.join(self.directory, "{}.{}".format(name, ext))
+
+    def _load(self, name: str, url: str) -> Optional[Dict[str, str]]:
+        try:
+            with open(self._path(name, "json")) as f:
+                meta = json.load(f)
+        except (OSError, ValueError) as e:
+            HTTP_LOG.debug("[cache] No entry for %s: %s", name, e)
+            return None
+        if meta.get("url") != url:
+            return None
+        return meta
+
+    def _save(self, name: str, url: str, r: Response):
+        meta = {"url": url}
+        for header in SAVED_HEADERS:
+            if header in r.headers:
+                meta[header] = r.headers[header]
+        if "ETag" not in meta and "Last-Modified" not in meta:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._store(name, meta, lambda f: f.write(r.content))
+
+    def _store(self, name: str, meta: Dict[str, str], write_body):
+        # The old metadata is removed first and the new metadata is written
+        # last, so that metadata never refers to a different body.
+        self._remove(name, "json")
+        for ext, write, mode in [
+            ("body", write_body, "wb"),
+            ("json", lambda f: json.dump(meta, f), "w"),
+        ]:
+            path = self._path(name, ext)
+            tmp_path = "{}.{}.tmp".format(path, os.getpid())
+            with open(tmp_path, mode) as f:
+                write(f)
+            os.replace(tmp_path, path)
+
+    def _remove(self, name: str, ext: str):
+        try:
+            os.remove(self._path(name, ext))
+        except FileNotFoundError:
+            pass
+
+    def _read_body(self, name: str) -> Optional[bytes]:
+        try:
+            with open(self._path(name, "body"), "rb") as f:
+                return f.read()
+        except OSError as e:
+            HTTP_LOG.debug("[cache] Could not read %s: %s", name, e)
+            return None
+
+    def get(self, transport, name: str, url: str,
+            headers: Optional[Dict[str, str]] = None, timeout=None,
+            retry: RetryPolicy = DEFAULT_RETRY,
+            deadline: Optional[Deadline] = None) -> Response:
+        """Downloads `url` with `transport`, or reuses the cached response
+        stored under `name` if the server says it hasn't changed. `timeout`
+        (a `librecaptcha.timeouts.Timeout`) is passed to
+        `transport.request()`, and failed requests are retried according to
+        `retry`. If `deadline` is provided, requests are limited by it; see
+        `librecaptcha.timeouts`.
+        """
+        def send(headers):
+            with deadline_errors(deadline):
+                r = retry.call(lambda attempt: transport.request(
+                    "GET", url, headers=headers,
+                    timeout=limit(timeout, deadline),
+                ), deadline)
+            check(deadline)
+            return r
+
+        headers = dict(headers or {}, **{"Accept-Encoding": ACCEPT_ENCODING})
+        conditional = dict(headers)
+        meta = self._load(name, url)
+        if meta is not None:
+            if "ETag" in meta:
+                conditional["If-None-Match"] = meta["ETag"]
+            if "Last-Modified" in meta:
+                conditional["If-Modified-Since"] = meta["Last-Modified"]
+
+        r = send(conditional)
+        if r.status_code == 304 and meta is not None:
+            content = self._read_body(name)
+            if content is not None:
+                HTTP_LOG.debug("[cache] %s not modified", name)
+                return Response(
+                    url=r.url,
+                    status_code=200,
+                    headers={"Content-Type": meta.get("Content-Type", "")},
+                    content=content,
+                    ttfb=r.ttfb,
+                    bytes_out=r.bytes_out,
+                    http_version=r.http_version,
+                )
+            r = send(headers)
+
+        r.raise_for_status()
+        try:
+            self._save(name, url, r)
+        except OSError as e:
+            HTTP_LOG.debug("[cache] Could not save %s: %s", name, e)
+        return r
+
+    def download(self, transport, name: str, url: str,
+                 headers: Optional[Dict[str, str]] = None, timeout=None,
+                 retry: RetryPolicy = DEFAULT_RETRY,
+                 deadline: Optional[Deadline] = None) -> BodyFile:
+        """Like `get()`, but streams the response body to a file instead of
+        keeping it in memory, and returns that file. The body is written to
+        ``<name>.part`` as it arrives; if the download is interrupted, the
+        next attempt (whether a retry or in a later run) continues from the
+        end of that file with a ``Range`` request. The deadline is checked
+        after each chunk, so a server that sends data slowly can't keep the
+        download going past it.
+        """
+        headers = dict(headers or {}, **{"Accept-Encoding": ACCEPT_ENCODING})
+        meta = self._load(name, url)
+        if meta is not None and not os.path.exists(self._path(name, "body")):
+            meta = None
+        with deadline_errors(deadline):
+            r = retry.call(lambda attempt: self._download_part(
+                transport, name, url, headers, meta, timeout, deadline,
+            ), deadline)
+        if r.status_code == 304 and meta is not None:
+            HTTP_LOG.debug("[cache] %s not modified", name)
+        else:
+            r.raise_for_status()
+            meta = self._finish_part(name)
+        return BodyFile(
+            path=self._path(name, "body"),
+            encoding=get_charset(meta.get("Content-Type", "")),
+        )
+
+    def _load_part(self, name: str, url: str) -> Optional[Dict[str, str]]:
+        try:
+            with open(self._path(name, "part.json")) as f:
+                meta = json.load(f)
+            size = os.path.getsize(self._path(name, "part"))
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url:
+            return None
+        return dict(meta, size=size)
+
+    def _download_part(self, transport, name: str, url: str,
+                       headers: Dict[str, str],
+                       meta: Optional[Dict[str, str]], timeout,
+                       deadline: Optional[Deadline]) -> StreamingResponse:
+        headers = dict(headers)
+        if meta is not None:
+            if "ETag" in meta:
+                headers["If-None-Match"] = meta["ETag"]
+            if "Last-Modified" in meta:
+                headers["If-Modified-Since"] = meta["Last-Modified"]
+
+        part = self._load_part(name, url)
+        offset = 0 if part is None else part["size"]
+        validator = None
+        if part is not None:
+            validator = part.get("ETag")
+            # Weak entity tags can't be used with "If-Range".
+            if validator is None or validator.startswith("W/"):
+                validator = part.get("Last-Modified")
+        if offset > 0 and validator:
+            headers["Range"] = "bytes={}-".format(offset)
+            headers["If-Range"] = validator
+
+        with transport.stream(
+            "GET", url, headers=headers, timeout=limit(timeout, deadline),
+        ) as r:
+            if r.status_code == 200:
+                os.makedirs(self.directory, exist_ok=True)
+                part = {"url": url}
+                for header in SAVED_HEADERS + ["Content-Encoding"]:
+                    if header in r.headers:
+                        part[header] = r.headers[header]
+                with open(self._path(name, "part.json"), "w") as f:
+                    json.dump(part, f)
+                mode = "wb"
+            elif r.status_code in (206, 416) and "Range" in headers:
+                # A 416 response means the partial download is longer than
+                # the body; it has no range start.
+                if range_start(r) != offset:
+                    self._remove(name, "part.json")
+                    raise ResumeError(
+                        "Could not resume download of {}".format(url),
+                    )
+                HTTP_LOG.debug(
+                    "[cache] Resuming %s at byte %d", name, offset,
+                )
+                mode = "ab"
+            else:
+                return r
+            with open(self._path(name, "part"), mode) as f:
+                for chunk in r.chunks:
+                    f.write(chunk)
+                    check(deadline)
+            return r
+
+    def _finish_part(self, name: str) -> Dict[str, str]:
+        """Decodes the completed download in ``<name>.part`` and stores it
+        as the cached response.
+        """
+        with open(self._path(name, "part.json")) as f:
+            part = json.load(f)
+        meta = {k: v for k, v in part.items() if k in ["url"] + SAVED_HEADERS}
+
+        def write_body(dst):
+            with open(self._path(name, "part"), "rb") as src:
+                decode_file(src, dst, part.get("Content-Encoding"))
+        self._store(name, meta, write_body)
+        self._remove(name, "part.json")
+        self._remove(name, "part")
+        return meta
@@ -15,10 +15,15 @@
 # You should have received a copy of the GNU General Public License
 # along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
 
-from . import cli
+from . import cli, daemon
 from .errors import ChallengeBlockedError, UnknownChallengeError
 from .errors import GtkImportError
-from .recaptcha import ReCaptcha
+from .metrics import MetricsFile
+from .recaptcha import ReCaptcha, make_transport
+from .timeouts import Deadline
+from .tracing import Tracer
+
+from typing import Optional
 
 __version__ = "0.7.4-dev"
 
@@ -67,14 +72,45 @@ def get_token(
     user_agent: str, *,
     gui=False,
     debug=False,
+    trace: Optional[str] = None,
+    metrics: Optional[str] = None,
+    http2=False,
+    prefetch=False,
+    rc_version: Optional[str] = None,
+    deadline: Optional[float] = None,
+    use_daemon=True,
 ) -> str:
-    ui = (_get_gui().Gui if gui else cli.Cli)(ReCaptcha(
-        api_key=api_key,
-        site_url=site_url,
-        user_agent=user_agent,
-        debug=debug,
-    ))
+    if deadline is not None:
+        deadline = Deadline(deadline)
+    tracer = None if trace is None else Tracer()
+    metrics_file = None if metrics is None else MetricsFile(metrics)
+    client = daemon.connect(http2=http2) if use_daemon else None
+    if client is None:
+        transport = make_transport(http2)
+    else:
+        transport = daemon.DaemonTransport(client)
+
     try:
+        goal_finder = None
+        if client is not None:
+            if rc_version is None:
+                rc_version = client.get_rc_version(
+                    user_agent, daemon.lookup_timeout(deadline),
+                )
+            goal_finder = client.goal_finder(user_agent, rc_version, deadline)
+        ui = (_get_gui().Gui if gui else cli.Cli)(ReCaptcha(
+            api_key=api_key,
+            site_url=site_url,
+            user_agent=user_agent,
+            debug=debug,
+            tracer=tracer,
+            on_request=metrics_file,
+            prefetch=prefetch,
+            transport=transport,
+            rc_version=rc_version,
+            deadline=deadline,
+            goal_finder=goal_finder,
+        ))
         return ui.run()
     except ChallengeBlockedError as e:
         print(CHALLENGE_BLOCKED_MESSAGE.format(e.challenge_type))
@@ -82,3 +118,9 @@ def get_token(
     except UnknownChallengeError as e:
         print(UNKNOWN_CHALLENGE_MESSAGE.format(e.challenge_type))
         raise
+    finally:
+        transport.close()
+        if tracer is not None:
+            tracer.export(trace)
+        if metrics_file is not None:
+            metrics_file.close()
@@ -0,0 +1,93 @@
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Loggers used by librecaptcha, one per subsystem:
+
+* ``librecaptcha.http``: requests and responses.
+* ``librecaptcha.solver``: challenge data received while solving.
+* ``librecaptcha.extract``: downloading and extracting challenge strings.
+
+Large values should be logged through `Preview`, which is only formatted if
+the message is actually emitted and is limited to `PREVIEW_LIMIT` characters.
+"""
+
+import logging
+import reprlib
+import sys
+
+HTTP_LOG = logging.getLogger("librecaptcha.http")
+SOLVER_LOG = logging.getLogger("librecaptcha.solver")
+EXTRACT_LOG = logging.getLogger("librecaptcha.extract")
+
+PREVIEW_LIMIT = 1000  # characters
+
+_repr = reprlib.Repr()
+_repr.maxlevel = 6
+_repr.maxlist = 20
+_repr.maxdict = 20
+_repr.maxstring = 200
+_repr.maxother = 200
+
+
+class Preview:
+    """A size-limited, lazily formatted representation of `value` for use as
+    a logging argument. If `text` is true, `value` should be `bytes` or `str`
+    and is shown as text; otherwise, it's shown with `repr()`-like formatting
+    that never formats more than a bounded part of nested structures.
+    """
+    __slots__ = ["value", "text"]
+
+    def __init__(self, value, text=False):
+        self.value = value
+        self.text = text
+
+    def __str__(self):
+        value = self.value
+        if not self.text:
+            return _truncate(_repr.repr(value), None)
+        if isinstance(value, (bytes, bytearray)):
+            preview = bytes(value[:PREVIEW_LIMIT])
+            preview = preview.decode("utf-8", "replace")
+        else:
+            preview = value[:PREVIEW_LIMIT]
+        return _truncate(preview, len(value))
+
+
+def _truncate(preview: str, length) -> str:
+    if length is None:
+        length = len(preview)
+    if length <= PREVIEW_LIMIT:
+        return preview
+    return "{}... [{} total]".format(preview[:PREVIEW_LIMIT], length)
+
+
+_debug_handler = None
+
+
+def enable_debug_logging():
+    """Shows all librecaptcha debug messages on standard error. This is what
+    the ``debug`` option does; applications that configure `logging`
+    themselves don't need it.
+    """
+    global _debug_handler
+    if _debug_handler is not None:
+        return
+    _debug_handler = logging.StreamHandler(sys.stderr)
+    _debug_handler.setFormatter(logging.Formatter("[%(name)s] %(message)s"))
+    logger = logging.getLogger("librecaptcha")
+    logger.addHandler(_debug_handler)
+    logger.setLevel(logging.DEBUG)
@@ -0,0 +1,194 @@
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Metrics for the HTTP requests made while solving. `ReCaptcha` calls its
+``on_request`` hook with a `RequestEvent` after each request, including
+failed ones and retries, and the sinks here record them:
+
+* `JsonLinesSink` writes each event as a line of JSON.
+* `PrometheusSink` aggregates events into counters and histograms in the
+  Prometheus text format, e.g., for node_exporter's textfile collector.
+
+`MetricsFile` picks one of these based on the name of the file it writes.
+"""
+
+from collections import defaultdict, namedtuple
+from typing import TextIO
+import json
+import os
+import threading
+
+# Upper bounds of the request duration histogram buckets, in seconds.
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+PROMETHEUS_SUFFIX = ".prom"
+
+RequestEvent = namedtuple("RequestEvent", [
+    "endpoint",  # str, e.g. "reload" or "payload"
+    "method",  # str, "GET" or "POST"
+    "status",  # Optional[int], or None if no response was received
+    "error",  # Optional[str], the exception type if the request failed
+    "start",  # float, Unix time at which the request was sent
+    "ttfb",  # Optional[float], seconds until the response headers arrived
+    "total",  # float, seconds until the response body was read
+    "bytes_out",  # int, size of the request body
+    "bytes_in",  # int, size of the response body
+    "attempt",  # int, 1 for the first attempt, 2 for the first retry, etc.
+])
+# Note: `requests` doesn't expose DNS, connect, or TLS handshake timings
+# separately; they are included in `ttfb`.
+
+
+class JsonLinesSink:
+    """Writes each `RequestEvent` to `file` as a line of JSON."""
+    def __init__(self, file: TextIO):
+        self.file = file
+        self.lock = threading.Lock()
+
+    def __call__(self, event: RequestEvent):
+        line = json.dumps(event._asdict(), separators=",:")
+        with self.lock:
+            print(line, file=self.file, flush=True)
+
+
+class PrometheusSink:
+    """Aggregates `RequestEvent`s into metrics in the Prometheus text
+    exposition format. Use `render()` to get the metrics, or `write()` to
+    save them for node_exporter's textfile collector.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Keyed by (endpoint, method, status).
+        self.requests = defaultdict(int)
+        # The following are keyed by endpoint.
+        self.bytes_out = defaultdict(int)
+        self.bytes_in = defaultdict(int)
+        self.retries = defaultdict(int)
+        self.ttfb_sum = defaultdict(float)
+        self.ttfb_count = defaultdict(int)
+        self.duration_sum = defaultdict(float)
+        self.duration_count = defaultdict(int)
+        self.duration_buckets = defaultdict(
+            lambda: [0] * len(DURATION_BUCKETS),
+        )
+
+    def __call__(self, event: RequestEvent):
+        endpoint = event.endpoint
+        status = str(event.status) if event.status is not None else "error"
+        with self.lock:
+            self.requests[(endpoint, event.method, status)] += 1
+            self.bytes_out[endpoint] += event.bytes_out
+            self.bytes_in[endpoint] += event.bytes_in
+            if event.attempt > 1:
+                self.retries[endpoint] += 1
+            if event.ttfb is not None:
+                self.ttfb_sum[endpoint] += event.ttfb
+                self.ttfb_count[endpoint] += 1
+            self.duration_sum[endpoint] += event.total
+            self.duration_count[endpoint] += 1
+            buckets = self.duration_buckets[endpoint]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if event.total <= bound:
+                    buckets[i] += 1
+
+    def render(self) -> str:
+        lines = []
+
+        def metric(name, type, help):
+            lines.append("# HELP {} {}".format(name, help))
+            lines.append("# TYPE {} {}".format(name, type))
+
+        def sample(name, labels, value):
+            label_str = ",".join(
+                '{}="{}"'.format(k, v) for k, v in labels.items()
+            )
+            lines.append("{}{{{}}} {}".format(name, label_str, value))
+
+        with self.lock:
+            name = "librecaptcha_http_requests_total"
+            metric(name, "counter", "HTTP requests sent.")
+            for (endpoint, method, status), n in self.requests.items():
+                sample(name, {
+                    "endpoint": endpoint, "method": method, "status": status,
+                }, n)
+
+            name = "librecaptcha_http_request_duration_seconds"
+            metric(name, "histogram", "Total HTTP request duration.")
+            for endpoint, buckets in self.duration_buckets.items():
+                for bound, n in zip(DURATION_BUCKETS, buckets):
+                    sample(name + "_bucket", {
+                        "endpoint": endpoint, "le": bound,
+                    }, n)
+                count = self.duration_count[endpoint]
+                sample(name + "_bucket", {
+                    "endpoint": endpoint, "le": "+Inf",
+                }, count)
+                sample(name + "_sum", {"endpoint": endpoint},
+                       self.duration_sum[endpoint])
+                sample(name + "_count", {"endpoint": endpoint}, count)
+
+            name = "librecaptcha_http_ttfb_seconds"
+            metric(name, "summary", "Time until response headers arrived.")
+            for endpoint, total in self.ttfb_sum.items():
+                sample(name + "_sum", {"endpoint": endpoint}, total)
+                sample(name + "_count", {"endpoint": endpoint},
+                       self.ttfb_count[endpoint])
+
+            for name, help, values in [
+                ("librecaptcha_http_sent_bytes_total",
+                 "HTTP request body bytes sent.", self.bytes_out),
+                ("librecaptcha_http_received_bytes_total",
+                 "HTTP response body bytes received.", self.bytes_in),
+                ("librecaptcha_http_retries_total",
+                 "HTTP requests that were retries of failed requests.",
+                 self.retries),
+            ]:
+                metric(name, "counter", help)
+                for endpoint, n in values.items():
+                    sample(name, {"endpoint": endpoint}, n)
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """Atomically writes the metrics to `path`."""
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+class MetricsFile:
+    """Saves `RequestEvent`s to `path`. If `path` ends with ``.prom``, the
+    metrics are written in the Prometheus text format when the file is closed;
+    otherwise, each event is appended to it as a line of JSON.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+        if path.endswith(PROMETHEUS_SUFFIX):
+            self.sink = PrometheusSink()
+        else:
+            self.file = open(path, "a")
+            self.sink = JsonLinesSink(self.file)
+
+    def __call__(self, event: RequestEvent):
+        self.sink(event)
+
+    def close(self):
+        if self.file is None:
+            self.sink.write(self.path)
+        else:
+            self.file.close()
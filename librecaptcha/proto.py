@@ -0,0 +1,204 @@
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+"""A minimal Protocol Buffers encoder and decoder. Messages are described
+with `Schema`, which precomputes the tag bytes of each field; `decode_fields()`
+can decode any message, which is useful for debugging.
+"""
+
+from .typing import Dict, Iterable, List, Tuple
+
+from collections import namedtuple
+from typing import Any, Union
+import struct
+
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_LENGTH_DELIMITED = 2
+WIRE_FIXED32 = 5
+
+TYPE_VARINT = "varint"
+TYPE_STRING = "string"
+TYPE_BYTES = "bytes"
+
+WIRE_TYPES = {
+    TYPE_VARINT: WIRE_VARINT,
+    TYPE_STRING: WIRE_LENGTH_DELIMITED,
+    TYPE_BYTES: WIRE_LENGTH_DELIMITED,
+}
+
+# Encoded varints for 0 to 127, which are a single byte.
+_SMALL_VARINTS = [bytes([n]) for n in range(128)]
+_pack_two_bytes = struct.Struct("BB").pack
+
+
+def encode_varint(n: int) -> bytes:
+    if 0 <= n < 128:
+        return _SMALL_VARINTS[n]
+    if n < 0:
+        raise ValueError("n must be nonnegative")
+    if n < 1 << 14:
+        return _pack_two_bytes((n & 127) | 128, n >> 7)
+    result = bytearray()
+    while n >= 128:
+        result.append((n & 127) | 128)
+        n >>= 7
+    result.append(n)
+    return bytes(result)
+
+
+def decode_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    """Decodes the varint at `pos` in `data`. Returns the value and the
+    position after the varint.
+    """
+    try:
+        b = data[pos]
+        if b < 128:
+            return (b, pos + 1)
+        result = 0
+        shift = 0
+        while b >= 128:
+            result |= (b & 127) << shift
+            shift += 7
+            pos += 1
+            b = data[pos]
+        return (result | (b << shift), pos + 1)
+    except IndexError:
+        raise ValueError("Truncated varint") from None
+
+
+def encode_tag(number: int, wire_type: int) -> bytes:
+    return encode_varint((number << 3) | wire_type)
+
+
+def decode_fields(
+    data: bytes,
+) -> Iterable[Tuple[int, int, Union[int, bytes]]]:
+    """Yields the field number, wire type, and raw value of each field in
+    the message `data`. Fixed-size values are returned as bytes.
+    """
+    pos = 0
+    end = len(data)
+    while pos < end:
+        key, pos = decode_varint(data, pos)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == WIRE_VARINT:
+            value, pos = decode_varint(data, pos)
+        elif wire_type == WIRE_LENGTH_DELIMITED:
+            length, pos = decode_varint(data, pos)
+            value = data[pos:pos + length]
+            pos += length
+        elif wire_type in (WIRE_FIXED64, WIRE_FIXED32):
+            size = 8 if wire_type == WIRE_FIXED64 else 4
+            value = data[pos:pos + size]
+            pos += size
+        else:
+            raise ValueError("Unsupported wire type: {}".format(wire_type))
+        if pos > end:
+            raise ValueError("Truncated field: {}".format(number))
+        yield (number, wire_type, value)
+
+
+class Field(namedtuple("Field", [
+    "number",  # int
+    "name",  # str
+    "type",  # str, one of the TYPE_* constants
+    "tag",  # bytes
+])):
+    def __new__(cls, number: int, name: str, type: str):
+        tag = encode_tag(number, WIRE_TYPES[type])
+        return super().__new__(cls, number, name, type, tag)
+
+
+class Schema:
+    """A message type with the given fields. Only non-repeated fields of the
+    types in `WIRE_TYPES` are supported.
+    """
+    def __init__(self, name: str, fields: List[Field]):
+        self.name = name
+        self.fields = fields
+        self.by_name = {field.name: field for field in fields}
+        self.by_number = {field.number: field for field in fields}
+        # What `encode()` needs to know about each field, looked up once.
+        self._encoders = [(
+            field.name, field.tag,
+            field.type == TYPE_VARINT, field.type == TYPE_STRING,
+        ) for field in fields]
+
+    def encode(self, **values) -> bytes:
+        """Encodes a message. Fields whose value is ``None`` or missing are
+        omitted.
+        """
+        parts = []
+        for name, tag, is_varint, is_string in self._encoders:
+            value = values.pop(name, None)
+            if value is None:
+                continue
+            if is_varint:
+                parts += (tag, encode_varint(value))
+                continue
+            if is_string:
+                value = value.encode()
+            parts += (tag, encode_varint(len(value)), value)
+        if values:
+            raise TypeError("Unknown fields for {}: {}".format(
+                self.name, ", ".join(sorted(values)),
+            ))
+        return b"".join(parts)
+
+    def decode(self, data: bytes) -> Dict[Union[str, int], Any]:
+        """Decodes a message into a dict keyed by field name. Fields not in
+        the schema are keyed by number.
+        """
+        result = {}
+        for number, wire_type, value in decode_fields(data):
+            field = self.by_number.get(number)
+            if field is None or WIRE_TYPES[field.type] != wire_type:
+                result[number] = value
+                continue
+            if field.type == TYPE_STRING:
+                value = bytes(value).decode("utf-8", "replace")
+            result[field.name] = value
+        return result
+
+
+class Inspect:
+    """Lazily decodes the message `data` when formatted, for use as a logging
+    argument.
+    """
+    __slots__ = ["data", "schema"]
+
+    def __init__(self, data: bytes, schema: Schema):
+        self.data = data
+        self.schema = schema
+
+    def __str__(self):
+        try:
+            fields = self.schema.decode(self.data)
+        except ValueError as e:
+            return "<invalid {} message: {}>".format(self.schema.name, e)
+        return "{}{!r}".format(self.schema.name, fields)
+
+
+# The message sent to the "reload" endpoint. Note: We're not sending fields
+# 3, 5, and 16.
+RELOAD = Schema("reload", [
+    Field(1, "rc_version", TYPE_STRING),
+    Field(2, "token", TYPE_STRING),
+    Field(6, "reason", TYPE_STRING),
+    Field(14, "api_key", TYPE_STRING),
+])
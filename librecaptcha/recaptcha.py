@@ -15,17 +15,30 @@
 # You should have received a copy of the GNU General Public License
 # along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
 
-from .errors import ChallengeBlockedError, UnknownChallengeError
+from . import cachedirs, proto, stringtable
+from .errors import ChallengeBlockedError
+from .errors import UnknownChallengeError
 from .errors import SiteUrlParseError
 from .extract_strings import extract_and_save
-from .typing import Dict, Iterable, List, Tuple
+from .httpcache import HttpCache
+from .logs import EXTRACT_LOG, HTTP_LOG, SOLVER_LOG
+from .logs import Preview, enable_debug_logging
+from .metrics import RequestEvent
+from .retry import DEFAULT_RETRY, RetryPolicy
+from .stringtable import Strings
+from .timeouts import DEFAULT_TIMEOUTS, SCRIPTS, Deadline, Timeout
+from .timeouts import check, deadline_errors, endpoint_class, limit
+from .tracing import NullTracer, Tracer
+from .tracing import PHASE_DECODE, PHASE_NETWORK, PHASE_SOLVE
+from .transport import Http2Transport, RequestsTransport, Response
+from .typing import Callable, Dict, Tuple
 
 from PIL import Image
-import requests
 
-from collections import namedtuple
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future
 from html.parser import HTMLParser
-from typing import Optional, Union
+from typing import Optional, TypeVar, Union
 from urllib.parse import urlparse
 import base64
 import io
@@ -34,6 +47,7 @@ import os
 import os.path
 import re
 import sys
+import threading
 import time
 
 BASE_URL = "https://www.google.com/recaptcha/api2/"
@@ -43,13 +57,19 @@ https://www.gstatic.com/recaptcha/releases/{}/recaptcha__en.js
 """[:-1]
 
 STRINGS_VERSION = "0.1.0"
-STRINGS_PATH = os.path.join(
-    os.path.expanduser("~"), ".cache", "librecaptcha", "cached-strings",
-)
+STRINGS_NAME = "cached-strings"
+RC_VERSION_NAME = "rc-version"
+HTTP_CACHE_NAME = "http"
+RC_VERSION_TTL = 24 * 60 * 60  # seconds
 
 DYNAMIC_SELECT_DELAY = 4.5  # seconds
+# The highest indices that are read from "rresp" and "dresp" responses.
+RRESP_MAX_INDEX = 9
+DRESP_MAX_INDEX = 5
 FIND_GOAL_SEARCH_DISTANCE = 10
 
+T = TypeVar("T")
+
 
 def get_testing_url(url: str) -> str:
     return urlparse(url)._replace(
@@ -58,7 +78,8 @@ def get_testing_url(url: str) -> str:
     ).geturl()
 
 
-if os.getenv("LIBRECAPTCHA_USE_TEST_SERVER"):
+USE_TEST_SERVER = bool(os.getenv("LIBRECAPTCHA_USE_TEST_SERVER"))
+if USE_TEST_SERVER:
     BASE_URL = get_testing_url(BASE_URL)
     API_JS_URL = get_testing_url(API_JS_URL)
     JS_URL_TEMPLATE = get_testing_url(JS_URL_TEMPLATE)
@@ -91,8 +112,46 @@ def rc_base64(string: str) -> str:
     return base64.b64encode(data, b"-_").decode().replace("=", ".")
 
 
-def load_rc_json(text: str):
-    return json.loads(text.split("\n", 1)[1])
+JSON_DECODER = json.JSONDecoder()
+JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def load_rc_json(data: Union[bytes, str], max_index: Optional[int] = None):
+    """Parses a JSON response that starts with an XSSI prefix (a line such as
+    ``)]}'``). The JSON is parsed where it starts instead of being sliced out,
+    but `bytes` are still decoded in full. If `max_index` is provided, the
+    response must be a JSON array, and parsing stops after the element at
+    that index; later elements are left out of the result.
+    """
+    text = data.decode() if isinstance(data, bytes) else data
+    index = text.index("\n") + 1
+
+    def skip_whitespace():
+        nonlocal index
+        index = JSON_WHITESPACE.match(text, index).end()
+
+    skip_whitespace()
+    if max_index is None:
+        return JSON_DECODER.raw_decode(text, index)[0]
+
+    if not text.startswith("[", index):
+        raise ValueError("Expected a JSON array at index {}".format(index))
+    index += 1
+    result = []
+    skip_whitespace()
+    if text.startswith("]", index):
+        return result
+    while len(result) <= max_index:
+        value, index = JSON_DECODER.raw_decode(text, index)
+        result.append(value)
+        skip_whitespace()
+        if text.startswith("]", index):
+            break
+        if not text.startswith(",", index):
+            raise ValueError("Expected ',' at index {}".format(index))
+        index += 1
+        skip_whitespace()
+    return result
 
 
 def get_meta(pmeta, probable_index: int):
@@ -123,69 +182,290 @@ def get_rresp(uvresp):
     return None
 
 
-def get_js_strings(user_agent: str, rc_version: str) -> List[str]:
-    def get_json():
-        with open(STRINGS_PATH) as f:
-            version, text = f.read().split("\n", 1)
-            if version != "{}/{}".format(STRINGS_VERSION, rc_version):
-                raise OSError("Incorrect version: {}".format(version))
-            return json.loads(text)
-
-    try:
-        return get_json()
-    except (OSError, ValueError, json.JSONDecodeError):
-        pass
+def make_transport(http2=False):
+    """Returns a `RequestsTransport`, or an `Http2Transport` if `http2` is
+    true. See `librecaptcha.transport`.
+    """
+    if not http2:
+        return RequestsTransport()
+    # The test server doesn't use TLS, so HTTP/2 can't be negotiated.
+    return Http2Transport(prior_knowledge=USE_TEST_SERVER)
+
+
+class StringTableCache:
+    """Keeps the most recently used string tables in memory, keyed by
+    reCAPTCHA version, so every `ReCaptcha` in the process shares one copy.
+    Safe to use from multiple threads; a table is only loaded once even if
+    several threads ask for it at the same time.
+    """
+    def __init__(self, max_size: int = 2):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.tables = OrderedDict()  # OrderedDict[str, Strings]
+        self.loading = {}  # Dict[str, threading.Lock]
+
+    def _lookup(self, rc_version: str) -> Optional[Strings]:
+        table = self.tables.get(rc_version)
+        if table is not None:
+            self.tables.move_to_end(rc_version)
+        return table
+
+    def get(self, rc_version: str, load: Callable[[], Strings]) -> Strings:
+        """Returns the table for `rc_version`, calling `load` to get it if
+        it isn't cached. The table is shared and mustn't be modified.
+        """
+        with self.lock:
+            table = self._lookup(rc_version)
+            if table is not None:
+                return table
+            load_lock = self.loading.setdefault(rc_version, threading.Lock())
+
+        with load_lock:
+            with self.lock:
+                table = self._lookup(rc_version)
+            if table is not None:
+                return table
+            table = None
+            try:
+                table = load()
+            finally:
+                # The table is stored in the same step as the load lock is
+                # removed, so no other thread can miss both and load it again.
+                with self.lock:
+                    self.loading.pop(rc_version, None)
+                    if table is not None:
+                        self.tables[rc_version] = table
+                        while len(self.tables) > self.max_size:
+                            self.tables.popitem(last=False)
+            return table
+
+    def clear(self):
+        with self.lock:
+            self.tables.clear()
+
+
+JS_STRINGS_CACHE = StringTableCache()
+
+
+def get_http_cache() -> Optional[HttpCache]:
+    """Returns the cache for downloaded scripts in the writable cache
+    directory (see `librecaptcha.cachedirs`), or ``None`` if there isn't
+    one.
+    """
+    directory = cachedirs.write_path(HTTP_CACHE_NAME)
+    return None if directory is None else HttpCache(directory)
+
+
+def get_js_strings(user_agent: str, rc_version: str, transport=None,
+                   timeout: Timeout = DEFAULT_TIMEOUTS[SCRIPTS],
+                   retry: RetryPolicy = DEFAULT_RETRY,
+                   deadline: Optional[Deadline] = None) -> Strings:
+    """Returns the strings extracted from recaptcha__en.js. They're shared
+    with other callers (see `JS_STRINGS_CACHE`) and mustn't be modified.
+    If recaptcha__en.js has to be downloaded, the download is limited by
+    `deadline`.
+    """
+    return JS_STRINGS_CACHE.get(rc_version, lambda: load_js_strings(
+        user_agent, rc_version, transport, timeout, retry, deadline,
+    ))
+
+
+def load_js_strings(user_agent: str, rc_version: str, transport=None,
+                    timeout: Timeout = DEFAULT_TIMEOUTS[SCRIPTS],
+                    retry: RetryPolicy = DEFAULT_RETRY,
+                    deadline: Optional[Deadline] = None) -> Strings:
+    for path in cachedirs.find(STRINGS_NAME):
+        try:
+            return stringtable.load(
+                path, "{}/{}".format(STRINGS_VERSION, rc_version),
+            )
+        except (OSError, ValueError) as e:
+            EXTRACT_LOG.debug("Could not use cached strings: %s", e)
 
     result = extract_and_save(
         url=JS_URL_TEMPLATE.format(rc_version),
-        path=STRINGS_PATH,
+        path=cachedirs.write_path(STRINGS_NAME),
         version=STRINGS_VERSION,
         rc_version=rc_version,
         user_agent=user_agent,
+        transport=transport,
+        cache=get_http_cache(),
+        timeout=timeout,
+        retry=retry,
+        deadline=deadline,
     )
     print(file=sys.stderr)
     return result
 
 
-def get_rc_version(user_agent: str) -> str:
-    match = re.search(r"/recaptcha/releases/(.+?)/", requests.get(
-        API_JS_URL, headers={
-            "User-Agent": user_agent,
-        },
-    ).text)
+def get_rc_version(user_agent: str, transport=None,
+                   timeout: Timeout = DEFAULT_TIMEOUTS[SCRIPTS],
+                   retry: RetryPolicy = DEFAULT_RETRY,
+                   deadline: Optional[Deadline] = None) -> str:
+    if transport is None:
+        transport = RequestsTransport()
+    headers = {"User-Agent": user_agent}
+    cache = get_http_cache()
+    if cache is None:
+        with deadline_errors(deadline):
+            r = retry.call(lambda attempt: transport.request(
+                "GET", API_JS_URL, headers=headers,
+                timeout=limit(timeout, deadline),
+            ), deadline)
+        check(deadline)
+        r.raise_for_status()
+    else:
+        r = cache.get(
+            transport, "api.js", API_JS_URL, headers=headers,
+            timeout=timeout, retry=retry, deadline=deadline,
+        )
+    match = re.search(r"/recaptcha/releases/(.+?)/", r.text)
     if match is None:
         raise RuntimeError("Could not extract version from api.js.")
     return match.group(1)
 
 
+def load_rc_version() -> Tuple[str, float]:
+    """Returns the saved reCAPTCHA version and the Unix time at which it was
+    saved, from the first cache directory that has one.
+    """
+    error = None
+    for path in cachedirs.find(RC_VERSION_NAME):
+        try:
+            with open(path) as f:
+                saved, version = f.read().split("\n", 1)
+            version = version.strip()
+            if not version:
+                raise ValueError("Empty version")
+            return (version, float(saved))
+        except (OSError, ValueError) as e:
+            error = error or e
+    raise error
+
+
+def save_rc_version(version: str):
+    path = cachedirs.write_path(RC_VERSION_NAME)
+    if path is None:
+        raise OSError("No writable cache directory")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp_path, "w") as f:
+        print(time.time(), file=f)
+        print(version, file=f)
+    os.replace(tmp_path, path)
+
+
+def get_cached_rc_version(user_agent: str, transport=None,
+                          ttl: Optional[float] = RC_VERSION_TTL,
+                          timeout: Timeout = DEFAULT_TIMEOUTS[SCRIPTS],
+                          retry: RetryPolicy = DEFAULT_RETRY,
+                          deadline: Optional[Deadline] = None) -> str:
+    """Like `get_rc_version()`, but saves the version and reuses it for `ttl`
+    seconds. After that, the saved version is still used, but a new one is
+    fetched in the background for next time; only if there's no saved
+    version does this wait for the network, limited by `deadline`. If `ttl`
+    is ``None``, the version is always fetched.
+    """
+    def fetch(deadline=None):
+        version = get_rc_version(
+            user_agent, transport, timeout, retry, deadline,
+        )
+        try:
+            save_rc_version(version)
+        except OSError as e:
+            HTTP_LOG.debug("Could not save reCAPTCHA version: %s", e)
+        return version
+
+    if ttl is None:
+        return fetch(deadline)
+    try:
+        version, saved = load_rc_version()
+    except (OSError, ValueError) as e:
+        HTTP_LOG.debug("Could not use saved reCAPTCHA version: %s", e)
+        return fetch(deadline)
+
+    if time.time() - saved >= ttl:
+        HTTP_LOG.debug("Saved reCAPTCHA version is stale; revalidating")
+
+        def revalidate():
+            try:
+                fetch()
+            except Exception as e:
+                HTTP_LOG.debug("Could not revalidate version: %s", e)
+        run_in_background(revalidate)
+    return version
+
+
 def get_image(data: bytes) -> Image.Image:
+    """Decodes an image. The result doesn't refer to `data`; callers should
+    close it once it's no longer needed.
+    """
     image = Image.open(io.BytesIO(data))
+    image.load()
     if image.mode in ["RGB", "RGBA"]:
         return image
-    return image.convert("RGB")
-
-
-def varint_encode(n: int, out: bytearray) -> bytes:
-    if n < 0:
-        raise ValueError("n must be nonnegative")
-    while True:
-        b = n & 127
-        n >>= 7
-        if n > 0:
-            out.append(b | 128)
-        else:
-            out.append(b)
-            break
-
-
-def protobuf_encode(fields: Iterable[Tuple[int, bytes]]) -> bytes:
-    result = bytearray()
-    for num, value in fields:
-        # Wire type of 2 indicates a length-delimited field.
-        varint_encode((num << 3) | 2, result)
-        varint_encode(len(value), result)
-        result += value
-    return bytes(result)
+    try:
+        return image.convert("RGB")
+    finally:
+        # Note: Unlike `close()`, exiting a `with` block doesn't free the
+        # image data in older versions of Pillow.
+        image.close()
+
+
+class LazyImage:
+    """A challenge image, kept as the compressed data it was received as.
+    It's only decoded once `decoded()` is called, so consumers that accept
+    compressed images (like `GdkPixbuf.PixbufLoader` or an image viewer) can
+    use `data` directly.
+    """
+    def __init__(self, data: bytes, tracer=None):
+        self.data = data
+        self.tracer = NullTracer() if tracer is None else tracer
+        self._image = None
+        self._lock = threading.Lock()
+
+    def decoded(self) -> Image.Image:
+        """Returns the decoded image, which belongs to this object; it's
+        closed by `close()`.
+        """
+        with self._lock:
+            if self._image is None:
+                with self.tracer.span(
+                    "decode", PHASE_DECODE, bytes=len(self.data),
+                ):
+                    self._image = get_image(self.data)
+            return self._image
+
+    def close(self):
+        with self._lock:
+            if self._image is not None:
+                self._image.close()
+                self._image = None
+
+
+def close_when_done(future: "Future[LazyImage]"):
+    """Closes the image produced by `future`, which is no longer needed."""
+    def callback(future):
+        if future.exception() is None:
+            future.result().close()
+    future.add_done_callback(callback)
+
+
+def run_in_background(func: Callable[[], T]) -> "Future[T]":
+    """Calls `func` in a daemon thread, so that it can't delay the program's
+    exit if it hangs.
+    """
+    future = Future()
+
+    def target():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(func())
+        except BaseException as e:
+            future.set_exception(e)
+    threading.Thread(target=target, daemon=True).start()
+    return future
 
 
 def format_reload_protobuf(
@@ -194,13 +474,12 @@ def format_reload_protobuf(
     reason: str,
     api_key: str,
 ) -> bytes:
-    # Note: We're not sending fields 3, 5, and 16.
-    return protobuf_encode([
-        (1, rc_version.encode()),
-        (2, token.encode()),
-        (6, reason.encode()),
-        (14, api_key.encode()),
-    ])
+    return proto.RELOAD.encode(
+        rc_version=rc_version,
+        token=token,
+        reason=reason,
+        api_key=api_key,
+    )
 
 
 class GridDimensions(namedtuple("GridDimensions", [
@@ -218,12 +497,12 @@ Solution = namedtuple("Solution", [
 
 ImageGridChallenge = namedtuple("ImageGridChallenge", [
     "goal",  # ChallengeGoal
-    "image",  # Image.Image
+    "image",  # LazyImage
     "dimensions",  # GridDimensions
 ])
 
 DynamicTile = namedtuple("DynamicTile", [
-    "image",  # Image.Image
+    "image",  # LazyImage
     "delay",  # float
 ])
 
@@ -280,13 +559,13 @@ class DynamicSolver:
         duration = max(DYNAMIC_SELECT_DELAY - elapsed, 0)
         return duration
 
-    def _first_image(self) -> Image.Image:
-        return get_image(self.rc.get("payload", params={
+    def _first_image(self) -> LazyImage:
+        return self.rc.get_payload(params={
             "p": None,
             "k": None,
-        }).content)
+        })
 
-    def _replace_tile(self, index: int) -> Image.Image:
+    def _replace_tile(self, index: int) -> LazyImage:
         real_index = self.tile_index_map[index]
         self.selections.append(real_index)
         r = self.rc.post("replaceimage", data={
@@ -296,7 +575,7 @@ class DynamicSolver:
         })
 
         self.last_request_map[index] = time.monotonic()
-        data = load_rc_json(r.text)
+        data = load_rc_json(r.content, max_index=DRESP_MAX_INDEX)
         self.latest_index += 1
         self.tile_index_map[index] = self.latest_index
 
@@ -306,11 +585,11 @@ class DynamicSolver:
 
         # The server might not return any image, but it seems unlikely in
         # practice. If it becomes a problem we can handle this case.
-        return get_image(self.rc.get("payload", params={
+        return self.rc.get_payload(params={
             "p": None,
             "k": None,
             "id": replacement_id,
-        }).content)
+        })
 
 
 class MultiCaptchaSolver:
@@ -322,6 +601,10 @@ class MultiCaptchaSolver:
         self.id = "2"
         self.metas = list(get_meta(pmeta, 5)[0])
         self.challenge_index = -1
+        # If `self.rc.prefetch` is true, the image for the next challenge is
+        # requested as soon as its "p" and "id" are known. This is a tuple of
+        # the request params and a future for the image.
+        self.prefetched = None
 
     def first_challenge(self) -> ImageGridChallenge:
         if self.challenge_index >= 0:
@@ -336,24 +619,26 @@ class MultiCaptchaSolver:
             return Solution(self.selection_groups)
         return self._get_challenge(self._replace_image())
 
-    def _get_challenge(self, image: Image.Image):
+    def _get_challenge(self, image: LazyImage):
         self.challenge_index += 1
         meta = self.metas.pop(0)
         dimensions = GridDimensions(rows=meta[3], columns=meta[4])
         goal = self.rc.get_challenge_goal(meta)
+        if self.metas and self.rc.prefetch:
+            self._prefetch_image()
         return ImageGridChallenge(
             goal=goal,
             image=image,
             dimensions=dimensions,
         )
 
-    def _first_image(self) -> Image.Image:
-        return get_image(self.rc.get("payload", params={
+    def _first_image(self) -> LazyImage:
+        return self.rc.get_payload(params={
             "c": self.rc.current_token,
             "k": self.rc.api_key,
-        }).content)
+        })
 
-    def _replace_image(self) -> Image.Image:
+    def _replace_image(self) -> LazyImage:
         selections = self.selection_groups[-1]
         r = self.rc.post("replaceimage", data={
             "v": None,
@@ -361,7 +646,7 @@ class MultiCaptchaSolver:
             "ds": json.dumps([selections], separators=",:"),
         })
 
-        data = load_rc_json(r.text)
+        data = load_rc_json(r.content, max_index=DRESP_MAX_INDEX)
         self.rc.current_token = data[1]
 
         prev_p = self.rc.current_p
@@ -369,12 +654,34 @@ class MultiCaptchaSolver:
 
         prev_id = self.id
         self.id = (data[2] or [None])[0]
+        return self._next_image(self._image_params(prev_p, prev_id))
 
-        return get_image(self.rc.get("payload", params={
-            "p": prev_p,
+    def _image_params(self, p, id):
+        return {
+            "p": p,
             "k": None,
-            "id": prev_id,
-        }).content)
+            "id": id,
+        }
+
+    def _prefetch_image(self):
+        # The next image is requested with the current "p" and "id", which
+        # are replaced when the user's selection is sent.
+        params = self._image_params(self.rc.current_p, self.id)
+        future = run_in_background(
+            lambda: self.rc.get_payload(params=dict(params)),
+        )
+        self.prefetched = (params, future)
+
+    def _next_image(self, params) -> LazyImage:
+        prefetched, self.prefetched = self.prefetched, None
+        if prefetched is not None and prefetched[0] == params:
+            try:
+                return prefetched[1].result()
+            except Exception as e:
+                SOLVER_LOG.debug("Prefetching image failed: %s", e)
+        elif prefetched is not None:
+            close_when_done(prefetched[1])
+        return self.rc.get_payload(params=params)
 
 
 Solver = Union[DynamicSolver, MultiCaptchaSolver]
@@ -395,12 +702,97 @@ class ChallengeGoal(namedtuple("ChallengeGoal", [
         return json.dumps(self.meta)
 
 
+def find_goal_text(js_strings: Strings, id: str) -> Optional[str]:
+    """Finds the objective of challenges about the object `id` (e.g.,
+    "/m/0k4j") in the strings extracted from recaptcha__en.js.
+    """
+    start = 0
+    matching_strings = []
+
+    def try_find():
+        nonlocal start
+        index = js_strings.index(id, start)
+        for i in range(FIND_GOAL_SEARCH_DISTANCE):
+            next_str = js_strings[index + i + 1]
+            if re.search(r"\bselect all\b", next_str, re.I):
+                matching_strings.append((i, index, next_str))
+        start = index + FIND_GOAL_SEARCH_DISTANCE + 1
+
+    try:
+        while True:
+            try_find()
+    except (ValueError, IndexError):
+        pass
+
+    try:
+        goal = min(matching_strings)[2]
+    except ValueError:
+        return None
+    return goal
+
+
+RequestHook = Callable[[RequestEvent], None]
+GoalFinder = Callable[[str], Optional[str]]
+
+
 class ReCaptcha:
     def __init__(self, api_key, site_url, user_agent, debug=False,
-                 make_requests=True):
+                 make_requests=True, on_request: Optional[RequestHook] = None,
+                 tracer: Optional[Tracer] = None, prefetch=False,
+                 transport=None, rc_version: Optional[str] = None,
+                 rc_version_ttl: Optional[float] = RC_VERSION_TTL,
+                 timeouts: Optional[Dict[str, Timeout]] = None,
+                 deadline: Optional[Deadline] = None,
+                 retry: RetryPolicy = DEFAULT_RETRY,
+                 goal_finder: Optional[GoalFinder] = None):
+        """`on_request`, if provided, is called with a `RequestEvent` after
+        every HTTP request made through `get()` and `post()`, including ones
+        that fail. See `librecaptcha.metrics` for sinks that record them.
+
+        `tracer`, if provided, records spans for each phase of the solve; see
+        `librecaptcha.tracing`.
+
+        If `prefetch` is true, images for multicaptcha challenges are
+        downloaded in the background while the user solves the previous
+        challenge.
+
+        `transport` sends the HTTP requests; by default, a new
+        `RequestsTransport` is used. See `librecaptcha.transport`.
+
+        `rc_version` is the reCAPTCHA release to use. If not provided, the
+        version saved by a previous run is used if it's less than
+        `rc_version_ttl` seconds old; see `get_cached_rc_version()`.
+
+        `timeouts` maps endpoint classes to the connect and read timeouts of
+        requests sent to them, overriding `timeouts.DEFAULT_TIMEOUTS`. If
+        `deadline` is provided, requests are limited so that they end before
+        it, and `DeadlineExceededError` is raised once it has passed; it
+        applies to all requests, including the ones made here.
+
+        Failed GET requests, which are safe to repeat, are retried according
+        to `retry`; pass `retry.NO_RETRY` to disable retries. See
+        `librecaptcha.retry`.
+
+        `goal_finder`, if provided, is called with an object ID to find the
+        objective of a challenge, instead of searching the strings in
+        recaptcha__en.js, which then isn't loaded. See `find_goal_text()`
+        and `librecaptcha.daemon`.
+        """
         self.api_key = api_key
         self.site_url = get_rc_site_url(site_url)
         self.debug = debug
+        if debug:
+            enable_debug_logging()
+        self.on_request = on_request
+        self.tracer = NullTracer() if tracer is None else tracer
+        self.prefetch = prefetch
+        if transport is None:
+            transport = RequestsTransport()
+        self.transport = transport
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.deadline = deadline
+        self.retry = retry
+        self.goal_finder = goal_finder
         self.co = rc_base64(self.site_url)
 
         self.first_token = None
@@ -409,64 +801,56 @@ class ReCaptcha:
         self.user_agent = user_agent
 
         self.js_strings = None
-        self.rc_version = None
+        self.rc_version = rc_version
         if make_requests:
-            self.rc_version = get_rc_version(self.user_agent)
-            self.js_strings = get_js_strings(self.user_agent, self.rc_version)
+            if self.rc_version is None:
+                self.rc_version = get_cached_rc_version(
+                    self.user_agent, self.transport, rc_version_ttl,
+                    self.timeouts[SCRIPTS], self.retry, self.deadline,
+                )
+            if goal_finder is None:
+                self.js_strings = get_js_strings(
+                    self.user_agent, self.rc_version, self.transport,
+                    self.timeouts[SCRIPTS], self.retry, self.deadline,
+                )
         self.solver_index = -1
 
     def first_solver(self) -> Solver:
         if self.solver_index >= 0:
             raise RuntimeError("First solver was already retrieved")
-        self._request_first_token()
-        rresp = self._get_first_rresp()
-        return self._get_solver(rresp)
+        with self.tracer.span("first_solver", PHASE_SOLVE):
+            self._request_first_token()
+            rresp = self._get_first_rresp()
+            return self._get_solver(rresp)
 
     def send_solution(self, solution: Solution) -> Union[Solver, str]:
         if self.solver_index < 0:
             raise RuntimeError("First solver wasn't retrieved")
-        uvtoken, rresp = self._verify(solution.response)
+        with self.tracer.span("send_solution", PHASE_SOLVE):
+            uvtoken, rresp = self._verify(solution.response)
         if rresp is not None:
             return self._get_solver(rresp)
         if not uvtoken:
             raise RuntimeError("Got neither uvtoken nor new rresp.")
         return uvtoken
 
-    def debug_print(self, *args, **kwargs):
-        if not self.debug:
-            return
-        if len(args) == 1 and callable(args[0]):
-            args = (args[0](),)
-        print(*args, file=sys.stderr, **kwargs)
-
     def get_challenge_goal(self, meta) -> ChallengeGoal:
         raw = self.find_challenge_goal_text(meta[0])
         return ChallengeGoal(raw=raw, meta=meta)
 
-    def find_challenge_goal_text(self, id: str, raw=False) -> str:
-        start = 0
-        matching_strings = []
-
-        def try_find():
-            nonlocal start
-            index = self.js_strings.index(id, start)
-            for i in range(FIND_GOAL_SEARCH_DISTANCE):
-                next_str = self.js_strings[index + i + 1]
-                if re.search(r"\bselect all\b", next_str, re.I):
-                    matching_strings.append((i, index, next_str))
-            start = index + FIND_GOAL_SEARCH_DISTANCE + 1
+    def find_challenge_goal_text(self, id: str, raw=False) -> Optional[str]:
+        if self.goal_finder is not None:
+            return self.goal_finder(id)
+        return find_goal_text(self.js_strings, id)
 
-        try:
-            while True:
-                try_find()
-        except (ValueError, IndexError):
-            pass
-
-        try:
-            goal = min(matching_strings)[2]
-        except ValueError:
-            return None
-        return goal
+    def request_timeout(self, endpoint_class: str) -> Timeout:
+        """Returns the timeouts for a request to an endpoint of the given
+        class (see `librecaptcha.timeouts`), limited by the deadline.
+        """
+        timeout = self.timeouts[endpoint_class]
+        if self.deadline is not None:
+            timeout = self.deadline.limit(timeout)
+        return timeout
 
     def get_headers(self, headers: Optional[Dict[str, str]]) -> Dict[str, str]:
         headers = headers or {}
@@ -490,15 +874,20 @@ class ReCaptcha:
             params["p"] = self.current_p
         headers = self.get_headers(headers)
 
-        r = requests.get(
-            get_full_url(url), params=params, headers=headers,
+        r = self.retry.call(lambda attempt: self._request(
+            "GET", url, params=params, headers=headers, attempt=attempt,
             **kwargs,
-        )
-        self.debug_print(lambda: "[http] [get] {}".format(r.url))
+        ), self.deadline)
+        HTTP_LOG.debug("[get] %s", r.url)
         if not (allow_errors is True or r.status_code in (allow_errors or {})):
             r.raise_for_status()
         return r
 
+    def get_payload(self, params) -> LazyImage:
+        """Downloads a challenge image."""
+        data = self.get("payload", params=params).content
+        return LazyImage(data, self.tracer)
+
     def post(self, url, *, params=None, data=None, headers=None,
              allow_errors=None, no_debug_response=False, **kwargs):
         if params is None:
@@ -513,20 +902,68 @@ class ReCaptcha:
             data["c"] = self.current_token
         headers = self.get_headers(headers)
 
-        r = requests.post(
-            get_full_url(url), params=params, data=data, headers=headers,
+        r = self._request(
+            "POST", url, params=params, data=data, headers=headers,
             **kwargs,
         )
-        self.debug_print(lambda: "[http] [post] {}".format(r.url))
-        self.debug_print(lambda: "[http] [post] [data] {!r}".format(data))
+        HTTP_LOG.debug("[post] %s", r.url)
+        HTTP_LOG.debug("[post] [data] %s", Preview(data))
         if not no_debug_response:
-            self.debug_print(
-                lambda: "[http] [post] [response] {}".format(r.text),
+            HTTP_LOG.debug(
+                "[post] [response] %s", Preview(r.content, text=True),
             )
         if not (allow_errors is True or r.status_code in (allow_errors or {})):
             r.raise_for_status()
         return r
 
+    def _request(self, method: str, url: str, attempt=1,
+                 **kwargs) -> Response:
+        kwargs.setdefault("timeout", self.request_timeout(endpoint_class(url)))
+        start = time.time()
+        start_monotonic = time.monotonic()
+        r = None
+        error = None
+        span = self.tracer.span(
+            "{} {}".format(method, url), PHASE_NETWORK, endpoint=url,
+            attempt=attempt,
+        )
+        try:
+            with span, deadline_errors(self.deadline):
+                r = self.transport.request(
+                    method, get_full_url(url), **kwargs,
+                )
+                span.set_attribute("status", r.status_code)
+                span.set_attribute("http_version", r.http_version)
+            # The read timeout applies to each read, so a server that sends
+            # the body slowly can make the request end after the deadline.
+            check(self.deadline)
+            return r
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            if self.on_request is not None:
+                self._emit_request_event(
+                    method, url, r, error, start,
+                    time.monotonic() - start_monotonic, attempt,
+                )
+
+    def _emit_request_event(self, method, url, r, error, start, total,
+                            attempt):
+        received = r is not None
+        self.on_request(RequestEvent(
+            endpoint=url,
+            method=method,
+            status=r.status_code if received else None,
+            error=error,
+            start=start,
+            ttfb=r.ttfb if received else None,
+            total=total,
+            bytes_out=r.bytes_out if received else 0,
+            bytes_in=len(r.content) if received else 0,
+            attempt=attempt,
+        ))
+
     def _request_first_token(self):
         class Parser(HTMLParser):
             def __init__(p_self):
@@ -561,7 +998,7 @@ class ReCaptcha:
         response_text = json.dumps({"response": response}, separators=",:")
         response_b64 = rc_base64(response_text)
 
-        self.debug_print("Sending verify request...")
+        SOLVER_LOG.debug("Sending verify request...")
         # Note: We're not sending "t", "ct", and "bg".
         r = self.post("userverify", data={
             "v": None,
@@ -569,37 +1006,39 @@ class ReCaptcha:
             "response": response_b64,
         })
 
-        uvresp = load_rc_json(r.text)
-        self.debug_print(lambda: "Got verify response: {!r}".format(uvresp))
+        uvresp = load_rc_json(r.content)
+        SOLVER_LOG.debug("Got verify response: %s", Preview(uvresp))
         rresp = get_rresp(uvresp)
         uvresp_token = uvresp[1]
         return (uvresp_token, rresp)
 
     def _get_first_rresp(self):
-        self.debug_print("Getting first rresp...")
-        r = self.post("reload", data=format_reload_protobuf(
+        SOLVER_LOG.debug("Getting first rresp...")
+        data = format_reload_protobuf(
             rc_version=self.rc_version,
             token=self.current_token,
             reason="fi",
             api_key=self.api_key,
-        ), headers={
+        )
+        SOLVER_LOG.debug(
+            "Reload request: %s", proto.Inspect(data, proto.RELOAD),
+        )
+        r = self.post("reload", data=data, headers={
             "Content-Type": "application/x-protobuffer",
         })
-        rresp = load_rc_json(r.text)
-        self.debug_print(lambda: "Got first rresp: {!r}".format(rresp))
+        rresp = load_rc_json(r.content, max_index=RRESP_MAX_INDEX)
+        SOLVER_LOG.debug("Got first rresp: %s", Preview(rresp))
         return rresp
 
     def _get_solver(self, rresp) -> Solver:
         self.solver_index += 1
         challenge_type = rresp[5]
-        self.debug_print(lambda: "Challenge type: {}".format(challenge_type))
+        SOLVER_LOG.debug("Challenge type: %s", challenge_type)
         pmeta = rresp[4]
-        self.debug_print(lambda: "pmeta: {}".format(pmeta))
+        SOLVER_LOG.debug("pmeta: %s", Preview(pmeta))
         self.current_token = rresp[1]
         self.current_p = rresp[9]
-        self.debug_print(
-            lambda: "Current token: {}".format(self.current_token),
-        )
+        SOLVER_LOG.debug("Current token: %s", self.current_token)
 
         solver_class = {
             "dynamic": DynamicSolver,
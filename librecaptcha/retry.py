@@ -0,0 +1,101 @@
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Retries for requests that are safe to repeat. Only GET requests are
+retried (challenge images, the "anchor" page, and the scripts); POST
+requests such as "userverify" change the state of the session and are never
+repeated, so a transient failure doesn't require starting a new solve
+unless it happens on one of those.
+"""
+
+from .logs import HTTP_LOG
+from .transport import Response
+
+from typing import Callable
+import random
+import requests
+import time
+
+# Server errors that are usually transient.
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Exceptions that indicate a failure of the connection rather than of the
+# request. `ChunkedEncodingError` is raised when a response is cut short.
+RETRY_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.ContentDecodingError,
+)
+
+
+class RetryPolicy:
+    """Makes up to `attempts` attempts at a request. Before attempt ``n +
+    1``, the policy waits for a random time between zero and ``base_delay *
+    2 ** (n - 1)`` seconds, capped at `max_delay` ("full jitter"), so that
+    clients that failed at the same time don't retry at the same time.
+    """
+    def __init__(self, attempts=3, base_delay=0.5, max_delay=8.0):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int) -> float:
+        """Returns the time to wait after the failure of `attempt` (starting
+        from 1).
+        """
+        limit = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(0, limit)
+
+    def call(self, send: Callable[[int], Response],
+             deadline=None) -> Response:
+        """Calls `send` with the attempt number (starting from 1) until it
+        returns a response whose status isn't in `RETRY_STATUSES` or raises
+        an exception not in `RETRY_ERRORS`, or until there are no attempts
+        left. If `deadline` (a `librecaptcha.timeouts.Deadline`) is
+        provided, no retry is made that would start after it.
+        """
+        attempt = 1
+        while True:
+            try:
+                r = send(attempt)
+            except RETRY_ERRORS as e:
+                if not self._wait(attempt, deadline, e):
+                    raise
+            else:
+                if r.status_code not in RETRY_STATUSES:
+                    return r
+                if not self._wait(attempt, deadline, r.status_code):
+                    return r
+            attempt += 1
+
+    def _wait(self, attempt: int, deadline, reason) -> bool:
+        if attempt >= self.attempts:
+            return False
+        delay = self.backoff(attempt)
+        if deadline is not None and deadline.remaining() <= delay:
+            return False
+        HTTP_LOG.debug(
+            "[retry] Attempt %d failed (%s); retrying in %.2f seconds",
+            attempt, reason, delay,
+        )
+        time.sleep(delay)
+        return True
+
+
+DEFAULT_RETRY = RetryPolicy()
+NO_RETRY = RetryPolicy(attempts=1)
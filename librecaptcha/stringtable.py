@@ -0,0 +1,209 @@
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Files containing the strings extracted from recaptcha__en.js.
+
+The binary format is mapped into memory with `mmap` and searched in place,
+so opening it doesn't require reading or parsing the whole file. All
+integers are unsigned, 32-bit, and little-endian:
+
+* The header: `MAGIC`, the length of the version string, the number of
+  strings, and the offset of the blob (from the start of the file).
+* The version string, in UTF-8, padded with null bytes to a multiple of 4.
+* The offsets table: for each string, its offset in the blob, followed by
+  the length of the blob.
+* The id table: the index of each string, sorted by the string's UTF-8
+  bytes (and then by index), for binary searches.
+* The blob: the strings in UTF-8, one after another.
+
+The older JSON format (the version string on the first line, then a JSON
+list of strings) can still be written and read with `FORMAT_JSON`.
+"""
+
+from .typing import Iterable, List
+
+from typing import BinaryIO, Union
+import json
+import mmap
+import os
+import struct
+
+FORMAT_BINARY = "binary"
+FORMAT_JSON = "json"
+
+MAGIC = b"LRCSTRS\x01"
+HEADER = struct.Struct("<8sIII")
+UINT32 = struct.Struct("<I")
+UINT32_PAIR = struct.Struct("<II")
+
+# Lone surrogates can appear in JavaScript strings.
+ENCODING_ERRORS = "surrogatepass"
+
+
+def _align(n: int) -> int:
+    return (n + 3) & ~3
+
+
+def _encode(string: str) -> bytes:
+    return string.encode("utf-8", ENCODING_ERRORS)
+
+
+class StringTable:
+    """The strings in a binary file, which is kept mapped into memory.
+    Supports ``len()``, indexing, iteration, and ``index()`` like a list,
+    but ``index()`` is a binary search.
+    """
+    def __init__(self, file: BinaryIO):
+        self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._read_header()
+        except struct.error as e:
+            self.map.close()
+            raise ValueError("Truncated string table") from e
+        except ValueError:
+            self.map.close()
+            raise
+
+    def _read_header(self):
+        magic, version_length, count, blob_offset = HEADER.unpack_from(
+            self.map,
+        )
+        if magic != MAGIC:
+            raise ValueError("Not a string table")
+        version_end = HEADER.size + version_length
+        self.version = self.map[HEADER.size:version_end].decode()
+        self.count = count
+        self.offsets_offset = _align(version_end)
+        self.ids_offset = self.offsets_offset + 4 * (count + 1)
+        self.blob_offset = blob_offset
+        blob_length = self._uint32(self.offsets_offset + 4 * count)
+        if self.ids_offset + 4 * count > blob_offset or (
+            blob_offset + blob_length > len(self.map)
+        ):
+            raise ValueError("Truncated string table")
+
+    def _uint32(self, offset: int) -> int:
+        return UINT32.unpack_from(self.map, offset)[0]
+
+    def _bytes(self, index: int) -> bytes:
+        start, end = UINT32_PAIR.unpack_from(
+            self.map, self.offsets_offset + 4 * index,
+        )
+        return self.map[self.blob_offset + start:self.blob_offset + end]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> str:
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("String table index out of range")
+        return self._bytes(index).decode("utf-8", ENCODING_ERRORS)
+
+    def __iter__(self) -> Iterable[str]:
+        return (self[i] for i in range(self.count))
+
+    def index(self, value: str, start: int = 0) -> int:
+        """Returns the index of the first occurrence of `value` at or after
+        `start`. Raises `ValueError` if there isn't one.
+        """
+        if start < 0:
+            start = max(start + self.count, 0)
+        key = (_encode(value), start)
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            index = self._uint32(self.ids_offset + 4 * mid)
+            if (self._bytes(index), index) < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self.count:
+            index = self._uint32(self.ids_offset + 4 * low)
+            if self._bytes(index) == key[0]:
+                return index
+        raise ValueError("{!r} is not in the string table".format(value))
+
+    def close(self):
+        self.map.close()
+
+
+Strings = Union[StringTable, List[str]]
+
+
+def write_binary(file: BinaryIO, version: str, strings: List[str]):
+    encoded = [_encode(s) for s in strings]
+    version_bytes = version.encode()
+    offsets = [0]
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+    ids = sorted(range(len(encoded)), key=encoded.__getitem__)
+
+    header_end = _align(HEADER.size + len(version_bytes))
+    blob_offset = header_end + 4 * (len(offsets) + len(ids))
+    file.write(HEADER.pack(
+        MAGIC, len(version_bytes), len(encoded), blob_offset,
+    ))
+    file.write(version_bytes.ljust(header_end - HEADER.size, b"\0"))
+    file.write(struct.pack("<{}I".format(len(offsets)), *offsets))
+    file.write(struct.pack("<{}I".format(len(ids)), *ids))
+    for data in encoded:
+        file.write(data)
+
+
+def write_json(file: BinaryIO, version: str, strings: List[str]):
+    file.write("{}\n".format(version).encode())
+    file.write(json.dumps(strings).encode())
+
+
+def save(path: str, version: str, strings: List[str],
+         format: str = FORMAT_BINARY):
+    """Saves `strings` to `path` in the given format. The file is replaced
+    atomically, as it may be mapped into memory by other processes.
+    """
+    write = {FORMAT_BINARY: write_binary, FORMAT_JSON: write_json}[format]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    try:
+        with open(tmp_path, "wb") as f:
+            write(f, version, strings)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def load(path: str, version: str) -> Strings:
+    """Loads the strings saved at `path` in either format. Raises `OSError`
+    or `ValueError` if they can't be loaded or aren't for `version`.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            f.seek(0)
+            file_version, text = f.read().decode().split("\n", 1)
+            if file_version != version:
+                raise ValueError("Incorrect version: {}".format(file_version))
+            return json.loads(text)
+        table = StringTable(f)
+    if table.version != version:
+        table.close()
+        raise ValueError("Incorrect version: {}".format(table.version))
+    return table
@@ -0,0 +1,130 @@
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Timeouts for HTTP requests, and a deadline for a whole solve.
+
+Each request gets a connect timeout and a read timeout that depend on the
+class of endpoint it's sent to; see `DEFAULT_TIMEOUTS`. A `Deadline` bounds
+the time from the start of a solve until the token is received: the
+timeouts of each request are shortened so that it can't wait past the
+deadline, the deadline is checked again as each response is read, and
+`DeadlineExceededError` is raised once it has passed.
+"""
+
+from .errors import DeadlineExceededError
+import requests
+
+from collections import namedtuple
+from contextlib import contextmanager
+from typing import Optional
+import time
+
+# Endpoint classes
+API = "api"  # "anchor", "reload", "userverify", etc.
+PAYLOAD = "payload"  # Challenge images
+SCRIPTS = "scripts"  # api.js and recaptcha__en.js
+
+
+class Timeout(namedtuple("Timeout", [
+    "connect",  # float, seconds
+    "read",  # float, seconds to wait for each read from the server
+])):
+    # This is a `(connect, read)` pair, so it can be passed directly to
+    # `requests`.
+    pass
+
+
+DEFAULT_TIMEOUTS = {
+    API: Timeout(connect=10, read=20),
+    PAYLOAD: Timeout(connect=10, read=30),
+    # recaptcha__en.js is large and may be downloaded over slow networks.
+    SCRIPTS: Timeout(connect=10, read=60),
+}
+
+
+def endpoint_class(url: str) -> str:
+    """Returns the class of the reCAPTCHA API endpoint `url`."""
+    return PAYLOAD if url.lstrip("/") == PAYLOAD else API
+
+
+class Deadline:
+    """The point in time `seconds` from now by which the solve must finish,
+    e.g., because the token would otherwise expire before it can be used.
+    """
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return self.expires - time.monotonic()
+
+    @property
+    def exceeded(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self):
+        """Raises `DeadlineExceededError` if the deadline has passed."""
+        if self.exceeded:
+            raise DeadlineExceededError(self.seconds)
+
+    def limit(self, timeout: Timeout) -> Timeout:
+        """Shortens `timeout` so that it ends no later than the deadline.
+
+        Note that the read timeout applies to each read, so a server that
+        keeps sending data slowly can make a request last longer; callers
+        should also check the deadline while reading the response.
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceededError(self.seconds)
+        return Timeout(
+            connect=min(timeout.connect, remaining),
+            read=min(timeout.read, remaining),
+        )
+
+
+def limit(timeout: Optional[Timeout],
+          deadline: Optional[Deadline]) -> Optional[Timeout]:
+    """Like `Deadline.limit()`, but returns `timeout` unchanged if `deadline`
+    is ``None``. If `timeout` is ``None`` (no timeout), the time left until
+    the deadline is used.
+    """
+    if deadline is None:
+        return timeout
+    if timeout is None:
+        timeout = Timeout(connect=float("inf"), read=float("inf"))
+    return deadline.limit(timeout)
+
+
+def check(deadline: Optional[Deadline]):
+    """Like `Deadline.check()`, but does nothing if `deadline` is ``None``."""
+    if deadline is not None:
+        deadline.check()
+
+
+@contextmanager
+def deadline_errors(deadline: Optional[Deadline]):
+    """Raises `DeadlineExceededError` instead of a `requests` exception raised
+    in the block if `deadline` has passed, as the request's timeouts were
+    shortened because of it.
+    """
+    try:
+        yield
+    except requests.RequestException as e:
+        if deadline is not None and deadline.exceeded:
+            raise DeadlineExceededError(deadline.seconds) from e
+        raise
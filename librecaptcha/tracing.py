@@ -0,0 +1,201 @@
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Span-based tracing of a solve session. Spans are exported as
+OpenTelemetry (OTLP) JSON, so they can be loaded by OpenTelemetry tooling,
+but no OpenTelemetry packages are needed.
+
+Each span has a ``librecaptcha.phase`` attribute that is one of the
+``PHASE_*`` constants, so time spent waiting on the network can be told
+apart from time spent decoding images, rendering, or waiting for the user.
+"""
+
+from contextlib import contextmanager
+from typing import Optional
+import json
+import os
+import threading
+import time
+
+PHASE_SOLVE = "solve"
+PHASE_NETWORK = "network"
+PHASE_DECODE = "decode"
+PHASE_RENDER = "render"
+PHASE_INPUT = "input"
+
+
+def time_ns() -> int:
+    return int(time.time() * 1e9)
+
+
+class Span:
+    def __init__(self, tracer: "Tracer", name: str, phase: str,
+                 parent: Optional["Span"], attributes):
+        self.tracer = tracer
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent = parent
+        self.attributes = dict(attributes, **{"librecaptcha.phase": phase})
+        self.start_ns = time_ns()
+        self.end_ns = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time_ns()
+            self.tracer._finish(self)
+
+    def __enter__(self):
+        self.tracer._push(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.tracer._pop(self)
+        self.end()
+
+    def to_otlp(self, trace_id: str):
+        span = {
+            "traceId": trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [
+                {"key": key, "value": otlp_value(value)}
+                for key, value in self.attributes.items()
+            ],
+        }
+        if self.parent is not None:
+            span["parentSpanId"] = self.parent.span_id
+        return span
+
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Tracer:
+    """Records spans for a single trace. Spans started with `span()` in a
+    ``with`` statement become the parent of spans started in the same thread
+    until the block exits; spans started in other threads have no parent
+    unless one is passed explicitly.
+    """
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def current(self) -> Optional[Span]:
+        stack = getattr(self._local, "stack", None)
+        return stack[-1] if stack else None
+
+    def span(self, name: str, phase: str, parent: Optional[Span] = None,
+             **attributes) -> Span:
+        """Starts a span. Use the result in a ``with`` statement, or call
+        its `end()` method once the operation is complete.
+        """
+        if parent is None:
+            parent = self.current
+        return Span(self, name, phase, parent, attributes)
+
+    @contextmanager
+    def use_parent(self, span: Optional[Span]):
+        """Makes `span` the parent of spans started in this thread within the
+        ``with`` block, without ending it. Use this for work done in another
+        thread on behalf of `span`.
+        """
+        if span is None:
+            yield
+            return
+        self._push(span)
+        try:
+            yield
+        finally:
+            self._pop(span)
+
+    def _push(self, span: Span):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        self._local.stack.append(span)
+
+    def _pop(self, span: Span):
+        stack = self._local.stack
+        if span in stack:
+            del stack[stack.index(span):]
+
+    def _finish(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_otlp(self):
+        with self._lock:
+            spans = [span.to_otlp(self.trace_id) for span in self.spans]
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{
+                "key": "service.name",
+                "value": {"stringValue": "librecaptcha"},
+            }]},
+            "scopeSpans": [{
+                "scope": {"name": "librecaptcha"},
+                "spans": spans,
+            }],
+        }]}
+
+    def export(self, path: str):
+        """Writes all finished spans to `path` as OTLP JSON."""
+        with open(path, "w") as f:
+            json.dump(self.to_otlp(), f)
+
+
+class NullSpan:
+    def set_attribute(self, key: str, value):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+class NullTracer:
+    """A tracer that records nothing; used when tracing is disabled."""
+    _span = NullSpan()
+    current = None
+
+    def span(self, name: str, phase: str, parent=None, **attributes):
+        return self._span
+
+    @contextmanager
+    def use_parent(self, span):
+        yield
@@ -0,0 +1,275 @@
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+"""HTTP transports used by `ReCaptcha`. A transport has a `request()` method
+with the signature of `RequestsTransport.request()`, a `stream()` method with
+the signature of `RequestsTransport.stream()`, and a `close()` method.
+
+`RequestsTransport` (the default) uses HTTP/1.1 through `requests`.
+`Http2Transport` uses HTTP/2 through `httpx`, which must be installed with
+its ``http2`` extra; all requests to a host share one multiplexed connection,
+so concurrent requests (such as image prefetches) don't need connections of
+their own.
+
+Both transports return a `Response` and raise `requests` exceptions, so
+callers don't depend on the transport in use. Neither keeps cookies between
+requests: reusing connections mustn't make separate solves linkable.
+"""
+
+from .errors import Http2ImportError
+from .typing import Dict, Iterable
+import requests
+import urllib3
+
+from contextlib import contextmanager
+from email.message import Message
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import Optional, Union
+import time
+
+CHUNK_SIZE = 64 * 1024
+
+Params = Optional[Dict[str, Optional[str]]]
+
+
+def reject_cookies() -> DefaultCookiePolicy:
+    """A cookie policy that doesn't accept cookies from any domain."""
+    return DefaultCookiePolicy(allowed_domains=[])
+
+
+def without_none(params: Params) -> Optional[Dict[str, str]]:
+    if params is None:
+        return None
+    return {k: v for k, v in params.items() if v is not None}
+
+
+class Response:
+    """The parts of an HTTP response that librecaptcha uses."""
+    def __init__(self, url: str, status_code: int, headers, content: bytes,
+                 ttfb: float, bytes_out: int, http_version: str):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers  # Case-insensitive mapping
+        self.content = content
+        self.ttfb = ttfb  # Seconds until the response headers arrived
+        self.bytes_out = bytes_out  # Size of the request body
+        self.http_version = http_version
+
+    @property
+    def encoding(self) -> str:
+        message = Message()
+        message["Content-Type"] = self.headers.get("Content-Type", "")
+        return message.get_content_charset() or "utf-8"
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding, "replace")
+
+    def raise_for_status(self):
+        raise_for_status(self)
+
+
+class StreamingResponse:
+    """A response whose body is read in chunks as it arrives. `chunks`
+    yields the body as it was sent, without undoing its ``Content-Encoding``,
+    so that a partial download can be resumed with a ``Range`` request.
+    """
+    def __init__(self, url: str, status_code: int, headers,
+                 chunks: Iterable[bytes], ttfb: float, http_version: str):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers  # Case-insensitive mapping
+        self.chunks = chunks
+        self.ttfb = ttfb
+        self.http_version = http_version
+
+    def raise_for_status(self):
+        raise_for_status(self)
+
+
+def raise_for_status(r: Union[Response, StreamingResponse]):
+    if 400 <= r.status_code < 600:
+        raise requests.HTTPError(
+            "{} error for url: {}".format(r.status_code, r.url),
+            response=r,
+        )
+
+
+class RequestsTransport:
+    def __init__(self):
+        self.session = requests.Session()
+        self.session.cookies.set_policy(reject_cookies())
+
+    def request(self, method: str, url: str, *, params: Params = None,
+                data: Union[Params, bytes] = None,
+                headers: Optional[Dict[str, str]] = None,
+                timeout=None) -> Response:
+        """Sends a request. Parameters and form fields whose value is
+        ``None`` are omitted. `timeout` is a number of seconds or a
+        ``(connect, read)`` pair, such as a `librecaptcha.timeouts.Timeout`.
+        """
+        if isinstance(data, dict):
+            data = without_none(data)
+        r = self.session.request(
+            method, url, params=without_none(params), data=data,
+            headers=headers, timeout=timeout,
+        )
+        return Response(
+            url=r.url,
+            status_code=r.status_code,
+            headers=r.headers,
+            content=r.content,
+            ttfb=r.elapsed.total_seconds(),
+            bytes_out=len(r.request.body or b""),
+            http_version="HTTP/1.1",
+        )
+
+    @contextmanager
+    def stream(self, method: str, url: str, *,
+               headers: Optional[Dict[str, str]] = None, timeout=None):
+        """Sends a request and returns a context manager for a
+        `StreamingResponse`; the connection is released on exit.
+        """
+        r = self.session.request(
+            method, url, headers=headers, timeout=timeout, stream=True,
+        )
+
+        def chunks():
+            # Like `requests.Response.iter_content()`, but without decoding.
+            try:
+                yield from r.raw.stream(CHUNK_SIZE, decode_content=False)
+            except urllib3.exceptions.ProtocolError as e:
+                raise requests.exceptions.ChunkedEncodingError(e) from e
+            except urllib3.exceptions.ReadTimeoutError as e:
+                raise requests.ConnectionError(e) from e
+
+        try:
+            yield StreamingResponse(
+                url=r.url,
+                status_code=r.status_code,
+                headers=r.headers,
+                chunks=chunks(),
+                ttfb=r.elapsed.total_seconds(),
+                http_version="HTTP/1.1",
+            )
+        finally:
+            r.close()
+
+    def close(self):
+        self.session.close()
+
+
+class Http2Transport:
+    def __init__(self, prior_knowledge=False):
+        """If `prior_knowledge` is true, HTTP/2 is used without first
+        negotiating it (h2c), which allows HTTP/2 over plain-text connections,
+        e.g., to the test server. HTTP/1.1 is then unavailable.
+        """
+        try:
+            import httpx
+            import h2  # noqa: F401
+        except ImportError as e:
+            raise Http2ImportError from e
+        self.httpx = httpx
+        self.client = httpx.Client(
+            http1=not prior_knowledge, http2=True,
+            cookies=CookieJar(reject_cookies()),
+        )
+
+    def request(self, method: str, url: str, *, params: Params = None,
+                data: Union[Params, bytes] = None,
+                headers: Optional[Dict[str, str]] = None,
+                timeout=None) -> Response:
+        """See `RequestsTransport.request()`."""
+        kwargs = {}
+        if isinstance(data, dict):
+            kwargs["data"] = without_none(data)
+        elif data is not None:
+            kwargs["content"] = data
+        kwargs.update(self._timeout_kwargs(timeout))
+
+        request = self.client.build_request(
+            method, url, params=without_none(params), headers=headers,
+            **kwargs,
+        )
+        start = time.monotonic()
+        with self._map_errors():
+            r = self.client.send(request, stream=True)
+            try:
+                ttfb = time.monotonic() - start
+                content = r.read()
+            finally:
+                r.close()
+        return Response(
+            url=str(r.url),
+            status_code=r.status_code,
+            headers=r.headers,
+            content=content,
+            ttfb=ttfb,
+            bytes_out=len(request.content),
+            http_version=r.http_version,
+        )
+
+    @contextmanager
+    def stream(self, method: str, url: str, *,
+               headers: Optional[Dict[str, str]] = None, timeout=None):
+        """See `RequestsTransport.stream()`."""
+        request = self.client.build_request(
+            method, url, headers=headers, **self._timeout_kwargs(timeout),
+        )
+        start = time.monotonic()
+        with self._map_errors():
+            r = self.client.send(request, stream=True)
+        ttfb = time.monotonic() - start
+
+        def chunks():
+            with self._map_errors():
+                yield from r.iter_raw(CHUNK_SIZE)
+
+        try:
+            yield StreamingResponse(
+                url=str(r.url),
+                status_code=r.status_code,
+                headers=r.headers,
+                chunks=chunks(),
+                ttfb=ttfb,
+                http_version=r.http_version,
+            )
+        finally:
+            r.close()
+
+    def _timeout_kwargs(self, timeout) -> dict:
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            return {"timeout": self.httpx.Timeout(read, connect=connect)}
+        if timeout is not None:
+            return {"timeout": timeout}
+        return {}
+
+    @contextmanager
+    def _map_errors(self):
+        # Callers only handle `requests` exceptions.
+        httpx = self.httpx
+        try:
+            yield
+        except httpx.TimeoutException as e:
+            raise requests.Timeout(str(e)) from e
+        except httpx.TransportError as e:
+            raise requests.ConnectionError(str(e)) from e
+
+    def close(self):
+        self.client.close()
@@ -1,10 +1,38 @@
 #!/usr/bin/env python3
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from typing import Optional
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from collections import namedtuple
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import parse_qsl, urlparse
+import argparse
+import gzip
+import hashlib
 import os
 import os.path
+import random
+import re
+import threading
+import time
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.errors
+    import h2.events
+    import h2.exceptions
+except ImportError:
+    h2 = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 PORT = 55476
+CHUNK_SIZE = 4096
+H2_PREFACE = b"PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n"
+# Scripts are considered to be last modified when the server starts.
+SCRIPTS_LAST_MODIFIED = formatdate(usegmt=True)
 
 RC_JS = """\
 "/m/test1";
@@ -26,13 +54,13 @@ RC_JS = """\
 """
 
 ANCHOR = """\
-<input id="recaptcha-token" value="initial-token" />
+<input id="recaptcha-token" value="{token}" />
 """
 
-INITIAL_RRESP = """)]}'
+INITIAL_RRESP = """)]}}'
 [
     "rresp",
-    "test-token-1",
+    "{session}-test-token-1",
     null,
     1234,
     [
@@ -54,7 +82,7 @@ INITIAL_RRESP = """)]}'
     null,
     ["abcd", "abcd"],
     "abcd",
-    "test-p-1",
+    "{session}-test-p-1",
     null,
     null,
     "abcd"
@@ -62,7 +90,7 @@ INITIAL_RRESP = """)]}'
 """
 
 UVRESPS = [
-    """)]}'
+    """)]}}'
     [
         "uvresp",
         "abcd",
@@ -73,7 +101,7 @@ UVRESPS = [
         null,
         [
             "rresp",
-            "test-token-2",
+            "{session}-test-token-2",
             null,
             1234,
             [
@@ -122,17 +150,17 @@ UVRESPS = [
             null,
             ["abcd", "abcd"],
             null,
-            "test-p-2",
+            "{session}-test-p-2",
             null,
             null,
             "abcd"
         ]
     ]
     """,
-    """)]}'
+    """)]}}'
     [
         "uvresp",
-        "final-token",
+        "{session}-final-token",
         1234,
         1234,
         null,
@@ -148,23 +176,24 @@ UVRESPS = [
 DRESP_TEMPLATE = """)]}}'
 [
     "dresp",
-    "{token}",
+    "{session}-dresp-token-{num}",
     ["{id}"],
     null,
     [],
-    "{p}"
+    "{session}-dresp-p-{num}"
 ]
 """
 
 
 class State:
-    def __init__(self):
+    def __init__(self, session: str):
+        self.session = session
+        self.lock = threading.Lock()
         self.reset()
 
     def reset(self):
         self.uvresp_index = -1
         self.dresp_num = 0
-        self.next_image = None
 
     @property
     def challenge_type(self) -> Optional[str]:
@@ -176,130 +205,537 @@ class State:
 
     def reload(self) -> str:
         self.reset()
-        self.next_image = self._initial_image
-        return INITIAL_RRESP
+        return INITIAL_RRESP.format(session=self.session)
 
     def replaceimage(self) -> str:
         self.dresp_num += 1
         challenge_type = self.challenge_type
         if challenge_type == "multicaptcha":
-            self.next_image = f"multi{STATE.dresp_num + 1}"
+            image = f"multi{self.dresp_num + 1}"
         elif challenge_type == "dynamic":
-            self.next_image = f"tile{1 + (STATE.dresp_num - 1) % 16}"
+            image = f"tile{1 + (self.dresp_num - 1) % 16}"
         else:
             raise RuntimeError(f"Invalid challenge type: {challenge_type}")
 
         return DRESP_TEMPLATE.format(
-            token=f"dresp-token-{STATE.dresp_num}",
-            id=STATE.next_image,
-            p=f"dresp-p-{STATE.dresp_num}",
+            session=self.session,
+            num=self.dresp_num,
+            id=image,
         )
 
-    def payload_path(self) -> Optional[str]:
-        if self.next_image is None:
+    def payload_image(self, params: Dict[str, str]) -> Optional[str]:
+        """Determines the requested image from the request parameters alone,
+        like the real server does, so payloads can be requested more than
+        once (retries) or early (prefetching).
+        """
+        challenge_type = self.challenge_type
+        if challenge_type == "dynamic":
+            image = params.get("id", "dynamic")
+            if re.fullmatch(r"dynamic|tile([1-9]|1[0-6])", image):
+                return image
+            return None
+        if challenge_type != "multicaptcha":
             return None
-        path = os.path.join("images", "jpeg", f"{self.next_image}.jpg")
-        self.next_image = None
-        return path
+
+        # The first image is requested with the token; later images are
+        # requested with the "p" value from the previous rresp or dresp.
+        p = params.get("p")
+        if p is None:
+            return "multi1"
+        if p == f"{self.session}-test-p-2":
+            return "multi2"
+        match = re.fullmatch(rf"{self.session}-dresp-p-(\d+)", p)
+        if match and int(match.group(1)) < 2:
+            return f"multi{int(match.group(1)) + 2}"
+        return None
 
     def userverify(self) -> str:
         self.uvresp_index += 1
         self.dresp_num = 0
-        self.next_image = self._initial_image
-        return UVRESPS[self.uvresp_index]
-
-    @property
-    def _initial_image(self) -> Optional[str]:
-        return {
-            None: None,
-            "dynamic": "dynamic",
-            "multicaptcha": "multi1",
-        }[self.challenge_type]
+        return UVRESPS[self.uvresp_index].format(session=self.session)
 
 
-STATE = State()
+class Sessions:
+    """Each anchor request starts a new session. Tokens and "p" values sent
+    to the client contain the session ID, so later requests can be matched
+    to their session.
+    """
+    PATTERN = re.compile(rb"\b(session\d+)-")
+    DEFAULT = "default"
 
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.states = {}
+        self.count = 0
+
+    def new(self) -> str:
+        with self.lock:
+            self.count += 1
+            session = f"session{self.count}"
+            self.states[session] = State(session)
+        return session
+
+    def find(self, *data: bytes) -> State:
+        session = self.DEFAULT
+        for item in data:
+            match = self.PATTERN.search(item)
+            if match:
+                session = match.group(1).decode()
+                break
+        with self.lock:
+            state = self.states.get(session)
+            if state is None:
+                state = State(session)
+                self.states[session] = state
+        return state
+
+
+SESSIONS = Sessions()
+
+Request = namedtuple("Request", [
+    "endpoint",  # str
+    "query",  # bytes
+    "body",  # bytes
+    "headers",  # Dict[str, str], with lowercase names
+])
+
+
+class Response(namedtuple("Response", [
+    "status",  # int
+    "body",  # bytes
+    "content_type",  # Optional[str]
+    "headers",  # Dict[str, str], other than Content-Type and Content-Length
+])):
+    def __new__(cls, status, body=b"", content_type=None, headers=None):
+        return super().__new__(
+            cls, status, body, content_type, headers or {},
+        )
 
-class RequestHandler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        if self.path.endswith("/api.js"):
-            self.handle_api_js()
-        elif self.path.endswith("/recaptcha__en.js"):
-            self.handle_rc_js()
-        elif "/anchor?" in self.path:
-            self.handle_anchor()
-        elif "/payload?" in self.path:
-            self.handle_payload()
-        else:
-            self.send_response(404)
-            self.end_headers()
-
-    def handle_api_js(self):
-        self.send_response(200)
-        self.end_headers()
-        self.wfile.write(b"/recaptcha/releases/test-version/\n")
 
-    def handle_rc_js(self):
-        self.send_response(200)
-        self.end_headers()
-        self.wfile.write(RC_JS.encode())
+def not_modified(request: Request, etag: str, last_modified: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return etag in tags or "*" in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    return parsedate_to_datetime(last_modified) <= since
+
+
+def byte_range_start(request: Request, validators) -> Optional[int]:
+    """Returns the start of the range requested with an open-ended "Range"
+    header (the only kind librecaptcha sends), or None if the whole body
+    should be sent.
+    """
+    match = re.fullmatch(r"bytes=(\d+)-", request.headers.get("range", ""))
+    if match is None:
+        return None
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range not in validators:
+        return None
+    return int(match.group(1))
+
+
+def script_response(request: Request, script: str) -> Response:
+    """Serves a script like Google's servers do: with validators, support for
+    conditional and range requests, and compression.
+    """
+    body = script.encode()
+    encodings = {
+        coding.split(";")[0].strip()
+        for coding in request.headers.get("accept-encoding", "").split(",")
+    }
+    headers = {}
+    if brotli is not None and "br" in encodings:
+        body = brotli.compress(body)
+        headers["Content-Encoding"] = "br"
+    elif "gzip" in encodings:
+        body = gzip.compress(body, mtime=0)
+        headers["Content-Encoding"] = "gzip"
+
+    # Each encoding is a different representation, so it gets its own
+    # entity tag; ranges refer to the encoded body.
+    headers.update({
+        "ETag": '"{}"'.format(hashlib.sha256(body).hexdigest()[:16]),
+        "Last-Modified": SCRIPTS_LAST_MODIFIED,
+        "Vary": "Accept-Encoding",
+        "Accept-Ranges": "bytes",
+    })
+    if not_modified(request, headers["ETag"], headers["Last-Modified"]):
+        return Response(304, headers=headers)
+
+    start = byte_range_start(
+        request, (headers["ETag"], headers["Last-Modified"]),
+    )
+    if start is None:
+        return Response(200, body, "text/javascript", headers)
+    if start >= len(body):
+        headers["Content-Range"] = f"bytes */{len(body)}"
+        return Response(416, headers=headers)
+    headers["Content-Range"] = f"bytes {start}-{len(body) - 1}/{len(body)}"
+    return Response(206, body[start:], "text/javascript", headers)
+
+
+def handle_api_js(request: Request) -> Response:
+    return script_response(request, "/recaptcha/releases/test-version/\n")
+
+
+def handle_rc_js(request: Request) -> Response:
+    return script_response(request, RC_JS)
+
+
+def handle_anchor(request: Request) -> Response:
+    token = f"{SESSIONS.new()}-initial-token"
+    return Response(200, ANCHOR.format(token=token).encode(), "text/html")
+
+
+def handle_payload(request: Request) -> Response:
+    state = SESSIONS.find(request.query)
+    params = dict(parse_qsl(request.query.decode()))
+    with state.lock:
+        image = state.payload_image(params)
+    if image is None:
+        return Response(400)
+    with open(os.path.join("images", "jpeg", f"{image}.jpg"), "rb") as f:
+        return Response(200, f.read(), "image/jpeg")
+
+
+def handle_reload(request: Request) -> Response:
+    state = SESSIONS.find(request.body, request.query)
+    with state.lock:
+        return Response(200, state.reload().encode())
+
+
+def handle_replaceimage(request: Request) -> Response:
+    state = SESSIONS.find(request.body, request.query)
+    with state.lock:
+        return Response(200, state.replaceimage().encode())
+
+
+def handle_userverify(request: Request) -> Response:
+    state = SESSIONS.find(request.body, request.query)
+    with state.lock:
+        return Response(200, state.userverify().encode())
+
+
+HANDLERS = {
+    "GET": {
+        "api.js": handle_api_js,
+        "recaptcha__en.js": handle_rc_js,
+        "anchor": handle_anchor,
+        "payload": handle_payload,
+    },
+    "POST": {
+        "reload": handle_reload,
+        "replaceimage": handle_replaceimage,
+        "userverify": handle_userverify,
+    },
+}
+
+
+class Config:
+    """Simulated network conditions. Per-endpoint settings are keyed by the
+    last component of the URL path (e.g., "payload"); the key "*" applies to
+    all other endpoints.
+    """
+    def __init__(self):
+        self.latency = {}  # Dict[str, float], in seconds
+        self.error_rate = {}  # Dict[str, float]
+        self.truncate_rate = {}  # Dict[str, float]
+        self.bandwidth = None  # Optional[float], in bytes per second
+        self.quiet = False
+        self.random = random.Random()
+
+    @staticmethod
+    def lookup(table, endpoint: str) -> float:
+        return table.get(endpoint, table.get("*", 0))
+
+    def should_fail(self, endpoint: str) -> bool:
+        rate = self.lookup(self.error_rate, endpoint)
+        return self.random.random() < rate
+
+    def should_truncate(self, endpoint: str) -> bool:
+        rate = self.lookup(self.truncate_rate, endpoint)
+        return self.random.random() < rate
+
+
+CONFIG = Config()
+
+
+def respond(method: str, request: Request) -> Response:
+    time.sleep(CONFIG.lookup(CONFIG.latency, request.endpoint))
+    if CONFIG.should_fail(request.endpoint):
+        return Response(CONFIG.random.choice([500, 502, 503]))
+    handler = HANDLERS.get(method, {}).get(request.endpoint)
+    if handler is None:
+        return Response(404)
+    return handler(request)
+
+
+def print_post_data(content_type: Optional[str], data: bytes):
+    print()
+    print(f"  POST data ({content_type}):")
+    print(f"  {repr(data)}")
+
+
+class Http2Connection:
+    """Serves an HTTP/2 connection that was started with prior knowledge
+    (h2c), using the same handlers as HTTP/1.1. Each stream is handled in its
+    own thread, so slow responses don't hold up the rest of the connection.
+    """
+    def __init__(self, handler: "RequestHandler"):
+        self.handler = handler
+        self.conn = h2.connection.H2Connection(h2.config.H2Configuration(
+            client_side=False, header_encoding="utf-8",
+        ))
+        # Guards `self.conn` and writes to the socket.
+        self.lock = threading.Condition()
+        # Held while a chunk is sent with a bandwidth limit, so the limit
+        # applies to the whole connection.
+        self.link_lock = threading.Lock()
+        self.requests = {}  # Dict[int, Tuple[Dict[str, str], bytearray]]
+        self.closed = False
+
+    def flush(self):
+        self.handler.wfile.write(self.conn.data_to_send())
+        self.handler.wfile.flush()
+
+    def serve(self):
+        with self.lock:
+            self.conn.initiate_connection()
+            self.flush()
+        while not self.closed:
+            data = self.handler.rfile.read1(65536)
+            if not data:
+                break
+            with self.lock:
+                events = self.conn.receive_data(data)
+                self.flush()
+                for event in events:
+                    self.handle_event(event)
+                self.lock.notify_all()
+        with self.lock:
+            self.closed = True
+            self.lock.notify_all()
+
+    def handle_event(self, event):
+        if isinstance(event, h2.events.RequestReceived):
+            headers = dict(event.headers)
+            self.requests[event.stream_id] = (headers, bytearray())
+        elif isinstance(event, h2.events.DataReceived):
+            self.requests[event.stream_id][1].extend(event.data)
+            self.conn.acknowledge_received_data(
+                event.flow_controlled_length, event.stream_id,
+            )
+            self.flush()
+        elif isinstance(event, h2.events.StreamEnded):
+            headers, body = self.requests.pop(event.stream_id)
+            threading.Thread(
+                target=self.handle_stream,
+                args=(event.stream_id, headers, bytes(body)),
+                daemon=True,
+            ).start()
+        elif isinstance(event, h2.events.StreamReset):
+            self.requests.pop(event.stream_id, None)
+        elif isinstance(event, h2.events.ConnectionTerminated):
+            self.closed = True
+
+    def handle_stream(self, stream_id: int, headers: Dict[str, str],
+                      data: bytes):
+        try:
+            self.respond(stream_id, headers, data)
+        except h2.exceptions.StreamClosedError:
+            # The client reset the stream.
+            pass
+
+    def respond(self, stream_id: int, headers: Dict[str, str], data: bytes):
+        method = headers[":method"]
+        url = urlparse(headers[":path"])
+        if method == "POST" and not CONFIG.quiet:
+            print_post_data(headers.get("content-type"), data)
+
+        endpoint = url.path.rsplit("/", 1)[-1]
+        request = Request(endpoint, url.query.encode(), data, headers)
+        response = respond(method, request)
+        if not CONFIG.quiet:
+            self.handler.log_message(
+                '"%s %s HTTP/2" %d -', method, headers[":path"],
+                response.status,
+            )
+
+        response_headers = [
+            (":status", str(response.status)),
+            ("content-length", str(len(response.body))),
+        ]
+        if response.content_type is not None:
+            response_headers.append(("content-type", response.content_type))
+        response_headers.extend(
+            (name.lower(), value) for name, value in response.headers.items()
+        )
+        with self.lock:
+            self.conn.send_headers(stream_id, response_headers)
+            self.flush()
+
+        body = response.body
+        truncate = CONFIG.should_truncate(endpoint)
+        if truncate:
+            body = body[:len(body) // 2]
+        self.write_body(stream_id, body)
+        with self.lock:
+            if truncate:
+                self.conn.reset_stream(
+                    stream_id, h2.errors.ErrorCodes.INTERNAL_ERROR,
+                )
+            else:
+                self.conn.end_stream(stream_id)
+            self.flush()
+
+    def write_body(self, stream_id: int, body: bytes):
+        while body:
+            with self.lock:
+                while not self.closed and (
+                    self.conn.local_flow_control_window(stream_id) <= 0
+                ):
+                    self.lock.wait()
+                if self.closed:
+                    return
+                size = min(
+                    len(body), CHUNK_SIZE,
+                    self.conn.local_flow_control_window(stream_id),
+                    self.conn.max_outbound_frame_size,
+                )
+            chunk, body = body[:size], body[size:]
+            if CONFIG.bandwidth is None:
+                self.send_data(stream_id, chunk)
+                continue
+            with self.link_lock:
+                self.send_data(stream_id, chunk)
+                time.sleep(len(chunk) / CONFIG.bandwidth)
+
+    def send_data(self, stream_id: int, chunk: bytes):
+        with self.lock:
+            self.conn.send_data(stream_id, chunk)
+            self.flush()
 
-    def handle_anchor(self):
-        self.send_response(200)
-        self.end_headers()
-        self.wfile.write(ANCHOR.encode())
 
-    def handle_payload(self):
-        path = STATE.payload_path()
-        if path is None:
-            self.send_response(400)
-            self.end_headers()
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def handle(self):
+        # HTTP/2 with prior knowledge starts with the connection preface
+        # instead of an HTTP/1.1 request line.
+        if h2 is not None and self.rfile.peek(len(H2_PREFACE)).startswith(
+            H2_PREFACE,
+        ):
+            Http2Connection(self).serve()
             return
+        super().handle()
 
-        self.send_response(200)
-        self.send_header("Content-Type", "image/jpeg")
-        self.end_headers()
-        with open(path, "rb") as f:
-            self.wfile.write(f.read())
+    def do_GET(self):
+        self.handle_request()
 
     def do_POST(self):
-        content_type = self.headers.get("Content-Type")
+        self.handle_request()
+
+    def handle_request(self):
+        url = urlparse(self.path)
         length = int(self.headers.get("Content-Length", 0))
         data = self.rfile.read(length)
-
-        print()
-        print(f"  POST data ({content_type}):")
-        print(f"  {repr(data)}")
-
-        if "/reload?" in self.path:
-            self.handle_reload()
-        elif "/replaceimage?" in self.path:
-            self.handle_replaceimage()
-        elif "/userverify?" in self.path:
-            self.handle_userverify()
-        else:
-            self.send_response(404)
-            self.end_headers()
-
-    def handle_reload(self):
-        self.send_response(200)
+        if self.command == "POST" and not CONFIG.quiet:
+            print_post_data(self.headers.get("Content-Type"), data)
+
+        endpoint = url.path.rsplit("/", 1)[-1]
+        headers = {name.lower(): value for name, value in self.headers.items()}
+        request = Request(endpoint, url.query.encode(), data, headers)
+        response = respond(self.command, request)
+        self.send_response(response.status)
+        if response.content_type is not None:
+            self.send_header("Content-Type", response.content_type)
+        for name, value in response.headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(response.body)))
         self.end_headers()
-        self.wfile.write(STATE.reload().encode())
 
-    def handle_replaceimage(self):
-        self.send_response(200)
-        self.end_headers()
-        self.wfile.write(STATE.replaceimage().encode())
+        body = response.body
+        if CONFIG.should_truncate(endpoint):
+            body = body[:len(body) // 2]
+            self.close_connection = True
+        self.write_body(body)
 
-    def handle_userverify(self):
-        self.send_response(200)
-        self.end_headers()
-        self.wfile.write(STATE.userverify().encode())
+    def write_body(self, body: bytes):
+        if CONFIG.bandwidth is None:
+            self.wfile.write(body)
+            return
+        for i in range(0, len(body), CHUNK_SIZE):
+            chunk = body[i:i + CHUNK_SIZE]
+            self.wfile.write(chunk)
+            self.wfile.flush()
+            time.sleep(len(chunk) / CONFIG.bandwidth)
+
+    def log_message(self, *args, **kwargs):
+        if not CONFIG.quiet:
+            super().log_message(*args, **kwargs)
+
+
+def endpoint_setting(string: str):
+    endpoint, sep, value = string.rpartition("=")
+    return (endpoint if sep else "*", float(value))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="A test server for librecaptcha.",
+    )
+    parser.add_argument(
+        "--port", type=int, default=PORT,
+        help=f"the port to listen on (default: {PORT})",
+    )
+    parser.add_argument(
+        "--latency", metavar="[ENDPOINT=]SECONDS", type=endpoint_setting,
+        action="append", default=[],
+        help="delay responses by the given number of seconds",
+    )
+    parser.add_argument(
+        "--error-rate", metavar="[ENDPOINT=]FRACTION", type=endpoint_setting,
+        action="append", default=[],
+        help="respond with a 5xx error this fraction of the time",
+    )
+    parser.add_argument(
+        "--truncate-rate", metavar="[ENDPOINT=]FRACTION",
+        type=endpoint_setting, action="append", default=[],
+        help="send only half of the response body this fraction of the time",
+    )
+    parser.add_argument(
+        "--bandwidth", metavar="BYTES", type=float,
+        help="limit response bodies to this many bytes per second",
+    )
+    parser.add_argument(
+        "--seed", type=int, help="seed for error and truncation injection",
+    )
+    parser.add_argument(
+        "-q", "--quiet", action="store_true",
+        help="don't log requests or POST data",
+    )
+    return parser.parse_args()
 
 
 def main():
+    args = parse_args()
+    CONFIG.latency.update(args.latency)
+    CONFIG.error_rate.update(args.error_rate)
+    CONFIG.truncate_rate.update(args.truncate_rate)
+    CONFIG.bandwidth = args.bandwidth
+    CONFIG.quiet = args.quiet
+    CONFIG.random.seed(args.seed)
+
     os.chdir(os.path.dirname(__file__) or ".")
-    server = HTTPServer(("", PORT), RequestHandler)
+    server = ThreadingHTTPServer(("", args.port), RequestHandler)
+    server.daemon_threads = True
     server.serve_forever()
 
 
@@ -0,0 +1,155 @@
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+"""A local HTTP server for tests. Requests to paths with a handler in
+`LocalServer.routes` are answered with the `Reply` it returns. Other
+requests get `BODY`, except that responses to ``/truncated`` end partway
+through their body, and ``/slow`` sends `SLOW_BODY` slowly. Every
+response sets a cookie, and the server records every request it receives.
+"""
+
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qsl, urlparse
+import threading
+import time
+
+BODY = b"0123456789" * 10000
+TRUNCATED_LENGTH = 4000
+CHUNK_SIZE = 1024
+# Sent with a short delay before each chunk, so no read times out, but the
+# whole body takes about 2 seconds. It spans several of the chunks in which
+# `librecaptcha.transport` reads responses.
+SLOW_BODY = b"x" * 640 * 1024
+SLOW_DELAY = 0.003
+# How often `serve_forever()` checks for a shutdown, in seconds.
+POLL_INTERVAL = 0.05
+
+Request = namedtuple("Request", [
+    "method",  # str
+    "path",  # str, without the query string
+    "params",  # Dict[str, str], from the query string
+    "headers",  # Case-insensitive mapping
+    "body",  # bytes
+])
+
+
+class Reply(namedtuple("Reply", [
+    "status",  # int
+    "body",  # bytes
+    "headers",  # Dict[str, str], other than Content-Length
+    "length",  # Optional[int], bytes sent before the connection is closed
+    "delay",  # float, seconds to wait before each chunk of the body
+])):
+    def __new__(cls, status=200, body=b"", headers=None, length=None,
+                delay=0):
+        return super().__new__(
+            cls, status, body, headers or {}, length, delay,
+        )
+
+
+def replies(*replies: Reply):
+    """Returns a handler that answers with `replies` in order, and then
+    keeps answering with the last one.
+    """
+    remaining = list(replies)
+    lock = threading.Lock()
+
+    def handler(request: Request) -> Reply:
+        with lock:
+            return remaining.pop(0) if len(remaining) > 1 else remaining[0]
+    return handler
+
+
+def default_reply(request: Request) -> Reply:
+    if request.path == "/truncated":
+        return Reply(body=BODY, length=TRUNCATED_LENGTH)
+    if request.path == "/slow":
+        return Reply(body=SLOW_BODY, delay=SLOW_DELAY)
+    return Reply(body=BODY)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.handle_request()
+
+    def do_POST(self):
+        self.handle_request()
+
+    def handle_request(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length", 0))
+        request = Request(
+            method=self.command,
+            path=url.path,
+            params=dict(parse_qsl(url.query)),
+            headers=self.headers,
+            body=self.rfile.read(length),
+        )
+        self.server.requests.append(request)
+        self.server.cookies.append(self.headers.get("Cookie"))
+        reply = self.server.routes.get(url.path, default_reply)(request)
+
+        self.send_response(reply.status)
+        self.send_header("Set-Cookie", "NID=session-id; Path=/")
+        for name, value in reply.headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(reply.body)))
+        self.end_headers()
+        body = reply.body
+        if reply.length is not None:
+            body = body[:reply.length]
+            self.close_connection = True
+        for i in range(0, len(body), CHUNK_SIZE):
+            time.sleep(reply.delay)
+            self.wfile.write(body[i:i + CHUNK_SIZE])
+            self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), Handler)
+        # Maps paths to functions that take a `Request` and return a `Reply`.
+        self.routes = {}
+        # Every `Request` received, in order.
+        self.requests = []
+        # The ``Cookie`` header of each request, or ``None`` if it had none.
+        self.cookies = []
+        self.thread = threading.Thread(
+            target=self.serve_forever, args=(POLL_INTERVAL,),
+        )
+
+    @property
+    def url(self) -> str:
+        return "http://127.0.0.1:{}/".format(self.server_address[1])
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
@@ -0,0 +1,41 @@
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+import ply.lex
+
+
+class Lexer:
+    tokens = ("STRING", "SEMI")
+
+    t_STRING = r'"[^"]*"'
+    t_SEMI = r";"
+    t_ignore = " \t\n"
+
+    def __init__(self):
+        self.build()
+
+    def build(self, **kwargs):
+        self.lexer = ply.lex.lex(object=self, **kwargs)
+
+    def input(self, text):
+        self.lexer.input(text)
+
+    def token(self):
+        return self.lexer.token()
+
+    def t_error(self, token):
+        raise SyntaxError("Illegal character {!r}".format(token.value[0]))
@@ -0,0 +1,57 @@
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+from slimit import ast
+from slimit.lexer import Lexer
+import ply.yacc
+
+# slimit's own tables aren't included, as when slimit is installed from
+# source.
+lextab, yacctab = "lextab", "yacctab"
+
+
+class Parser:
+    def __init__(self, lex_optimize=True, lextab=lextab,
+                 yacc_optimize=True, yacctab=yacctab, yacc_debug=False):
+        self.lexer = Lexer()
+        self.lexer.build(optimize=lex_optimize, lextab=lextab)
+        self.tokens = self.lexer.tokens
+        self.parser = ply.yacc.yacc(
+            module=self, optimize=yacc_optimize,
+            debug=yacc_debug, tabmodule=yacctab, start="program",
+        )
+        self._error_tokens = {}
+
+    def parse(self, text):
+        return self.parser.parse(text, lexer=self.lexer)
+
+    def p_program(self, p):
+        """program : statement_list"""
+        p[0] = ast.Program(p[1])
+
+    def p_statement_list(self, p):
+        """statement_list : statement
+                          | statement_list statement
+        """
+        p[0] = p[1] + [p[2]] if len(p) == 3 else [p[1]]
+
+    def p_statement(self, p):
+        """statement : STRING SEMI"""
+        p[0] = ast.String(p[1])
+
+    def p_error(self, token):
+        raise SyntaxError("Unexpected token {!r}".format(token))
@@ -0,0 +1,177 @@
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+from librecaptcha import cachedirs, recaptcha
+from librecaptcha.cachedirs import Layer
+from librecaptcha.logs import EXTRACT_LOG
+
+from unittest import mock
+import os
+import os.path
+import tempfile
+import unittest
+
+
+class CacheDirsTest(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.tmpdir = tmpdir.name
+        self.cache_dir = self.dir("cache-dir")
+        self.xdg_cache_home = self.dir("xdg")
+        self.home = self.dir("home")
+        self.system = self.dir("system")
+        self.package = self.dir("package")
+        for patcher in [
+            mock.patch.dict(os.environ, {
+                "LIBRECAPTCHA_CACHE_DIR": self.cache_dir,
+                "XDG_CACHE_HOME": self.xdg_cache_home,
+                "HOME": self.home,
+            }),
+            mock.patch.multiple(
+                cachedirs, SYSTEM_CACHE_DIR=self.system,
+                PACKAGE_CACHE_DIR=self.package,
+            ),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.layers = [
+            self.cache_dir,
+            os.path.join(self.xdg_cache_home, "librecaptcha"),
+            os.path.join(self.home, ".cache", "librecaptcha"),
+            self.system,
+            self.package,
+        ]
+
+    def dir(self, name: str) -> str:
+        return os.path.join(self.tmpdir, name)
+
+    def block(self, path: str):
+        """Makes `path` unwritable by putting a file there. (Permissions
+        don't stop the tests if they're run as root.)
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w"):
+            pass
+
+    def save_rc_version(self, layer: int, version: str):
+        path = os.path.join(self.layers[layer], recaptcha.RC_VERSION_NAME)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            print(1234, file=f)
+            print(version, file=f)
+
+    def test_order(self):
+        self.assertEqual(cachedirs.get_layers(), [
+            Layer(path, i >= 3) for i, path in enumerate(self.layers)
+        ])
+
+    def test_unset(self):
+        del os.environ["LIBRECAPTCHA_CACHE_DIR"]
+        del os.environ["XDG_CACHE_HOME"]
+        self.assertEqual(
+            [layer.path for layer in cachedirs.get_layers()],
+            self.layers[2:],
+        )
+
+    def test_duplicates(self):
+        os.environ["LIBRECAPTCHA_CACHE_DIR"] = self.layers[1]
+        self.assertEqual(
+            [layer.path for layer in cachedirs.get_layers()],
+            self.layers[1:],
+        )
+
+    def test_relative_cache_dir(self):
+        os.environ["LIBRECAPTCHA_CACHE_DIR"] = "relative"
+        self.assertEqual(
+            cachedirs.get_layers()[0].path, os.path.abspath("relative"),
+        )
+
+    def test_relative_xdg_cache_home(self):
+        """Relative paths in ``$XDG_CACHE_HOME`` are invalid, so they're
+        ignored, but logged.
+        """
+        os.environ["XDG_CACHE_HOME"] = "relative"
+        with self.assertLogs(EXTRACT_LOG, "DEBUG") as cm:
+            layers = cachedirs.get_layers()
+        self.assertIn("relative", cm.output[0])
+        self.assertEqual(
+            [layer.path for layer in layers],
+            self.layers[:1] + self.layers[2:],
+        )
+
+    def test_find(self):
+        self.assertEqual(list(cachedirs.find("name")), [
+            os.path.join(path, "name") for path in self.layers
+        ])
+
+    def test_first_hit(self):
+        for layer in [2, 3, 4]:
+            self.save_rc_version(layer, "version-{}".format(layer))
+        self.assertEqual(recaptcha.load_rc_version(), ("version-2", 1234))
+        self.save_rc_version(1, "version-1")
+        self.assertEqual(recaptcha.load_rc_version(), ("version-1", 1234))
+
+    def test_unusable_hit(self):
+        """A file that can't be used is skipped."""
+        self.save_rc_version(0, "")
+        self.save_rc_version(3, "version-3")
+        self.assertEqual(recaptcha.load_rc_version(), ("version-3", 1234))
+
+    def test_write_dir(self):
+        self.assertEqual(cachedirs.get_write_dir(), self.cache_dir)
+        self.block(self.cache_dir)
+        self.assertEqual(cachedirs.get_write_dir(), self.layers[1])
+        self.block(self.xdg_cache_home)
+        self.assertEqual(cachedirs.get_write_dir(), self.layers[2])
+        recaptcha.save_rc_version("saved-version")
+        with open(os.path.join(self.layers[2], "rc-version")) as f:
+            self.assertIn("saved-version", f.read())
+
+    def test_read_only(self):
+        """Files are never written to the read-only layers, even if they're
+        writable.
+        """
+        for path in [self.cache_dir, self.xdg_cache_home, self.home]:
+            self.block(path)
+        os.makedirs(self.system)
+        self.assertIsNone(cachedirs.get_write_dir())
+        self.assertIsNone(cachedirs.write_path("name"))
+        self.assertIsNone(recaptcha.get_http_cache())
+        with self.assertRaises(OSError):
+            recaptcha.save_rc_version("saved-version")
+        self.assertEqual(os.listdir(self.system), [])
+
+    def test_environment_changes(self):
+        """The write directory follows changes to the environment."""
+        self.assertEqual(
+            cachedirs.write_path("name"),
+            os.path.join(self.cache_dir, "name"),
+        )
+        other = self.dir("other")
+        os.environ["LIBRECAPTCHA_CACHE_DIR"] = other
+        self.assertEqual(
+            cachedirs.write_path("name"), os.path.join(other, "name"),
+        )
+        self.assertEqual(
+            recaptcha.get_http_cache().directory,
+            os.path.join(other, recaptcha.HTTP_CACHE_NAME),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+from localserver import BODY, SLOW_BODY, TRUNCATED_LENGTH, LocalServer
+from librecaptcha import daemon
+from librecaptcha.errors import DeadlineExceededError
+from librecaptcha.httpcache import HttpCache
+from librecaptcha.timeouts import Deadline, Timeout
+import requests
+
+import os.path
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+TIMEOUT = Timeout(connect=5, read=5)
+
+
+class DaemonTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "daemon.sock")
+        self.server = daemon.Server(self.path, daemon.RequestHandler)
+        self.server.daemon = daemon.Daemon()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.server.daemon.transport.close()
+        self.tmpdir.cleanup()
+
+    def transport(self) -> daemon.DaemonTransport:
+        return daemon.DaemonTransport(daemon.connect(self.path))
+
+    def test_cookies_not_shared_between_solves(self):
+        with LocalServer() as server:
+            for _ in range(2):
+                transport = self.transport()
+                try:
+                    r = transport.request("GET", server.url, timeout=TIMEOUT)
+                finally:
+                    transport.close()
+                self.assertIn("NID=", r.headers["Set-Cookie"])
+        self.assertEqual(server.cookies, [None, None])
+
+    def test_stream_forwards_partial_body(self):
+        transport = self.transport()
+        received = []
+        try:
+            with LocalServer() as server:
+                with self.assertRaises(requests.RequestException):
+                    with transport.stream(
+                        "GET", server.url + "truncated", timeout=TIMEOUT,
+                    ) as r:
+                        for chunk in r.chunks:
+                            received.append(chunk)
+                # The client can still be used after the failure.
+                with transport.stream(
+                    "GET", server.url, timeout=TIMEOUT,
+                ) as r:
+                    self.assertEqual(b"".join(r.chunks), BODY)
+        finally:
+            transport.close()
+        self.assertEqual(b"".join(received), BODY[:TRUNCATED_LENGTH])
+
+    def test_stream_deadline(self):
+        """Downloads through the daemon stop between chunks once the
+        deadline passes.
+        """
+        transport = self.transport()
+        try:
+            with LocalServer() as server:
+                cache = HttpCache(self.tmpdir.name)
+                deadline = Deadline(0.5)
+                with self.assertRaises(DeadlineExceededError):
+                    cache.download(
+                        transport, "slow", server.url + "slow",
+                        timeout=TIMEOUT, deadline=deadline,
+                    )
+                self.assertLess(-deadline.remaining(), 0.5)
+                size = os.path.getsize(cache._path("slow", "part"))
+                self.assertLess(size, len(SLOW_BODY))
+                # The client can still be used after the download stops.
+                r = transport.request("GET", server.url, timeout=TIMEOUT)
+                self.assertEqual(r.content, BODY)
+        finally:
+            transport.close()
+
+
+class UnresponsiveDaemonTest(unittest.TestCase):
+    def test_timeout(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "daemon.sock")
+            listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            listener.bind(path)
+            listener.listen(1)
+            transport = None
+            try:
+                transport = daemon.DaemonTransport(daemon.connect(path))
+                start = time.monotonic()
+                with self.assertRaises(requests.Timeout):
+                    transport.request(
+                        "GET", "http://127.0.0.1/", timeout=0.5,
+                    )
+                self.assertLess(
+                    time.monotonic() - start, 0.5 + daemon.TIMEOUT_MARGIN + 1,
+                )
+            finally:
+                if transport is not None:
+                    transport.close()
+                listener.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+from librecaptcha import extract_strings
+
+import os
+import os.path
+import sys
+from unittest import mock
+import tempfile
+import unittest
+
+# A stand-in for slimit, which doesn't install on Python 3.
+STUB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         "slimitstub")
+TABLES = [extract_strings.PLY_LEXTAB, extract_strings.PLY_YACCTAB]
+
+
+class SlimitParserTest(unittest.TestCase):
+    def setUp(self):
+        try:
+            import ply.lex
+            import ply.yacc
+        except ImportError:
+            self.skipTest("PLY isn't installed")
+        self.ply_functions = (ply.lex.lex, ply.yacc.yacc)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.environ = mock.patch.dict(
+            os.environ, LIBRECAPTCHA_CACHE_DIR=self.tmpdir.name,
+        )
+        self.environ.start()
+        self.modules = self.unload_modules()
+        sys.path.insert(0, STUB_PATH)
+
+    def tearDown(self):
+        sys.path.remove(STUB_PATH)
+        self.unload_modules()
+        sys.modules.update(self.modules)
+        self.environ.stop()
+        self.tmpdir.cleanup()
+
+    def unload_modules(self):
+        return {
+            name: sys.modules.pop(name) for name in list(sys.modules)
+            if name in TABLES or name.partition(".")[0] == "slimit"
+        }
+
+    def test_extract(self):
+        strings = extract_strings.extract_strings_slimit('"a"; "b";')
+        self.assertEqual(strings, ["a", "b"])
+
+    def test_ply_not_patched(self):
+        """Other users of PLY mustn't see the options while the parser is
+        built.
+        """
+        import ply.yacc
+        lex, yacc = self.ply_functions
+        unpatched = []
+
+        def check_lex(*args, **kwargs):
+            unpatched.append(ply.yacc.yacc is yacc)
+            return lex(*args, **kwargs)
+
+        with mock.patch("ply.lex.lex", check_lex):
+            extract_strings.make_slimit_parser()
+        self.assertEqual(unpatched, [True])
+
+    def test_tables_reused(self):
+        extract_strings.make_slimit_parser()
+        directory = extract_strings.get_ply_tables_dir()
+        self.assertEqual(sorted(os.listdir(directory)), [
+            "slimit_lextab.py", "slimit_yacctab.py",
+        ])
+        for name in TABLES:
+            sys.modules.pop(name, None)
+        parser = extract_strings.make_slimit_parser()
+        for name in TABLES:
+            self.assertEqual(
+                os.path.dirname(sys.modules[name].__file__), directory,
+            )
+        self.assertEqual(parser.parse('"c";').children()[0].value, '"c"')
+
+
+if __name__ == "__main__":
+    unittest.main()
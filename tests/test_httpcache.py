@@ -0,0 +1,400 @@
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+from localserver import LocalServer, Reply
+from librecaptcha import httpcache
+from librecaptcha.httpcache import HttpCache, ResumeError
+from librecaptcha.retry import NO_RETRY, RetryPolicy
+from librecaptcha.transport import RequestsTransport
+import requests
+
+from typing import Optional
+from unittest import mock
+import gzip
+import io
+import os
+import os.path
+import re
+import tempfile
+import unittest
+
+SCRIPT = b"var strings = ['/m/test1', 'Select all squares'];\n" * 200
+LAST_MODIFIED = "Mon, 01 Mar 2021 00:00:00 GMT"
+TIMEOUT = 5
+
+
+class Script:
+    """Serves a script at /script.js the way Google's servers do: with
+    validators, support for conditional and range requests, and
+    compression.
+    """
+    def __init__(self, content=SCRIPT, etag='"v1"',
+                 last_modified=LAST_MODIFIED):
+        self.content = content
+        self.etag = etag
+        self.last_modified = last_modified
+        # Whether ``Range`` requests are answered with partial content.
+        self.ranges = True
+        # Added to the start of the range in ``Content-Range``, to simulate a
+        # server that sends the wrong part of the body.
+        self.range_error = 0
+        # If not ``None``, the connection is closed after this many bytes of
+        # the next response body.
+        self.truncate = None
+
+    def encode(self, request):
+        encodings = {
+            coding.split(";")[0].strip() for coding in
+            request.headers.get("Accept-Encoding", "").split(",")
+        }
+        if "br" in encodings:
+            return (httpcache.brotli.compress(self.content), "br")
+        if "gzip" in encodings:
+            return (gzip.compress(self.content, mtime=0), "gzip")
+        return (self.content, None)
+
+    def validators(self):
+        headers = {"Content-Type": "text/javascript; charset=utf-8"}
+        if self.etag is not None:
+            headers["ETag"] = self.etag
+        if self.last_modified is not None:
+            headers["Last-Modified"] = self.last_modified
+        return headers
+
+    def not_modified(self, request) -> bool:
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return if_none_match == self.etag
+        since = request.headers.get("If-Modified-Since")
+        return since is not None and since == self.last_modified
+
+    def range_start(self, request) -> Optional[int]:
+        """Returns the start of the requested range, or ``None`` if the
+        whole body should be sent.
+        """
+        match = re.fullmatch(r"bytes=(\d+)-", request.headers.get("Range", ""))
+        if match is None or not self.ranges:
+            return None
+        if_range = request.headers.get("If-Range")
+        if if_range not in (None, self.etag, self.last_modified):
+            return None
+        return int(match.group(1))
+
+    def __call__(self, request) -> Reply:
+        headers = self.validators()
+        if self.not_modified(request):
+            return Reply(status=304, headers=headers)
+        body, encoding = self.encode(request)
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        status = 200
+        start = self.range_start(request)
+        if start is not None:
+            status = 206
+            headers["Content-Range"] = "bytes {}-{}/{}".format(
+                start + self.range_error, len(body) - 1, len(body),
+            )
+            body = body[start:]
+        length, self.truncate = self.truncate, None
+        return Reply(status=status, body=body, headers=headers, length=length)
+
+
+class HttpCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.cache = HttpCache(self.tmpdir.name)
+        self.transport = RequestsTransport()
+        self.addCleanup(self.transport.close)
+        self.script = Script()
+        self.server = LocalServer()
+        self.server.routes["/script.js"] = self.script
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__)
+        self.url = self.server.url + "script.js"
+
+    def path(self, ext: str) -> str:
+        return os.path.join(self.tmpdir.name, "script.js.{}".format(ext))
+
+    def last_request(self):
+        return self.server.requests[-1]
+
+    def get(self):
+        return self.cache.get(
+            self.transport, "script.js", self.url, timeout=TIMEOUT,
+            retry=NO_RETRY,
+        )
+
+    def download(self, url=None, retry=NO_RETRY) -> bytes:
+        body = self.cache.download(
+            self.transport, "script.js", url or self.url, timeout=TIMEOUT,
+            retry=retry,
+        )
+        self.assertEqual(body.path, self.path("body"))
+        self.assertEqual(body.encoding, "utf-8")
+        with open(body.path, "rb") as f:
+            return f.read()
+
+
+class GetTest(HttpCacheTestCase):
+    def setUp(self):
+        super().setUp()
+        # The number of requests made so far.
+        self.requests = 0
+
+    def assert_cached(self, content=SCRIPT):
+        """Checks that the next request is answered from the cache."""
+        r = self.get()
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.content, content)
+        self.assertEqual(len(self.server.requests), 1 + self.requests)
+        self.requests += 1
+
+    def first_get(self):
+        r = self.get()
+        self.requests += 1
+        self.assertEqual(r.content, SCRIPT)
+        headers = self.last_request().headers
+        self.assertNotIn("If-None-Match", headers)
+        self.assertNotIn("If-Modified-Since", headers)
+
+    def test_etag(self):
+        self.script.last_modified = None
+        self.first_get()
+        self.assert_cached()
+        headers = self.last_request().headers
+        self.assertEqual(headers["If-None-Match"], '"v1"')
+        self.assertNotIn("If-Modified-Since", headers)
+
+    def test_last_modified(self):
+        self.script.etag = None
+        self.first_get()
+        self.assert_cached()
+        headers = self.last_request().headers
+        self.assertEqual(headers["If-Modified-Since"], LAST_MODIFIED)
+        self.assertNotIn("If-None-Match", headers)
+
+    def test_not_modified_response(self):
+        self.first_get()
+        r = self.get()
+        self.assertEqual(
+            r.headers["Content-Type"], "text/javascript; charset=utf-8",
+        )
+        self.assertEqual(r.text, SCRIPT.decode())
+
+    def test_changed(self):
+        self.first_get()
+        self.script.content = b"var changed;"
+        self.script.etag = '"v2"'
+        r = self.get()
+        self.assertEqual(r.content, b"var changed;")
+        self.assertEqual(self.last_request().headers["If-None-Match"], '"v1"')
+        # The new response replaces the stale one.
+        self.requests += 1
+        self.assert_cached(b"var changed;")
+        self.assertEqual(self.last_request().headers["If-None-Match"], '"v2"')
+
+    def test_no_validators(self):
+        self.script.etag = self.script.last_modified = None
+        self.first_get()
+        self.first_get()
+        self.assertFalse(os.path.exists(self.path("json")))
+
+    def test_other_url(self):
+        self.first_get()
+        self.url += "?v=2"
+        self.first_get()
+
+    def test_corrupt_sidecar(self):
+        self.first_get()
+        with open(self.path("json"), "w") as f:
+            f.write('{"url": ')
+        self.first_get()
+        # The entry is saved again.
+        self.assert_cached()
+
+    def test_missing_sidecar(self):
+        self.first_get()
+        os.remove(self.path("json"))
+        self.first_get()
+        self.assert_cached()
+
+    def test_missing_body(self):
+        self.first_get()
+        os.remove(self.path("body"))
+        r = self.get()
+        self.assertEqual(r.content, SCRIPT)
+        # A 304 response is useless without the body, so the request is sent
+        # again without validators.
+        conditional, unconditional = self.server.requests[-2:]
+        self.assertEqual(conditional.headers["If-None-Match"], '"v1"')
+        self.assertNotIn("If-None-Match", unconditional.headers)
+        self.assertTrue(os.path.exists(self.path("body")))
+
+
+class DecodeTest(HttpCacheTestCase):
+    def test_accept_encoding(self):
+        self.get()
+        encodings = self.last_request().headers["Accept-Encoding"]
+        if httpcache.brotli is None:
+            self.assertEqual(encodings, "gzip")
+        else:
+            self.assertEqual(encodings, "br, gzip")
+
+    def test_gzip(self):
+        with mock.patch.object(httpcache, "ACCEPT_ENCODING", "gzip"):
+            self.assertEqual(self.get().content, SCRIPT)
+            self.assertEqual(self.download(), SCRIPT)
+
+    def test_brotli(self):
+        if httpcache.brotli is None:
+            self.skipTest("brotli isn't installed")
+        self.assertEqual(self.get().content, SCRIPT)
+        self.assertEqual(self.download(), SCRIPT)
+        with open(self.path("body"), "rb") as f:
+            self.assertEqual(f.read(), SCRIPT)
+
+    def test_without_brotli(self):
+        with mock.patch.multiple(
+            httpcache, brotli=None, ACCEPT_ENCODING="gzip",
+        ):
+            self.assertEqual(self.download(), SCRIPT)
+            self.assertEqual(
+                self.last_request().headers["Accept-Encoding"], "gzip",
+            )
+            with self.assertRaises(ValueError):
+                httpcache.decode_file(io.BytesIO(), io.BytesIO(), "br")
+
+    def test_identity(self):
+        with mock.patch.object(httpcache, "ACCEPT_ENCODING", "identity"):
+            self.assertEqual(self.download(), SCRIPT)
+
+    def test_unsupported(self):
+        with self.assertRaises(ValueError):
+            httpcache.decode_file(io.BytesIO(), io.BytesIO(), "compress")
+
+
+class ResumeTest(HttpCacheTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(httpcache, "ACCEPT_ENCODING", "identity")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def interrupt(self, length=1000):
+        """Makes a download that is cut short after `length` bytes."""
+        self.script.truncate = length
+        with self.assertRaises(requests.RequestException):
+            self.download()
+        self.assertEqual(os.path.getsize(self.path("part")), length)
+        self.assertFalse(os.path.exists(self.path("body")))
+
+    def assert_done(self, content=SCRIPT):
+        with open(self.path("body"), "rb") as f:
+            self.assertEqual(f.read(), content)
+        for ext in ["part", "part.json"]:
+            self.assertFalse(os.path.exists(self.path(ext)))
+
+    def test_resume(self):
+        self.interrupt()
+        self.assertEqual(self.download(), SCRIPT)
+        headers = self.last_request().headers
+        self.assertEqual(headers["Range"], "bytes=1000-")
+        self.assertEqual(headers["If-Range"], '"v1"')
+        self.assert_done()
+
+    def test_resume_gzip(self):
+        """The encoded body is resumed and decoded once it's complete."""
+        with mock.patch.object(httpcache, "ACCEPT_ENCODING", "gzip"):
+            length = len(gzip.compress(SCRIPT, mtime=0)) // 2
+            self.interrupt(length)
+            self.assertEqual(self.download(), SCRIPT)
+        self.assertEqual(
+            self.last_request().headers["Range"], "bytes={}-".format(length),
+        )
+        self.assert_done()
+
+    def test_retry(self):
+        """Retries continue where the failed attempt stopped."""
+        self.script.truncate = 1000
+        retry = RetryPolicy(attempts=2, base_delay=0.01)
+        self.assertEqual(self.download(retry=retry), SCRIPT)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.last_request().headers["Range"], "bytes=1000-")
+
+    def test_last_modified(self):
+        """Weak entity tags can't be used with ``If-Range``, so
+        ``Last-Modified`` is used instead.
+        """
+        self.script.etag = 'W/"v1"'
+        self.interrupt()
+        self.assertEqual(self.download(), SCRIPT)
+        self.assertEqual(
+            self.last_request().headers["If-Range"], LAST_MODIFIED,
+        )
+
+    def test_no_validators(self):
+        self.script.etag = None
+        self.script.last_modified = None
+        self.interrupt()
+        self.assertEqual(self.download(), SCRIPT)
+        self.assertNotIn("Range", self.last_request().headers)
+
+    def test_full_response(self):
+        """A server that ignores ``Range`` makes the download restart."""
+        self.interrupt()
+        self.script.ranges = False
+        self.assertEqual(self.download(), SCRIPT)
+        self.assertIn("Range", self.last_request().headers)
+        self.assert_done()
+
+    def test_changed(self):
+        """If the script changed, ``If-Range`` makes the server send all of
+        the new version.
+        """
+        self.interrupt()
+        self.script.content = SCRIPT.upper()
+        self.script.etag = '"v2"'
+        self.assertEqual(self.download(), SCRIPT.upper())
+        self.assertEqual(self.last_request().headers["If-Range"], '"v1"')
+        self.assert_done(SCRIPT.upper())
+
+    def test_wrong_range(self):
+        self.interrupt()
+        self.script.range_error = 1
+        with self.assertRaises(ResumeError):
+            self.download()
+        self.assertFalse(os.path.exists(self.path("part.json")))
+        # The next attempt starts over.
+        self.script.range_error = 0
+        self.assertEqual(self.download(), SCRIPT)
+        self.assertNotIn("Range", self.last_request().headers)
+        self.assert_done()
+
+    def test_other_url(self):
+        """A partial download of another URL isn't resumed."""
+        self.interrupt()
+        self.server.routes["/other.js"] = Script(content=SCRIPT.upper())
+        other_url = self.server.url + "other.js"
+        self.assertEqual(self.download(other_url), SCRIPT.upper())
+        self.assertEqual(self.last_request().path, "/other.js")
+        self.assertNotIn("Range", self.last_request().headers)
+        self.assert_done(SCRIPT.upper())
+
+
+if __name__ == "__main__":
+    unittest.main()
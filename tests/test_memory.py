@@ -0,0 +1,53 @@
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import os.path
+import subprocess
+import sys
+import tempfile
+import unittest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARK_DIR = os.path.join(REPO_DIR, "benchmarks")
+REPLACEMENTS = 200
+TIMEOUT = 300  # seconds
+
+
+class MemoryTest(unittest.TestCase):
+    def test_dynamic_replacements(self):
+        """Replaces tiles in a dynamic challenge from the test server 200
+        times through the CLI, and fails if memory grows by more than the
+        budget in benchmarks/memory.py. The benchmark runs in its own
+        process, so the RSS it measures belongs to the solve alone.
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            env = dict(os.environ, LIBRECAPTCHA_CACHE_DIR=tmpdir)
+            proc = subprocess.run(
+                [sys.executable, "memory.py", "--no-save",
+                 str(REPLACEMENTS)],
+                cwd=BENCHMARK_DIR, env=env, timeout=TIMEOUT,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            )
+        self.assertEqual(proc.returncode, 0, (
+            proc.stdout.decode(errors="replace") +
+            proc.stderr.decode(errors="replace")
+        ))
+
+
+if __name__ == "__main__":
+    unittest.main()
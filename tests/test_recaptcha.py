@@ -0,0 +1,220 @@
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+from localserver import LocalServer, Reply
+from librecaptcha import recaptcha
+from librecaptcha.recaptcha import (
+    LazyImage, MultiCaptchaSolver, ReCaptcha, StringTableCache,
+)
+from librecaptcha.retry import NO_RETRY
+
+from unittest import mock
+import json
+import threading
+import time
+import unittest
+
+# A multicaptcha "pmeta" with three challenges.
+PMETA = ["pmeta", None, None, None, None, [[
+    ["/m/test{}".format(i), None, 1234, 4, 4, None, None, []]
+    for i in range(3)
+], []]]
+
+
+def dresp(num: int) -> str:
+    return ")]}'\n" + json.dumps([
+        "dresp", "dresp-token-{}".format(num), ["id-{}".format(num)],
+        None, [], "dresp-p-{}".format(num),
+    ])
+
+
+class PrefetchTest(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalServer()
+        self.server.routes["/replaceimage"] = self.replaceimage
+        self.server.routes["/payload"] = self.payload
+        self.dresp_num = 0
+        # The "p" values for which the next payload request fails.
+        self.fail_p = set()
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__)
+        base_url = mock.patch.object(recaptcha, "BASE_URL", self.server.url)
+        base_url.start()
+        self.addCleanup(base_url.stop)
+
+        self.rc = ReCaptcha(
+            "test-api-key", "http://localhost", "test-user-agent",
+            make_requests=False, prefetch=True, rc_version="test-version",
+            retry=NO_RETRY, goal_finder=lambda id: None,
+        )
+        self.addCleanup(self.rc.transport.close)
+        self.rc.current_token = "token"
+        self.rc.current_p = "p"
+        self.solver = MultiCaptchaSolver(self.rc, PMETA)
+
+    def replaceimage(self, request):
+        self.dresp_num += 1
+        return Reply(body=dresp(self.dresp_num).encode())
+
+    def payload(self, request):
+        p = request.params.get("p")
+        if p in self.fail_p:
+            self.fail_p.remove(p)
+            return Reply(status=500)
+        return Reply(body="image-{}".format(p).encode())
+
+    def payload_requests(self):
+        return [
+            r.params.get("p") for r in self.server.requests
+            if r.path == "/payload"
+        ]
+
+    def first_challenge(self) -> LazyImage:
+        """Gets the first challenge, waits for the next image to be
+        prefetched, and returns it, or ``None`` if prefetching failed.
+        """
+        self.solver.first_challenge()
+        params, future = self.solver.prefetched
+        self.assertEqual(params, {"p": "p", "k": None, "id": "2"})
+        try:
+            return future.result(timeout=5)
+        except Exception:
+            return None
+
+    def test_hit(self):
+        prefetched = self.first_challenge()
+        challenge = self.solver.select_indices([0])
+        self.assertIs(challenge.image, prefetched)
+        self.assertEqual(challenge.image.data, b"image-p")
+        # The first image, and the image that was prefetched once.
+        self.assertEqual(self.payload_requests(), [None, "p"])
+        # The image after that is prefetched with the "p" from the dresp.
+        self.assertEqual(self.solver.prefetched[0]["p"], "dresp-p-1")
+
+    def test_mismatch(self):
+        prefetched = self.first_challenge()
+        self.rc.current_p = "other-p"
+        with mock.patch.object(LazyImage, "close", autospec=True) as close:
+            challenge = self.solver.select_indices([0])
+        self.assertIsNot(challenge.image, prefetched)
+        self.assertEqual(challenge.image.data, b"image-other-p")
+        close.assert_called_once_with(prefetched)
+        self.assertEqual(self.payload_requests(), [None, "p", "other-p"])
+
+    def test_failure(self):
+        self.fail_p.add("p")
+        self.assertIsNone(self.first_challenge())
+        challenge = self.solver.select_indices([0])
+        self.assertEqual(challenge.image.data, b"image-p")
+        self.assertEqual(self.payload_requests(), [None, "p", "p"])
+
+
+class StringTableCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = StringTableCache(max_size=2)
+        # The versions loaded so far, in order.
+        self.loads = []
+
+    def loader(self, rc_version: str, delay=0):
+        def load():
+            self.loads.append(rc_version)
+            time.sleep(delay)
+            return ["strings-{}".format(rc_version)]
+        return load
+
+    def get(self, rc_version: str):
+        return self.cache.get(rc_version, self.loader(rc_version))
+
+    def test_concurrent(self):
+        """Threads that ask for the same table at once share one load."""
+        barrier = threading.Barrier(8)
+        results = []
+
+        def run():
+            barrier.wait()
+            results.append(self.cache.get("v1", self.loader("v1", 0.1)))
+        threads = [threading.Thread(target=run) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.loads, ["v1"])
+        self.assertEqual(len(results), 8)
+        for table in results:
+            self.assertIs(table, results[0])
+
+    def test_concurrent_versions(self):
+        """Loading one version doesn't block loading another."""
+        loading = threading.Event()
+        release = threading.Event()
+
+        def load_v1():
+            loading.set()
+            release.wait(5)
+            return ["strings-v1"]
+        thread = threading.Thread(target=self.cache.get, args=(
+            "v1", load_v1,
+        ))
+        thread.start()
+        try:
+            self.assertTrue(loading.wait(5))
+            self.assertEqual(self.get("v2"), ["strings-v2"])
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual(self.get("v1"), ["strings-v1"])
+        self.assertEqual(self.loads, ["v2"])
+
+    def test_failure(self):
+        """A failed load isn't cached, so the next call tries again."""
+        def fail():
+            raise OSError("test")
+        with self.assertRaises(OSError):
+            self.cache.get("v1", fail)
+        self.assertEqual(self.get("v1"), ["strings-v1"])
+        self.assertEqual(self.cache.loading, {})
+
+    def test_eviction(self):
+        for version in ["v1", "v2", "v1", "v3"]:
+            self.get(version)
+        # "v2" was the least recently used when "v3" was added.
+        self.assertEqual(list(self.cache.tables), ["v1", "v3"])
+        self.assertEqual(self.loads, ["v1", "v2", "v3"])
+        self.get("v1")
+        self.get("v2")
+        self.assertEqual(self.loads, ["v1", "v2", "v3", "v2"])
+        self.assertEqual(list(self.cache.tables), ["v1", "v2"])
+
+    def test_shared_between_instances(self):
+        load = mock.Mock(return_value=["strings"])
+        with mock.patch.multiple(
+            recaptcha, JS_STRINGS_CACHE=self.cache, load_js_strings=load,
+        ):
+            instances = [
+                ReCaptcha(
+                    "test-api-key", "http://localhost", "test-user-agent",
+                    rc_version="v1",
+                ) for _ in range(2)
+            ]
+        for rc in instances:
+            rc.transport.close()
+        self.assertEqual(load.call_count, 1)
+        self.assertIs(instances[0].js_strings, instances[1].js_strings)
+
+
+if __name__ == "__main__":
+    unittest.main()
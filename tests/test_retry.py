@@ -0,0 +1,247 @@
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+from localserver import LocalServer, Reply, replies
+from librecaptcha import recaptcha, retry, timeouts
+from librecaptcha.metrics import PrometheusSink
+from librecaptcha.recaptcha import ReCaptcha
+from librecaptcha.retry import (
+    NO_RETRY, RETRY_ERRORS, RETRY_STATUSES, RetryPolicy,
+)
+from librecaptcha.timeouts import Deadline
+import requests
+
+from unittest import mock
+import unittest
+
+# Short enough that tests which really wait don't take long.
+FAST_RETRY = RetryPolicy(attempts=3, base_delay=0.01, max_delay=0.01)
+
+
+class FakeResponse:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+
+
+class CallTest(unittest.TestCase):
+    """Tests `RetryPolicy.call()` with a fake clock."""
+
+    def setUp(self):
+        self.now = 0.0
+        self.sleeps = []
+        for name, func in [
+            ("monotonic", lambda: self.now), ("sleep", self.sleep),
+        ]:
+            patcher = mock.patch.object(timeouts.time, name, func)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # Always wait for the longest possible delay.
+        patcher = mock.patch.object(retry.random, "uniform", lambda a, b: b)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.attempts = []
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def send(self, *results):
+        """Returns a `send` function for `RetryPolicy.call()` that returns
+        or raises each of `results` in order, and then keeps using the last.
+        """
+        results = list(results)
+
+        def send(attempt):
+            self.attempts.append(attempt)
+            result = results.pop(0) if len(results) > 1 else results[0]
+            if isinstance(result, Exception):
+                raise result
+            return FakeResponse(result)
+        return send
+
+    def test_statuses(self):
+        for status in sorted(RETRY_STATUSES):
+            self.attempts = []
+            r = RetryPolicy().call(self.send(status, 200))
+            self.assertEqual(r.status_code, 200)
+            self.assertEqual(self.attempts, [1, 2])
+
+    def test_errors(self):
+        for error in RETRY_ERRORS:
+            self.attempts = []
+            r = RetryPolicy().call(self.send(error(), 200))
+            self.assertEqual(r.status_code, 200)
+            self.assertEqual(self.attempts, [1, 2])
+
+    def test_client_error(self):
+        for status in [400, 403, 404]:
+            self.attempts = []
+            r = RetryPolicy().call(self.send(status, 200))
+            self.assertEqual(r.status_code, status)
+            self.assertEqual(self.attempts, [1])
+        self.assertEqual(self.sleeps, [])
+
+    def test_other_error(self):
+        with self.assertRaises(ValueError):
+            RetryPolicy().call(self.send(ValueError(), 200))
+        self.assertEqual(self.attempts, [1])
+
+    def test_attempts(self):
+        r = RetryPolicy(attempts=3).call(self.send(503))
+        self.assertEqual(r.status_code, 503)
+        self.assertEqual(self.attempts, [1, 2, 3])
+        with self.assertRaises(requests.Timeout):
+            RetryPolicy(attempts=3).call(self.send(requests.Timeout()))
+        self.assertEqual(self.attempts, [1, 2, 3] * 2)
+
+    def test_no_retry(self):
+        r = NO_RETRY.call(self.send(503, 200))
+        self.assertEqual(r.status_code, 503)
+        with self.assertRaises(requests.ConnectionError):
+            NO_RETRY.call(self.send(requests.ConnectionError(), 200))
+        self.assertEqual(self.attempts, [1, 1])
+        self.assertEqual(self.sleeps, [])
+
+    def test_max_delay(self):
+        policy = RetryPolicy(attempts=8, base_delay=0.5, max_delay=4)
+        policy.call(self.send(503))
+        self.assertEqual(self.sleeps, [0.5, 1, 2, 4, 4, 4, 4])
+
+    def test_deadline(self):
+        """No retry is made if the deadline would pass during the wait."""
+        deadline = Deadline(5)
+        policy = RetryPolicy(attempts=10, base_delay=1, max_delay=8)
+        r = policy.call(self.send(503), deadline)
+        self.assertEqual(r.status_code, 503)
+        # After waiting 1 and 2 seconds, 2 seconds are left, but the next
+        # wait would be 4 seconds.
+        self.assertEqual(self.sleeps, [1, 2])
+        self.assertEqual(self.attempts, [1, 2, 3])
+        with self.assertRaises(requests.Timeout):
+            policy.call(self.send(requests.Timeout()), Deadline(0.5))
+        self.assertEqual(self.sleeps, [1, 2])
+
+
+class BackoffTest(unittest.TestCase):
+    def test_full_jitter(self):
+        policy = RetryPolicy(base_delay=0.5, max_delay=4)
+        for attempt, limit in enumerate([0.5, 1, 2, 4, 4, 4], start=1):
+            delays = [policy.backoff(attempt) for _ in range(1000)]
+            self.assertGreaterEqual(min(delays), 0)
+            self.assertLessEqual(max(delays), limit)
+            # The delays are spread over the whole range.
+            self.assertLess(min(delays), limit * 0.1)
+            self.assertGreater(max(delays), limit * 0.9)
+
+
+class ReCaptchaRetryTest(unittest.TestCase):
+    """Tests retries of requests sent by `ReCaptcha` to a local server."""
+
+    def setUp(self):
+        self.server = LocalServer()
+        self.server.routes["/stall"] = replies(
+            Reply(body=b"late", delay=1), Reply(body=b"ok"),
+        )
+        self.server.routes["/truncated"] = replies(
+            Reply(body=b"x" * 4096, length=100), Reply(body=b"ok"),
+        )
+        self.server.routes["/corrupt"] = replies(
+            Reply(body=b"not gzip", headers={"Content-Encoding": "gzip"}),
+            Reply(body=b"ok"),
+        )
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__)
+        patcher = mock.patch.object(recaptcha, "BASE_URL", self.server.url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.events = []
+        self.sink = PrometheusSink()
+
+    def on_request(self, event):
+        self.events.append(event)
+        self.sink(event)
+
+    def recaptcha(self, retry=FAST_RETRY) -> ReCaptcha:
+        rc = ReCaptcha(
+            "test-api-key", "http://localhost", "test-user-agent",
+            make_requests=False, rc_version="test-version",
+            on_request=self.on_request, retry=retry,
+        )
+        self.addCleanup(rc.transport.close)
+        return rc
+
+    def requests_to(self, path: str) -> int:
+        return sum(r.path == path for r in self.server.requests)
+
+    def test_statuses(self):
+        rc = self.recaptcha()
+        for status in sorted(RETRY_STATUSES):
+            path = "/status{}".format(status)
+            self.server.routes[path] = replies(
+                Reply(status), Reply(body=b"ok"),
+            )
+            r = rc.get(path[1:])
+            self.assertEqual(r.content, b"ok")
+            self.assertEqual(self.requests_to(path), 2)
+
+    def test_errors(self):
+        rc = self.recaptcha()
+        for path, kwargs in [
+            ("stall", {"timeout": 0.2}),
+            ("truncated", {}),
+            ("corrupt", {}),
+        ]:
+            r = rc.get(path, **kwargs)
+            self.assertEqual(r.content, b"ok")
+            self.assertEqual(self.requests_to("/" + path), 2)
+
+    def test_client_error(self):
+        self.server.routes["/missing"] = replies(
+            Reply(404), Reply(body=b"ok"),
+        )
+        with self.assertRaises(requests.HTTPError):
+            self.recaptcha().get("missing")
+        self.assertEqual(self.requests_to("/missing"), 1)
+
+    def test_post(self):
+        self.server.routes["/userverify"] = replies(
+            Reply(503), Reply(body=b"ok"),
+        )
+        with self.assertRaises(requests.HTTPError):
+            self.recaptcha().post("userverify")
+        self.assertEqual(self.requests_to("/userverify"), 1)
+
+    def test_no_retry(self):
+        with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+            self.recaptcha(NO_RETRY).get("truncated")
+        self.assertEqual(self.requests_to("/truncated"), 1)
+
+    def test_metrics(self):
+        self.server.routes["/flaky"] = replies(
+            Reply(503), Reply(502), Reply(body=b"ok"),
+        )
+        self.recaptcha().get("flaky")
+        self.assertEqual([e.attempt for e in self.events], [1, 2, 3])
+        self.assertEqual([e.status for e in self.events], [503, 502, 200])
+        self.assertIn(
+            'librecaptcha_http_retries_total{endpoint="flaky"} 2\n',
+            self.sink.render(),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,208 @@
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+from librecaptcha import stringtable
+from librecaptcha.stringtable import (
+    FORMAT_JSON, HEADER, MAGIC, StringTable,
+)
+
+import os
+import os.path
+import struct
+import tempfile
+import unittest
+
+VERSION = "3/test-version"
+STRINGS = [
+    "/m/test1", "Select all squares with", "traffic lights", "", "ab", "a",
+    "/m/test1", "caf\u00e9", "\u6c7d\u8f66", "\U0001f697",
+    # Lone surrogates can appear in JavaScript strings.
+    "\ud800",
+]
+
+
+class StringTableTestCase(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, "strings")
+
+    def save(self, strings=STRINGS, format=stringtable.FORMAT_BINARY):
+        stringtable.save(self.path, VERSION, strings, format)
+
+    def load(self, version=VERSION):
+        strings = stringtable.load(self.path, version)
+        if isinstance(strings, StringTable):
+            self.addCleanup(strings.close)
+        return strings
+
+    def read(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def write(self, data: bytes):
+        with open(self.path, "wb") as f:
+            f.write(data)
+
+
+class BinaryTest(StringTableTestCase):
+    def setUp(self):
+        super().setUp()
+        self.save()
+        self.table = self.load()
+
+    def test_round_trip(self):
+        self.assertIsInstance(self.table, StringTable)
+        self.assertEqual(self.table.version, VERSION)
+        self.assertEqual(len(self.table), len(STRINGS))
+        self.assertEqual(list(self.table), STRINGS)
+        self.assertEqual(self.table[-1], STRINGS[-1])
+        for index in [len(STRINGS), -len(STRINGS) - 1]:
+            with self.assertRaises(IndexError):
+                self.table[index]
+
+    def test_empty(self):
+        self.save([])
+        table = self.load()
+        self.assertEqual(list(table), [])
+        with self.assertRaises(ValueError):
+            table.index("")
+
+    def test_header(self):
+        data = self.read()
+        magic, version_length, count, blob_offset = HEADER.unpack_from(data)
+        self.assertEqual(magic, MAGIC)
+        self.assertEqual(version_length, len(VERSION))
+        self.assertEqual(count, len(STRINGS))
+        self.assertEqual(blob_offset % 4, 0)
+        version = data[HEADER.size:HEADER.size + version_length]
+        self.assertEqual(version.decode(), VERSION)
+
+    def test_id_table(self):
+        """The id table is sorted by UTF-8 bytes, and then by index."""
+        ids = [
+            self.table._uint32(self.table.ids_offset + 4 * i)
+            for i in range(len(STRINGS))
+        ]
+        self.assertEqual(sorted(ids), list(range(len(STRINGS))))
+        keys = [(stringtable._encode(STRINGS[i]), i) for i in ids]
+        self.assertEqual(keys, sorted(keys))
+
+    def test_index(self):
+        """`index()` behaves like `list.index()`."""
+        for value in STRINGS:
+            for start in range(-len(STRINGS) - 1, len(STRINGS) + 1):
+                try:
+                    expected = STRINGS.index(value, start)
+                except ValueError:
+                    with self.assertRaises(ValueError):
+                        self.table.index(value, start)
+                else:
+                    self.assertEqual(
+                        self.table.index(value, start), expected,
+                    )
+
+    def test_index_missing(self):
+        for value in ["missing", "/m/test", "/m/test10", "\uffff"]:
+            with self.assertRaises(ValueError):
+                self.table.index(value)
+
+    def test_version(self):
+        with self.assertRaises(ValueError):
+            self.load("3/other-version")
+
+
+class JsonTest(StringTableTestCase):
+    def test_round_trip(self):
+        self.save(format=FORMAT_JSON)
+        self.assertTrue(self.read().startswith(VERSION.encode() + b"\n"))
+        self.assertEqual(self.load(), STRINGS)
+
+    def test_legacy(self):
+        """Files written by earlier versions, which only used JSON, can be
+        read.
+        """
+        self.write('{}\n["/m/test1", "traffic lights"]'.format(
+            VERSION,
+        ).encode())
+        self.assertEqual(self.load(), ["/m/test1", "traffic lights"])
+
+    def test_version(self):
+        self.save(format=FORMAT_JSON)
+        with self.assertRaises(ValueError):
+            self.load("3/other-version")
+
+
+class CorruptionTest(StringTableTestCase):
+    def test_truncated(self):
+        self.save()
+        data = self.read()
+        for length in range(len(data)):
+            self.write(data[:length])
+            with self.assertRaises(ValueError, msg=length):
+                self.load()
+
+    def test_truncated_json(self):
+        self.save(format=FORMAT_JSON)
+        data = self.read()
+        for length in [0, len(VERSION), len(VERSION) + 5, len(data) - 1]:
+            self.write(data[:length])
+            with self.assertRaises(ValueError, msg=length):
+                self.load()
+
+    def test_header(self):
+        self.save()
+        data = self.read()
+        magic, version_length, count, blob_offset = HEADER.unpack_from(data)
+        for header in [
+            (MAGIC[:-1] + b"\x02", version_length, count, blob_offset),
+            (MAGIC, version_length + 1000, count, blob_offset),
+            (MAGIC, version_length, count + 1000, blob_offset),
+            (MAGIC, version_length, count, blob_offset - 4),
+            (MAGIC, version_length, count, len(data)),
+            (MAGIC, version_length, 2 ** 32 - 1, blob_offset),
+        ]:
+            self.write(HEADER.pack(*header) + data[HEADER.size:])
+            with self.assertRaises(ValueError, msg=header):
+                self.load()
+
+    def test_blob_length(self):
+        """The last entry of the offsets table, the length of the blob,
+        can't extend past the end of the file.
+        """
+        self.save()
+        table = self.load()
+        offset = table.offsets_offset + 4 * len(STRINGS)
+        table.close()
+        data = bytearray(self.read())
+        struct.pack_into("<I", data, offset, len(data))
+        self.write(bytes(data))
+        with self.assertRaises(ValueError):
+            self.load()
+
+    def test_failed_save(self):
+        """A failed save leaves the existing file in place."""
+        self.save()
+        data = self.read()
+        with self.assertRaises(AttributeError):
+            self.save(STRINGS + [None])
+        self.assertEqual(self.read(), data)
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), ["strings"])
+
+
+if __name__ == "__main__":
+    unittest.main()
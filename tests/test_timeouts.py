@@ -0,0 +1,214 @@
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+from localserver import SLOW_BODY, LocalServer, Reply
+from librecaptcha import recaptcha, timeouts
+from librecaptcha.errors import DeadlineExceededError
+from librecaptcha.extract_strings import load_javascript
+from librecaptcha.httpcache import HttpCache
+from librecaptcha.recaptcha import ReCaptcha
+from librecaptcha.retry import NO_RETRY, RetryPolicy
+from librecaptcha.timeouts import Deadline, Timeout
+from librecaptcha.transport import RequestsTransport
+import requests
+
+from unittest import mock
+import os.path
+import tempfile
+import time
+import unittest
+
+# How long a stalled server waits before it replies.
+STALL = 2
+DEADLINE = 0.5
+# How much later than the deadline an error may be raised.
+MARGIN = 0.5
+
+
+class DeadlineTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(
+            timeouts.time, "monotonic", lambda: self.now,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.deadline = Deadline(10)
+
+    def test_remaining(self):
+        self.assertEqual(self.deadline.remaining(), 10)
+        self.now += 4
+        self.assertEqual(self.deadline.remaining(), 6)
+        self.assertFalse(self.deadline.exceeded)
+        self.now += 6
+        self.assertEqual(self.deadline.remaining(), 0)
+        self.assertTrue(self.deadline.exceeded)
+
+    def test_check(self):
+        self.now += 9.5
+        self.deadline.check()
+        self.now += 0.5
+        with self.assertRaises(DeadlineExceededError) as cm:
+            self.deadline.check()
+        self.assertEqual(cm.exception.seconds, 10)
+        timeouts.check(None)
+
+    def test_limit(self):
+        timeout = Timeout(connect=5, read=20)
+        self.assertEqual(self.deadline.limit(timeout), Timeout(5, 10))
+        self.now += 7
+        self.assertEqual(self.deadline.limit(timeout), Timeout(3, 3))
+        self.now += 3
+        with self.assertRaises(DeadlineExceededError):
+            self.deadline.limit(timeout)
+
+    def test_limit_optional(self):
+        timeout = Timeout(connect=5, read=20)
+        self.assertIs(timeouts.limit(timeout, None), timeout)
+        self.assertIsNone(timeouts.limit(None, None))
+        self.assertEqual(
+            timeouts.limit(None, self.deadline), Timeout(10, 10),
+        )
+
+    def test_deadline_errors(self):
+        with self.assertRaises(requests.Timeout):
+            with timeouts.deadline_errors(self.deadline):
+                raise requests.Timeout()
+        self.now += 10
+        for error in [requests.Timeout, requests.ConnectionError]:
+            with self.assertRaises(DeadlineExceededError):
+                with timeouts.deadline_errors(self.deadline):
+                    raise error()
+        with self.assertRaises(requests.Timeout):
+            with timeouts.deadline_errors(None):
+                raise requests.Timeout()
+
+
+def stall(request) -> Reply:
+    time.sleep(STALL)
+    return Reply(body=b"late")
+
+
+class SlowServerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalServer()
+        self.server.routes["/stall"] = stall
+        self.server.routes["/unavailable"] = lambda request: Reply(503)
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__)
+        self.transport = RequestsTransport()
+        self.addCleanup(self.transport.close)
+        self.deadline = Deadline(DEADLINE)
+
+    def assert_exceeded(self):
+        """Returns a context manager that checks that its block raises
+        `DeadlineExceededError` soon after the deadline.
+        """
+        test = self
+
+        class Context:
+            def __enter__(self):
+                self.cm = test.assertRaises(DeadlineExceededError)
+                return self.cm.__enter__()
+
+            def __exit__(self, *exc):
+                result = self.cm.__exit__(*exc)
+                test.assertLess(-test.deadline.remaining(), MARGIN)
+                return result
+        return Context()
+
+    def recaptcha(self, **kwargs) -> ReCaptcha:
+        patcher = mock.patch.object(recaptcha, "BASE_URL", self.server.url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        rc = ReCaptcha(
+            "test-api-key", "http://localhost", "test-user-agent",
+            make_requests=False, rc_version="test-version",
+            transport=self.transport, deadline=self.deadline, **kwargs,
+        )
+        return rc
+
+    def test_request_slow_body(self):
+        rc = self.recaptcha(retry=NO_RETRY)
+        with self.assertRaises(DeadlineExceededError):
+            rc.get("slow")
+
+    def test_request_stalled(self):
+        rc = self.recaptcha()
+        with self.assert_exceeded():
+            rc.get("stall")
+
+    def test_download_slow_body(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = HttpCache(tmpdir)
+            with self.assert_exceeded():
+                cache.download(
+                    self.transport, "slow", self.server.url + "slow",
+                    deadline=self.deadline,
+                )
+            # What was received is kept, so it can be resumed later.
+            size = os.path.getsize(os.path.join(tmpdir, "slow.part"))
+            self.assertGreater(size, 0)
+            self.assertLess(size, len(SLOW_BODY))
+
+    def test_script_stalled(self):
+        for cache in [None, HttpCache(self.tmpdir())]:
+            self.deadline = Deadline(DEADLINE)
+            with self.assert_exceeded():
+                load_javascript(
+                    self.server.url + "stall", "test-user-agent",
+                    self.transport, cache, deadline=self.deadline,
+                )
+
+    def test_script_retries(self):
+        """Retries don't wait past the deadline."""
+        retry = RetryPolicy(attempts=100, base_delay=0.2, max_delay=0.2)
+        for cache in [None, HttpCache(self.tmpdir())]:
+            self.deadline = Deadline(DEADLINE)
+            with self.assertRaises(requests.HTTPError):
+                load_javascript(
+                    self.server.url + "unavailable", "test-user-agent",
+                    self.transport, cache, retry=retry,
+                    deadline=self.deadline,
+                )
+            self.assertGreater(self.deadline.remaining(), 0)
+
+    def tmpdir(self) -> str:
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        return tmpdir.name
+
+
+class ReCaptchaDeadlineTest(unittest.TestCase):
+    def test_scripts(self):
+        """The deadline applies to the download of the scripts."""
+        deadline = Deadline(60)
+        with mock.patch.object(
+            recaptcha, "get_cached_rc_version", return_value="test-version",
+        ) as get_rc_version, mock.patch.object(
+            recaptcha, "get_js_strings", return_value=[],
+        ) as get_js_strings:
+            ReCaptcha(
+                "test-api-key", "http://localhost", "test-user-agent",
+                deadline=deadline,
+            ).transport.close()
+        for func in [get_rc_version, get_js_strings]:
+            self.assertIs(func.call_args[0][-1], deadline)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+# Copyright (C) 2021 taylor.fish <contact@taylor.fish>
+#
+# This file is part of librecaptcha.
+#
+# librecaptcha is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# librecaptcha is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with librecaptcha.  If not, see <https://www.gnu.org/licenses/>.
+
+from localserver import LocalServer
+from librecaptcha.errors import Http2ImportError
+from librecaptcha.transport import Http2Transport, RequestsTransport
+
+import unittest
+
+
+class CookieTests:
+    """Connections are reused, but cookies set by a response must not be
+    sent with later requests.
+    """
+    def make_transport(self):
+        raise NotImplementedError
+
+    def test_cookies_not_sent(self):
+        transport = self.make_transport()
+        try:
+            with LocalServer() as server:
+                for _ in range(2):
+                    r = transport.request("GET", server.url, timeout=5)
+                    self.assertIn("NID=", r.headers["Set-Cookie"])
+                with transport.stream("GET", server.url, timeout=5) as r:
+                    b"".join(r.chunks)
+        finally:
+            transport.close()
+        self.assertEqual(server.cookies, [None, None, None])
+
+
+class RequestsTransportTest(CookieTests, unittest.TestCase):
+    def make_transport(self):
+        return RequestsTransport()
+
+
+class Http2TransportTest(CookieTests, unittest.TestCase):
+    def make_transport(self):
+        try:
+            return Http2Transport()
+        except Http2ImportError:
+            self.skipTest("httpx[http2] isn't installed")
+
+
+if __name__ == "__main__":
+    unittest.main()